@@ -0,0 +1,326 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import time
+
+from cache import LRUCache
+from connection_pool import ConnectionPool
+
+
+@functools.lru_cache(maxsize=65_536)
+def normalize_title(title):
+    """
+    Canonical form of a movie title used for cache keys: case-folded with collapsed whitespace.
+
+    Memoized, since every recommendations request normalizes each title of the user's library.
+    """
+    return ' '.join(str(title).split()).casefold()
+
+
+def make_key(kind, *parts):
+    """
+    Builds a stable cache key from a response kind (e.g. 'recommendations') and its inputs.
+
+    Parameters:
+        kind (str): What the cached response is.
+        parts: JSON-serializable inputs that determine the response.
+
+    Returns:
+        str: A key of the form '<kind>:<sha256 of the inputs>'.
+    """
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return f'{kind}:{digest.hexdigest()}'
+
+
+def favorites_key(favorite_movies, model):
+    """
+    Cache key for recommendations, independent of the order, case and duplicates of the favorites.
+    """
+    return _favorites_key(tuple(favorite_movies), model)
+
+
+@functools.lru_cache(maxsize=128)
+def _favorites_key(favorite_movies, model):
+    titles = sorted({normalize_title(title) for title in favorite_movies})
+    digest = hashlib.sha256('\x1f'.join([model, *titles]).encode('utf-8'))
+    return f'recommendations:{digest.hexdigest()}'
+
+
+class AICache:
+    """
+    Two-tier cache for AI responses.
+
+    The first tier is an in-process LRU cache; the second is a SQLite file shared by every
+    gunicorn worker, so a response generated by one worker is a cache hit for all of them.
+    Entries expire after their TTL, but are kept for another `stale_ttl` seconds as a fallback
+    for when the upstream service is unavailable; the SQLite tier is pruned to `max_entries`.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, db_file='data/ai_cache.db', ttl=24 * 3600, max_entries=50_000,
+                 memory_bytes=8 * 1024 * 1024, pool_size=2, stale_ttl=7 * 24 * 3600):
+        """
+        Initializes the cache and creates its SQLite table if needed.
+
+        Parameters:
+            db_file (str): Path to the shared SQLite cache file.
+            ttl (float): Default lifetime of an entry in seconds.
+            max_entries (int): Maximum number of entries kept in the SQLite tier.
+            memory_bytes (int): Size budget of the in-process tier.
+            pool_size (int): Number of pooled connections to the cache file.
+            stale_ttl (float): How long expired entries are kept for `get(key, allow_stale=True)`.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.memory = LRUCache(max_bytes=memory_bytes)
+        self.pool = ConnectionPool(db_file, max_size=pool_size)
+        self._writes = 0
+        # The cache file is disposable, so it manages its own schema instead of using migrations
+        with self.pool.connection() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_cache_expires_at ON ai_cache (expires_at)')
+            # Favorites behind cached recommendations, and their LSH band keys, for near-duplicate lookups
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_favorites (
+                    key TEXT PRIMARY KEY,
+                    titles TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_favorites_bands (
+                    band TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (band, key)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ai_inflight (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+
+    def get(self, key, allow_stale=False):
+        """
+        Returns the cached value for `key`, or None if it is missing or expired.
+
+        With `allow_stale`, an expired value that has not been pruned yet is returned too.
+        """
+        entry = self.memory.get(key)
+        if entry is not None and (allow_stale or entry[1] > time.time()):
+            return entry[0]
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT value, expires_at FROM ai_cache WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading AI cache: {e}")
+            return None
+        if row is None or (row[1] <= time.time() and not allow_stale):
+            return None
+        value = json.loads(row[0])
+        self.memory.set(key, (value, row[1]))
+        return value
+
+    def get_many(self, keys):
+        """
+        Returns the cached values of several keys, reading those not in the memory tier in one query.
+
+        Parameters:
+            keys (iterable): The cache keys.
+
+        Returns:
+            dict: Values by key, for the keys that are cached and not expired.
+        """
+        now = time.time()
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            entry = self.memory.get(key)
+            if entry is not None and entry[1] > now:
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+        try:
+            with self.pool.connection() as conn:
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows = conn.execute(f'''
+                        SELECT key, value, expires_at FROM ai_cache
+                        WHERE key IN ({placeholders}) AND expires_at > ?
+                    ''', (*chunk, now)).fetchall()
+                    for key, value, expires_at in rows:
+                        found[key] = json.loads(value)
+                        self.memory.set(key, (found[key], expires_at))
+        except sqlite3.Error as e:
+            print(f"Error reading AI cache: {e}")
+        return found
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a JSON-serializable value in both tiers.
+
+        Parameters:
+            key (str): The cache key.
+            value: The response to cache.
+            ttl (float): Lifetime in seconds, defaulting to the cache's TTL.
+        """
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        self.memory.set(key, (value, expires_at))
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO ai_cache (key, value, created_at, expires_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', (key, json.dumps(value), now, expires_at))
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune(conn)
+        except sqlite3.Error as e:
+            print(f"Error writing AI cache: {e}")
+
+    def index_favorites(self, key, titles, bands, ttl=None):
+        """
+        Records the favorites a cached recommendations response was generated from.
+
+        Parameters:
+            key (str): The response's cache key.
+            titles (list): The normalized favorite titles.
+            bands (list): The LSH band keys of the titles' MinHash signature.
+            ttl (float): Lifetime in seconds, defaulting to the cache's TTL.
+        """
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO ai_favorites (key, titles, expires_at) VALUES (?, ?, ?)',
+                                 (key, json.dumps(titles, ensure_ascii=False), expires_at))
+                    conn.executemany('INSERT OR IGNORE INTO ai_favorites_bands (band, key) VALUES (?, ?)',
+                                     [(band, key) for band in bands])
+        except sqlite3.Error as e:
+            print(f"Error writing AI cache favorites: {e}")
+
+    def favorites_candidates(self, bands, limit=20):
+        """
+        Returns the indexed favorites sharing at least one LSH band key, most shared bands first.
+
+        Returns:
+            list: (key, titles) pairs of unexpired entries.
+        """
+        if not bands:
+            return []
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT f.key, f.titles FROM (
+                        SELECT key, COUNT(*) AS shared FROM ai_favorites_bands
+                        WHERE band IN ({', '.join('?' * len(bands))}) GROUP BY key
+                    ) AS b JOIN ai_favorites AS f ON f.key = b.key
+                    WHERE f.expires_at > ?
+                    ORDER BY b.shared DESC LIMIT ?
+                ''', (*bands, time.time(), limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading AI cache favorites: {e}")
+            return []
+        return [(key, json.loads(titles)) for key, titles in rows]
+
+    def acquire_lease(self, key, owner, seconds):
+        """
+        Tries to become the one process computing `key`.
+
+        A lease left behind by a crashed process is taken over once it expires.
+
+        Parameters:
+            key (str): The cache key being computed.
+            owner (str): A token identifying the caller.
+            seconds (float): How long the lease is valid.
+
+        Returns:
+            bool: True if the caller now holds the lease.
+        """
+        now = time.time()
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    cursor = conn.execute('''
+                        INSERT INTO ai_inflight (key, owner, expires_at) VALUES (?, ?, ?)
+                        ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                        WHERE ai_inflight.expires_at <= ?
+                    ''', (key, owner, now + seconds, now))
+                    return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            print(f"Error acquiring AI lease: {e}")
+            return True
+
+    def lease_active(self, key):
+        """
+        Returns True while some process holds an unexpired lease on `key`.
+        """
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT expires_at FROM ai_inflight WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading AI lease: {e}")
+            return False
+        return row is not None and row[0] > time.time()
+
+    def release_lease(self, key, owner):
+        """
+        Gives up a lease taken with `acquire_lease`.
+        """
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute('DELETE FROM ai_inflight WHERE key = ? AND owner = ?', (key, owner))
+        except sqlite3.Error as e:
+            print(f"Error releasing AI lease: {e}")
+
+    def _prune(self, conn):
+        with conn:
+            conn.execute('DELETE FROM ai_cache WHERE expires_at <= ?', (time.time() - self.stale_ttl,))
+            conn.execute('DELETE FROM ai_inflight WHERE expires_at <= ?', (time.time(),))
+            conn.execute('''
+                DELETE FROM ai_cache WHERE key IN (
+                    SELECT key FROM ai_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            conn.execute('''
+                DELETE FROM ai_favorites
+                WHERE expires_at <= ? OR NOT EXISTS (SELECT 1 FROM ai_cache WHERE ai_cache.key = ai_favorites.key)
+            ''', (time.time(),))
+            conn.execute('''
+                DELETE FROM ai_favorites_bands
+                WHERE NOT EXISTS (SELECT 1 FROM ai_favorites WHERE ai_favorites.key = ai_favorites_bands.key)
+            ''')
+
+    def stats(self):
+        """
+        Returns the in-process tier's counters and the size of the shared tier.
+        """
+        stats = {'memory': self.memory.stats()}
+        try:
+            with self.pool.connection() as conn:
+                stats['entries'] = conn.execute('SELECT COUNT(*) FROM ai_cache').fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error reading AI cache: {e}")
+        return stats
+
+    def close(self):
+        self.pool.close()
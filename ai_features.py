@@ -1,35 +1,449 @@
-import openai
+import asyncio
+import logging
 import os
-import requests
+import threading
+import time
 
-class AIFeatures:
-    def __init__(self):
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+import resilience
+from ai_cache import favorites_key, make_key, normalize_title
+from prompt_builder import PromptStats, estimate_tokens, select_favorites
+from rate_limit import RateLimitTimeout
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamUnavailable
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+MODEL = "gpt-3.5-turbo"
+YOUTUBE_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v="
+TRAILER_NOT_FOUND = "Trailer not found."
+# What write-time enrichment fetches for a newly added movie
+ENRICHMENT_KINDS = ('review', 'trivia', 'trailer')
+
+# Quota units a YouTube search costs, of the 10,000 a project gets per day by default
+YOUTUBE_SEARCH_COST = 100
+
+# Errors meaning OpenAI or YouTube failed or timed out, as opposed to rejecting the request;
+# they are retried and count towards opening the service's circuit breaker
+UPSTREAM_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+                   httpx.TransportError, httpx.HTTPStatusError)
+
+# (system prompt, user prompt template) for each kind of generated text
+PROMPTS = {
+    'recommendations': ("You are a movie recommendation assistant.",
+                        "Recommend movies based on the following favorites: {}"),
+    'review': ("You are a movie reviewer.", "Write a brief movie review for {}"),
+    'trivia': ("You are a movie trivia expert.", "Give me an interesting trivia about the movie {}"),
+}
+
+
+def cache_key(kind, subject):
+    """
+    Returns the AI cache key of a response.
+
+    Parameters:
+        kind (str): 'recommendations', 'review', 'trivia' or 'trailer'.
+        subject: The selected favorite titles for recommendations, otherwise a movie name.
+    """
+    if kind == 'recommendations':
+        return favorites_key(subject, MODEL)
+    if kind == 'trailer':
+        return make_key('trailer', normalize_title(subject))
+    return make_key(kind, MODEL, normalize_title(subject))
+
+
+def chat_messages(kind, subject):
+    """
+    Builds the chat messages asking for a response of the given kind.
+    """
+    system, template = PROMPTS[kind]
+    if kind == 'recommendations':
+        subject = ', '.join(subject)
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": template.format(subject)}
+    ]
+
+
+def prompt_tokens(messages):
+    """
+    Estimates the prompt tokens of chat messages, including a few per message for the chat format.
+    """
+    return sum(estimate_tokens(message['content']) + 4 for message in messages)
+
+
+def trailer_params(movie_name):
+    return {'part': 'snippet', 'q': f'{movie_name} trailer', 'type': 'video',
+            'key': os.getenv('YOUTUBE_API_KEY')}
+
+
+def trailer_url(data):
+    """
+    Extracts the first video of a YouTube search response as a watch URL.
+    """
+    if 'items' in data and len(data['items']) > 0:
+        video_id = data['items'][0]['id']['videoId']
+        return f"{YOUTUBE_WATCH_URL}{video_id}"
+    return TRAILER_NOT_FOUND
+
+
+def trailer_embed_url(url):
+    """
+    Returns the embeddable player URL of a trailer found by `get_movie_trailer`, or None if none was found.
+    """
+    if url is None or not url.startswith(YOUTUBE_WATCH_URL):
+        return None
+    return f"https://www.youtube.com/embed/{url[len(YOUTUBE_WATCH_URL):]}"
+
+
+def check_status(response):
+    """
+    Raises for YouTube error responses, so that they are never cached as "Trailer not found."
+
+    Rate limiting and server errors raise httpx.HTTPStatusError, which is retried; other errors,
+    such as 403 once the daily quota is used up, raise UpstreamUnavailable straight away.
+    """
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+    if response.is_error:
+        # The request URL is not included, since it carries the API key
+        raise UpstreamUnavailable(f"YouTube search failed with HTTP {response.status_code}")
+    return response
+
+
+def spend_search_quota(quota):
+    """
+    Takes a search's cost from the YouTube quota budget, raising UpstreamUnavailable if it is used up.
+    """
+    if quota is not None and not quota.spend(YOUTUBE_SEARCH_COST):
+        raise UpstreamUnavailable("YouTube quota budget for today is used up")
+
+
+def cached_recommendations(cache, similar, titles):
+    """
+    Returns the cached recommendations for exactly these favorites or, failing that, for
+    similar enough ones; or None. Both lookups read SQLite, so async callers run it in a thread.
+
+    Parameters:
+        cache (AICache): The AI response cache, or None.
+        similar (NearDuplicateCache): The near-duplicate cache, or None.
+        titles (list): The selected favorite titles.
+    """
+    if cache is None:
+        return None
+    cached = cache.get(cache_key('recommendations', titles))
+    if cached is None and similar is not None:
+        cached = similar.get(titles)
+    return cached
+
+
+def circuit_breakers(failure_threshold=5, reset_timeout=30.0):
+    """
+    Returns a circuit breaker for each upstream service, to share between AIFeatures and AsyncAIFeatures.
+    """
+    return {service: CircuitBreaker(service, failure_threshold, reset_timeout) for service in ('openai', 'youtube')}
+
+
+def http_timeout(timeout):
+    # Failing to connect at all should not take as long as a slow completion
+    return httpx.Timeout(timeout, connect=min(timeout, 5.0))
+
+
+def http_limits(max_connections):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                        keepalive_expiry=60.0)
+
+
+def usage_tokens(response):
+    """
+    Returns the tokens a chat completion used, or None if the response does not say.
+    """
+    return response.usage.total_tokens if response.usage is not None else None
+
+
+class AIClient:
+    """
+    Settings and call policy shared by AIFeatures and AsyncAIFeatures, which only differ in
+    whether their calls block or are awaited: what a chat request reserves from the rate limit
+    and gives back, when an expired response is served, and how long trailers are cached.
+    """
+
+    def __init__(self, cache=None, max_retries=2, prompt_token_budget=1500, similar=None, limiter=None,
+                 completion_tokens=500, deadline=10.0, breakers=None, trailer_ttl=30 * 24 * 3600,
+                 trailer_miss_ttl=6 * 3600, youtube_quota=None):
+        """
+        Parameters:
+            cache (AICache): Optional cache for generated responses shared by all workers.
+            max_retries (int): How many times a failed connection or API call is retried.
+            prompt_token_budget (int): Estimated tokens a recommendations prompt may spend on
+                favorite titles, or None to send the whole library.
+            similar (NearDuplicateCache): Optional cache of recommendations for similar favorites.
+            limiter (RateLimiter): Optional rate limit on OpenAI calls shared by all workers.
+            completion_tokens (int): Tokens reserved from the rate limit for each completion.
+            deadline (float): Seconds a call may take, retries and rate limit waits included,
+                before a stale cached response is served instead.
+            breakers (dict): Circuit breakers by service, from `circuit_breakers`; new ones by default.
+            trailer_ttl (float): Seconds a trailer found on YouTube stays cached.
+            trailer_miss_ttl (float): Seconds a "Trailer not found." result stays cached, since
+                a trailer may be uploaded later.
+            youtube_quota (DailyQuota): Optional YouTube quota budget shared by all workers.
+        """
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.cache = cache
+        self.similar = similar
+        self.limiter = limiter
+        self.completion_tokens = completion_tokens
+        self.deadline = deadline
+        self.breakers = breakers or circuit_breakers()
+        self.trailer_ttl = trailer_ttl
+        self.trailer_miss_ttl = trailer_miss_ttl
+        self.youtube_quota = youtube_quota
+        self.flight = SingleFlight(cache)
+        self.max_retries = max_retries
+        self.prompt_token_budget = prompt_token_budget
+        self.prompt_stats = PromptStats()
+        self._client = None
+
+    def _reservation(self, messages):
+        """
+        Returns the rate limit tokens to reserve for a chat request, or 0 without a rate limit.
+        """
+        if self.breakers['openai'].is_open:
+            # No point queueing for capacity that would not be used
+            raise CircuitOpenError("openai is unavailable")
+        if self.limiter is None:
+            return 0
+        return prompt_tokens(messages) + self.completion_tokens
+
+    def _settle(self, reserved, used):
+        """
+        Corrects the rate limit once a request's usage is known, if it is.
+        """
+        if self.limiter is not None and used is not None:
+            self.limiter.settle(reserved, used)
+
+    def _stale(self, key, error):
+        """
+        Returns the expired cached response for `key` in place of a fresh one that could not be
+        generated, or raises `error` if there is none.
+        """
+        stale = self.cache.get(key, allow_stale=True) if self.cache is not None else None
+        if stale is None:
+            raise error
+        logger.warning("Serving a stale response for %s: %s", key, error)
+        return stale
+
+    def _trailer_ttl(self, url):
+        return self.trailer_miss_ttl if url == TRAILER_NOT_FOUND else self.trailer_ttl
+
+    def favorites(self, favorite_movies):
+        """
+        Selects the favorites that go into a recommendations prompt, within the token budget.
+        """
+        return select_favorites(favorite_movies, self.prompt_token_budget)
+
+
+class AIFeatures(AIClient):
+    def __init__(self, cache=None, timeout=30.0, max_retries=2, max_connections=10, **options):
         """
         Initializes the AIFeatures class by setting up the OpenAI API key.
         The API key is retrieved from an environment variable 'OPENAI_API_KEY'.
+
+        OpenAI and YouTube requests share one pooled HTTP client, so connections are kept
+        alive and reused instead of being opened for every call.
+
+        Parameters:
+            timeout (float): Seconds to wait for a response before giving up.
+            max_connections (int): Size of the HTTP connection pool.
+            cache, max_retries, options: The settings shared with AsyncAIFeatures (see AIClient).
         """
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        openai.api_key = self.api_key
+        super().__init__(cache=cache, max_retries=max_retries, **options)
+        self.http = httpx.Client(
+            timeout=http_timeout(timeout),
+            transport=httpx.HTTPTransport(retries=self.max_retries, limits=http_limits(max_connections)),
+        )
+
+    @property
+    def client(self):
+        # Created on first use, because the OpenAI client refuses to start without an API key
+        if self._client is None:
+            # Retries are made by `_call`, within the call's deadline
+            self._client = OpenAI(api_key=self.api_key, max_retries=0, http_client=self.http)
+        return self._client
+
+    def _call(self, service, fn, deadline):
+        """
+        Calls `fn(timeout)` through the service's circuit breaker, retrying upstream errors
+        with jittered backoff until `deadline` (a time.monotonic() value).
+        """
+        return resilience.call(fn, self.breakers[service], deadline, self.max_retries, UPSTREAM_ERRORS)
+
+    def _acquire(self, messages, deadline):
+        """
+        Waits for rate limit capacity for a request, returning the tokens reserved for it.
+        """
+        reserved = self._reservation(messages)
+        if reserved:
+            try:
+                self.limiter.acquire(reserved, timeout=max(deadline - time.monotonic(), 0.0))
+            except RateLimitTimeout as e:
+                raise UpstreamUnavailable(str(e)) from e
+        return reserved
+
+    def _chat(self, kind, subject, deadline):
+        """
+        Sends a single-turn chat completion request, answered by `deadline` (a time.monotonic()
+        value), and returns the reply text.
+        """
+        messages = chat_messages(kind, subject)
+        reserved = self._acquire(messages, deadline)
+        response = self._call('openai', lambda timeout: self.client.chat.completions.create(
+            model=MODEL, messages=messages, timeout=timeout), deadline)
+        self._settle(reserved, usage_tokens(response))
+        return response.choices[0].message.content
+
+    def _chat_stream(self, kind, subject, deadline):
+        """
+        Sends a single-turn chat completion request and yields the reply text as it arrives.
+        """
+        messages = chat_messages(kind, subject)
+        reserved = self._acquire(messages, deadline)
+        stream = self._call('openai', lambda timeout: self.client.chat.completions.create(
+            model=MODEL, messages=messages, stream=True, timeout=timeout), deadline)
+        chunks = []
+        try:
+            with stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        chunks.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+        except UPSTREAM_ERRORS as e:
+            # Part of the text has been sent already, so the stream cannot be retried
+            self.breakers['openai'].record_failure()
+            raise UpstreamUnavailable(f"openai failed mid-stream: {e}") from e
+        # Streamed responses carry no usage, so the completion is estimated from its text
+        self._settle(reserved, prompt_tokens(messages) + estimate_tokens(''.join(chunks)))
+
+    def cached(self, kind, subject, allow_stale=False):
+        """
+        Returns a cached response without generating it, or None if it is not cached.
+
+        Parameters:
+            kind (str): 'recommendations', 'review', 'trivia' or 'trailer'.
+            subject: The user's movies for recommendations, otherwise a movie name.
+            allow_stale (bool): Whether an expired response will do, e.g. while OpenAI is unavailable.
+        """
+        if self.cache is None:
+            return None
+        if kind == 'recommendations':
+            titles = self.favorites(subject).titles
+            cached = cached_recommendations(self.cache, self.similar, titles)
+            if cached is None and allow_stale:
+                cached = self.cache.get(cache_key(kind, titles), allow_stale=True)
+            return cached
+        return self.cache.get(cache_key(kind, subject), allow_stale=allow_stale)
+
+    def _cached(self, key, fn, ttl=None):
+        """
+        Returns the cached response for `key`, or computes it with `fn(deadline)`.
+
+        Concurrent misses for the same key, in this worker or in other workers, are
+        coalesced into a single upstream call whose result they all share. If the upstream
+        service is unavailable, or the call is not done within the deadline, an expired
+        response is served instead.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        deadline = time.monotonic() + self.deadline
+        try:
+            return self.flight.do(key, lambda: fn(deadline), ttl=ttl, deadline=deadline)
+        except UpstreamUnavailable as e:
+            return self._stale(key, e)
 
     def get_movie_recommendations(self, favorite_movies):
         """
         Generates movie recommendations based on a list of favorite movies.
 
+        Large libraries are cut down to a representative selection that fits the prompt token
+        budget (see prompt_builder.select_favorites). Responses are cached under a hash of the
+        normalized, sorted selection, so repeat requests for an unchanged library are answered
+        without calling OpenAI; with a near-duplicate cache, so are requests whose selection is
+        similar enough to a cached one.
+
         Parameters:
-            favorite_movies (list): A list of strings representing the user's favorite movies.
+            favorite_movies (list): The user's Movie records, or a list of movie names.
 
         Returns:
             str: A text response with recommended movies based on the user's favorites.
+
+        Raises:
+            UpstreamUnavailable: If OpenAI could not answer in time and nothing, not even an
+                expired response, is cached.
         """
-        prompt = f"Recommend movies based on the following favorites: {', '.join(favorite_movies)}"
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a movie recommendation assistant."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response['choices'][0]['message']['content']
+        selection = self.favorites(favorite_movies)
+        cached = cached_recommendations(self.cache, self.similar, selection.titles)
+        if cached is not None:
+            return cached
+
+        deadline = time.monotonic() + self.deadline
+
+        def generate():
+            self.prompt_stats.record(selection)
+            return self._chat('recommendations', selection.titles, deadline)
+
+        key = cache_key('recommendations', selection.titles)
+        try:
+            recommendations = self.flight.do(key, generate, deadline=deadline)
+        except UpstreamUnavailable as e:
+            return self._stale(key, e)
+        if self.similar is not None:
+            self.similar.add(key, selection.titles)
+        return recommendations
+
+    def stream_movie_recommendations(self, favorite_movies):
+        """
+        Generates movie recommendations like `get_movie_recommendations`, yielding the text as it
+        is generated instead of waiting for the whole completion.
+
+        The finished text is cached, so later requests are answered from the cache in one chunk.
+
+        Parameters:
+            favorite_movies (list): The user's Movie records, or a list of movie names.
+
+        Yields:
+            str: Successive pieces of the recommendations text.
+        """
+        selection = self.favorites(favorite_movies)
+        cached = cached_recommendations(self.cache, self.similar, selection.titles)
+        if cached is not None:
+            yield cached
+            return
+
+        deadline = time.monotonic() + self.deadline
+
+        def generate():
+            self.prompt_stats.record(selection)
+            return self._chat_stream('recommendations', selection.titles, deadline)
+
+        key = cache_key('recommendations', selection.titles)
+        started = False
+        try:
+            for chunk in self.flight.stream(key, generate, deadline=deadline):
+                started = True
+                yield chunk
+        except UpstreamUnavailable as e:
+            if started:
+                raise
+            yield self._stale(key, e)
+            return
+        if self.similar is not None:
+            self.similar.add(key, selection.titles)
 
     def generate_movie_review(self, movie_name):
         """
@@ -41,15 +455,8 @@ class AIFeatures:
         Returns:
             str: A brief review of the specified movie.
         """
-        prompt = f"Write a brief movie review for {movie_name}"
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a movie reviewer."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response['choices'][0]['message']['content']
+        return self._cached(cache_key('review', movie_name),
+                            lambda deadline: self._chat('review', movie_name, deadline))
 
     def get_movie_trivia(self, movie_name):
         """
@@ -61,34 +468,266 @@ class AIFeatures:
         Returns:
             str: A trivia fact about the specified movie.
         """
-        prompt = f"Give me an interesting trivia about the movie {movie_name}"
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a movie trivia expert."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response['choices'][0]['message']['content']
+        return self._cached(cache_key('trivia', movie_name),
+                            lambda deadline: self._chat('trivia', movie_name, deadline))
 
     def get_movie_trailer(self, movie_name):
         """
         Fetches a YouTube link to the trailer of a specific movie using the YouTube Data API.
 
+        Each search costs 100 units of the daily YouTube quota, so results are cached per
+        normalized title: for `trailer_ttl` when a trailer was found, for `trailer_miss_ttl`
+        when it was not. Failed searches are not cached.
+
         Parameters:
             movie_name (str): The name of the movie to fetch the trailer for.
 
         Returns:
-            str: A URL of the movie's trailer on YouTube.
-        """
-        youtube_api_key = os.getenv('YOUTUBE_API_KEY')
-        search_url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&q={movie_name} trailer&type=video&key={youtube_api_key}"
-        response = requests.get(search_url)
-        data = response.json()
-
-        if 'items' in data and len(data['items']) > 0:
-            video_id = data['items'][0]['id']['videoId']
-            trailer_url = f"https://www.youtube.com/watch?v={video_id}"
-            return trailer_url
-        else:
-            return "Trailer not found."
+            str: A URL of the movie's trailer on YouTube, or "Trailer not found."
+        """
+        return self._cached(cache_key('trailer', movie_name),
+                            lambda deadline: self._search_trailer(movie_name, deadline), ttl=self._trailer_ttl)
+
+    def enrich_movie(self, movie_name, ttl=None):
+        """
+        Fetches and caches whichever of a movie's review, trivia and trailer are not cached yet,
+        so that the first time someone opens them is a cache hit.
+
+        Parameters:
+            movie_name (str): The name of the movie.
+            ttl (float): Cache lifetime of the review and trivia, defaulting to the cache's TTL;
+                the trailer keeps the trailer TTLs.
+
+        Returns:
+            list: The kinds that were fetched, empty if the movie was already enriched.
+        """
+        fetched = []
+        for kind in ENRICHMENT_KINDS:
+            if self.cached(kind, movie_name) is not None:
+                continue
+            if kind == 'trailer':
+                self.get_movie_trailer(movie_name)
+            else:
+                self._cached(cache_key(kind, movie_name),
+                             lambda deadline: self._chat(kind, movie_name, deadline), ttl=ttl)
+            fetched.append(kind)
+        return fetched
+
+    def _search_trailer(self, movie_name, deadline):
+        spend_search_quota(self.youtube_quota)
+        response = self._call('youtube', lambda timeout: check_status(self.http.get(
+            YOUTUBE_SEARCH_URL, params=trailer_params(movie_name), timeout=timeout)), deadline)
+        return trailer_url(response.json())
+
+    def close(self):
+        self.http.close()
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running in a daemon thread, for use from synchronous Flask views.
+
+    Async HTTP clients keep their pooled connections bound to the loop that opened them, so
+    they must live on one long-lived loop rather than a new loop per request. The loop is
+    started lazily, and again after a fork, since threads do not survive into gunicorn workers.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self.loop.run_forever, name='ai-event-loop', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+            return self.loop
+
+    @property
+    def running(self):
+        """
+        True if the loop has been started in this process.
+        """
+        return self._pid == os.getpid()
+
+    def run(self, coro, timeout=None):
+        """
+        Runs a coroutine on the loop and blocks until its result is available.
+
+        Parameters:
+            coro: The coroutine to run.
+            timeout (float): Seconds to wait before raising TimeoutError, or None to wait indefinitely.
+
+        Returns:
+            The coroutine's result.
+        """
+        return self.submit(coro).result(timeout)
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the loop without waiting for it.
+
+        Returns:
+            concurrent.futures.Future: Completes with the coroutine's result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_running())
+
+    def close(self):
+        with self._lock:
+            if self.running:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join()
+                self.loop.close()
+            self._pid = None
+
+
+class AsyncAIFeatures(AIClient):
+    """
+    Async variant of AIFeatures, for issuing several AI and YouTube calls concurrently.
+
+    Coroutines run on a background event loop; synchronous code calls `run` to await them
+    all at once, for example a review, trivia and trailer for the same movie:
+
+        review, trivia, trailer = async_ai.run(
+            async_ai.generate_movie_review(name),
+            async_ai.get_movie_trivia(name),
+            async_ai.get_movie_trailer(name),
+        )
+
+    It shares cache keys with AIFeatures, so either one can answer from the other's responses.
+    """
+
+    def __init__(self, cache=None, timeout=30.0, max_retries=2, max_connections=20, loop=None, **options):
+        """
+        Initializes the async client.
+
+        Parameters:
+            timeout (float): Seconds to wait for a response before giving up.
+            max_connections (int): Size of the HTTP connection pool.
+            loop (BackgroundLoop): The loop to run coroutines on; a new one by default.
+            cache, max_retries, options: The settings shared with AIFeatures (see AIClient).
+        """
+        super().__init__(cache=cache, max_retries=max_retries, **options)
+        self.loop = loop or BackgroundLoop()
+        self.http = httpx.AsyncClient(
+            timeout=http_timeout(timeout),
+            transport=httpx.AsyncHTTPTransport(retries=self.max_retries, limits=http_limits(max_connections)),
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=self.api_key, max_retries=0, http_client=self.http)
+        return self._client
+
+    def run(self, *coros, timeout=None):
+        """
+        Runs coroutines concurrently on the background loop.
+
+        Parameters:
+            coros: Coroutines such as `get_movie_trivia(name)`.
+            timeout (float): Seconds to wait for all of them, or None to wait indefinitely.
+
+        Returns:
+            list: Their results, in the order given.
+        """
+        async def gather():
+            return await asyncio.gather(*coros)
+
+        return self.loop.run(gather(), timeout=timeout)
+
+    async def _call(self, service, fn, deadline):
+        return await resilience.call_async(fn, self.breakers[service], deadline, self.max_retries, UPSTREAM_ERRORS)
+
+    async def _acquire(self, messages, deadline):
+        reserved = self._reservation(messages)
+        if reserved:
+            try:
+                await self.limiter.acquire_async(reserved, timeout=max(deadline - time.monotonic(), 0.0))
+            except RateLimitTimeout as e:
+                raise UpstreamUnavailable(str(e)) from e
+        return reserved
+
+    async def _chat(self, kind, subject, deadline):
+        messages = chat_messages(kind, subject)
+        reserved = await self._acquire(messages, deadline)
+        response = await self._call('openai', lambda timeout: self.client.chat.completions.create(
+            model=MODEL, messages=messages, timeout=timeout), deadline)
+        await asyncio.to_thread(self._settle, reserved, usage_tokens(response))
+        return response.choices[0].message.content
+
+    async def _cached(self, key, fn, ttl=None):
+        if self.cache is not None:
+            # SQLite calls run in a thread, so that they do not stall the other coroutines on the loop
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+        deadline = time.monotonic() + self.deadline
+        try:
+            return await self.flight.do_async(key, lambda: fn(deadline), ttl=ttl, deadline=deadline)
+        except UpstreamUnavailable as e:
+            return await asyncio.to_thread(self._stale, key, e)
+
+    async def get_movie_recommendations(self, favorite_movies):
+        """
+        Generates movie recommendations based on a list of favorite movies.
+        """
+        selection = self.favorites(favorite_movies)
+        # The lookups read SQLite, which would block every other coroutine on the loop
+        cached = await asyncio.to_thread(cached_recommendations, self.cache, self.similar, selection.titles)
+        if cached is not None:
+            return cached
+
+        deadline = time.monotonic() + self.deadline
+
+        def generate():
+            self.prompt_stats.record(selection)
+            return self._chat('recommendations', selection.titles, deadline)
+
+        key = cache_key('recommendations', selection.titles)
+        try:
+            recommendations = await self.flight.do_async(key, generate, deadline=deadline)
+        except UpstreamUnavailable as e:
+            return await asyncio.to_thread(self._stale, key, e)
+        if self.similar is not None:
+            await asyncio.to_thread(self.similar.add, key, selection.titles)
+        return recommendations
+
+    async def generate_movie_review(self, movie_name):
+        """
+        Generates a brief movie review based on the given movie name.
+        """
+        return await self._cached(cache_key('review', movie_name),
+                                  lambda deadline: self._chat('review', movie_name, deadline))
+
+    async def get_movie_trivia(self, movie_name):
+        """
+        Provides an interesting piece of trivia about a specific movie.
+        """
+        return await self._cached(cache_key('trivia', movie_name),
+                                  lambda deadline: self._chat('trivia', movie_name, deadline))
+
+    async def get_movie_trailer(self, movie_name):
+        """
+        Fetches a YouTube link to the trailer of a specific movie using the YouTube Data API.
+        """
+        return await self._cached(cache_key('trailer', movie_name),
+                                  lambda deadline: self._search_trailer(movie_name, deadline), ttl=self._trailer_ttl)
+
+    async def _search_trailer(self, movie_name, deadline):
+        async def search(timeout):
+            return check_status(await self.http.get(YOUTUBE_SEARCH_URL, params=trailer_params(movie_name),
+                                                    timeout=timeout))
+
+        await asyncio.to_thread(spend_search_quota, self.youtube_quota)
+        response = await self._call('youtube', search, deadline)
+        return trailer_url(response.json())
+
+    def close(self):
+        if self.loop.running:
+            self.loop.run(self.http.aclose())
+        self.loop.close()
@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recommender import PublishedModel, TitleLookup, library_matrix, top_k, write_model
+
+
+def confidence(ratings, alpha):
+    """
+    Implicit-feedback confidence that a user likes a title: owning it counts, liking it more so.
+    """
+    return alpha * np.asarray(ratings, dtype=np.float32) / 10.0
+
+
+def solve_rows(fixed, gram, indptr, indices, data, regularization, alpha):
+    """
+    One half-step of implicit ALS for a range of rows (users, or titles).
+
+    Each row's factors solve (F'F + F'(C - I)F + regularization * I) x = F'C p, where F are the
+    fixed factors of the row's entries, C their confidences and p = 1 (Hu, Koren and Volinsky).
+
+    Parameters:
+        fixed (ndarray): Factors of the other side, items x factors.
+        gram (ndarray): fixed.T @ fixed, shared by every row.
+        indptr, indices, data: CSR arrays of the rows being solved.
+        regularization (float): L2 penalty on the factors.
+        alpha (float): Confidence scale of the ratings.
+
+    Returns:
+        ndarray: The solved factors, rows x factors.
+    """
+    factors = gram.shape[0]
+    base = gram + regularization * np.eye(factors, dtype=np.float64)
+    solved = np.zeros((len(indptr) - 1, factors), dtype=np.float32)
+    for row in range(len(indptr) - 1):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        entries = np.asarray(fixed[indices[start:end]], dtype=np.float64)
+        weights = confidence(data[start:end], alpha)
+        a = base + (entries.T * weights) @ entries
+        b = entries.T @ (1.0 + weights)
+        solved[row] = np.linalg.solve(a, b)
+    return solved
+
+
+def _solve_chunk(args):
+    # Runs in a pool process: the fixed factors are memory-mapped rather than pickled
+    fixed_path, gram, indptr, indices, data, regularization, alpha = args
+    return solve_rows(np.load(fixed_path, mmap_mode='r'), gram, indptr, indices, data, regularization, alpha)
+
+
+def _half_step(executor, matrix, fixed, scratch, regularization, alpha, chunks):
+    fixed_path = os.path.join(scratch, 'fixed.npy')
+    np.save(fixed_path, fixed)
+    gram = fixed.T.astype(np.float64) @ fixed.astype(np.float64)
+    bounds = np.linspace(0, matrix.shape[0], chunks + 1, dtype=np.int64)
+    tasks = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        part = matrix[start:stop]
+        tasks.append((fixed_path, gram, part.indptr, part.indices, part.data, regularization, alpha))
+    return np.vstack(list(executor.map(_solve_chunk, tasks)))
+
+
+def train_als(data_manager, model_dir, factors=32, iterations=10, regularization=0.1, alpha=10.0,
+              workers=None, seed=0):
+    """
+    Trains latent factors on the libraries and their ratings, and publishes them as the 'als' model.
+
+    Users and titles are solved alternately; each half-step is split into chunks of rows that
+    a process pool solves in parallel, one per core.
+
+    Parameters:
+        data_manager (DataManager): Source of the movie libraries.
+        model_dir (str): Directory holding the recommender models.
+        factors (int): Size of the latent vectors.
+        iterations (int): Number of alternating passes.
+        regularization (float): L2 penalty on the factors.
+        alpha (float): Confidence scale: a 10/10 rating counts alpha times more than owning a title.
+        workers (int): Processes to train with, defaulting to the number of cores.
+        seed (int): Seed of the random initial factors.
+
+    Returns:
+        dict: The model's metadata: version, users, items, factors, iterations and seconds.
+    """
+    started = time.perf_counter()
+    by_user, titles = library_matrix(data_manager)
+    by_item = by_user.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.standard_normal((by_user.shape[0], factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((by_user.shape[1], factors)) * 0.01).astype(np.float32)
+
+    workers = workers or os.cpu_count() or 1
+    scratch = tempfile.mkdtemp(prefix='als-')
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in range(iterations):
+                user_factors = _half_step(executor, by_user, item_factors, scratch, regularization, alpha,
+                                          workers * 4)
+                item_factors = _half_step(executor, by_item, user_factors, scratch, regularization, alpha,
+                                          workers * 4)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    meta = {
+        'users': by_user.shape[0],
+        'items': len(titles),
+        'factors': factors,
+        'iterations': iterations,
+        'regularization': regularization,
+        'alpha': alpha,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    meta['version'] = write_model(model_dir, 'als', {
+        'user_factors': user_factors,
+        'item_factors': item_factors,
+        'item_gram': item_factors.T.astype(np.float64) @ item_factors.astype(np.float64),
+    }, {**meta, 'titles': titles})
+    return meta
+
+
+class FactorModel:
+    """
+    A loaded version of the ALS factors.
+    """
+
+    def __init__(self, arrays, meta):
+        self.item_factors = arrays['item_factors']
+        self.item_gram = np.asarray(arrays['item_gram'])
+        self.regularization = meta['regularization']
+        self.alpha = meta['alpha']
+        self.titles = TitleLookup(meta['titles'])
+
+    def user_vector(self, items, ratings):
+        """
+        Solves a user's factors from their current library against the trained title factors.
+
+        This is the same solve as a training half-step, so a library that has not changed
+        since training gets its trained vector back, and a changed one is reflected at once.
+        """
+        indptr = np.array([0, len(items)])
+        return solve_rows(self.item_factors, self.item_gram, indptr, items, ratings,
+                          self.regularization, self.alpha)[0]
+
+
+class ALSRecommender:
+    """
+    Serves recommendations from the ALS factors, locally and without network access.
+
+    The factors are trained offline by `flask train-recommender` and memory-mapped read-only,
+    so all gunicorn workers share one copy in the page cache.
+    """
+
+    def __init__(self, model_dir='data/recommender', check_interval=5.0):
+        """
+        Initializes the recommender. The factors are loaded on first use.
+
+        Parameters:
+            model_dir (str): Directory holding the recommender models.
+            check_interval (float): Seconds between checks for newly published factors.
+        """
+        self.model = PublishedModel(model_dir, 'als', FactorModel, check_interval)
+
+    def recommend(self, movies, k=10):
+        """
+        Recommends the titles whose factors best match a user's library.
+
+        Parameters:
+            movies (list): The user's Movie records, or movie names.
+            k (int): How many titles to recommend.
+
+        Returns:
+            list: Up to `k` (title, score) pairs, best first, excluding titles the user already
+            has; or None if no factors have been trained.
+        """
+        model = self.model.get()
+        if model is None:
+            return None
+        items, ratings = model.titles.items(movies)
+        if len(items) == 0:
+            return []
+        scores = model.item_factors @ model.user_vector(items, ratings)
+        return [(model.titles.titles[item], round(score, 4)) for item, score in top_k(scores, k, items)]
@@ -1,50 +1,183 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
+from ai_cache import AICache
+from cache import LRUCache
 from data_manager import DataManager
-from ai_features import AIFeatures
+from ai_features import ENRICHMENT_KINDS, AIFeatures, AsyncAIFeatures, cache_key, circuit_breakers, trailer_embed_url
+from jobs import DEAD, DONE, JobQueue
+from near_duplicates import NearDuplicateCache
+from rate_limit import DailyQuota, RateLimiter
+from resilience import UpstreamUnavailable
+from trailer_prefetch import TrailerPrefetcher
+from recommender import ItemRecommender, build_item_index, published_meta
+from als import ALSRecommender, train_als
+from migrations import LATEST_VERSION
+import bulk_import
+import click
+import csv
+import io
+import json
 from dotenv import load_dotenv
+import atexit
 import os
 import logging
+import time
 
 # Load environment variables from the .env file
 load_dotenv()
 
+# Config reads the environment, so it is imported once .env has been loaded
+from config import Config
+
 # Initialize the Flask app
 app = Flask(__name__)
-data_manager = DataManager()
-ai_features = AIFeatures()
+app.config.from_object(Config)
+data_manager = DataManager(
+    app.config['DATABASE_FILE'],
+    pool_size=app.config['DB_POOL_SIZE'],
+    cache=LRUCache(max_bytes=app.config['CACHE_MAX_BYTES'], ttl=app.config['CACHE_TTL']),
+)
+ai_cache = AICache(
+    app.config['AI_CACHE_DB'],
+    ttl=app.config['AI_CACHE_TTL'],
+    max_entries=app.config['AI_CACHE_MAX_ENTRIES'],
+    stale_ttl=app.config['AI_CACHE_STALE_TTL'],
+)
+similar_cache = NearDuplicateCache(ai_cache, threshold=app.config['AI_SIMILAR_THRESHOLD'])
+ai_limiter = RateLimiter(
+    app.config['AI_RATE_LIMIT_DB'],
+    requests_per_minute=app.config['AI_RATE_LIMIT_RPM'],
+    tokens_per_minute=app.config['AI_RATE_LIMIT_TPM'],
+) if app.config['AI_RATE_LIMIT_RPM'] > 0 else None
+youtube_quota = DailyQuota(
+    app.config['AI_RATE_LIMIT_DB'],
+    units_per_day=app.config['YOUTUBE_QUOTA_PER_DAY'],
+    background_share=app.config['YOUTUBE_PREFETCH_SHARE'],
+)
+ai_options = {
+    'timeout': app.config['AI_HTTP_TIMEOUT'],
+    'max_retries': app.config['AI_HTTP_RETRIES'],
+    'max_connections': app.config['AI_HTTP_MAX_CONNECTIONS'],
+    'prompt_token_budget': app.config['AI_PROMPT_TOKEN_BUDGET'],
+    'similar': similar_cache,
+    'limiter': ai_limiter,
+    'completion_tokens': app.config['AI_COMPLETION_TOKENS'],
+    'deadline': app.config['AI_DEADLINE'],
+    # Shared, so that failures seen by either client open the circuit for both
+    'breakers': circuit_breakers(app.config['AI_BREAKER_FAILURES'], app.config['AI_BREAKER_RESET']),
+    'trailer_ttl': app.config['AI_TRAILER_TTL'],
+    'trailer_miss_ttl': app.config['AI_TRAILER_MISS_TTL'],
+    'youtube_quota': youtube_quota,
+}
+ai_features = AIFeatures(cache=ai_cache, **ai_options)
+async_ai = AsyncAIFeatures(cache=ai_cache, **ai_options)
+# Without an API key every search would fail, so there is nothing to prefetch
+trailer_prefetcher = TrailerPrefetcher(
+    async_ai,
+    max_concurrency=app.config['TRAILER_PREFETCH_CONCURRENCY'],
+    max_titles=app.config['MAX_PAGE_SIZE'],
+) if app.config['TRAILER_PREFETCH_CONCURRENCY'] > 0 and os.getenv('YOUTUBE_API_KEY') else None
+item_recommender = ItemRecommender(app.config['RECOMMENDER_DIR'], data_manager=data_manager,
+                                   max_changes=app.config['RECOMMENDER_MAX_CHANGES'])
+als_recommender = ALSRecommender(app.config['RECOMMENDER_DIR'])
+local_recommenders = {'local': (item_recommender, 'build-recommender'), 'als': (als_recommender, 'train-recommender')}
+job_queue = JobQueue(app.config['JOBS_DB'], max_attempts=app.config['JOB_MAX_ATTEMPTS'])
+
+def enqueue_enrichment(movie):
+    """
+    Queues fetching a new movie's review, trivia and trailer for the job worker, unless they are all cached.
+    """
+    if all(ai_features.cached(kind, movie.name) is not None for kind in ENRICHMENT_KINDS):
+        return
+    job_queue.enqueue('enrich', {'movie_name': movie.name}, dedupe_key=cache_key('enrich', movie.name))
+
+# New movies are enriched by the job worker, so that the first view of them is a cache hit
+if app.config['ENRICH_NEW_MOVIES']:
+    data_manager.on_movie_added(enqueue_enrichment)
+
+# Close pooled database and HTTP connections when the worker shuts down
+atexit.register(data_manager.close)
+atexit.register(ai_cache.close)
+atexit.register(ai_features.close)
+atexit.register(async_ai.close)
+atexit.register(job_queue.close)
+atexit.register(youtube_quota.close)
+if ai_limiter is not None:
+    atexit.register(ai_limiter.close)
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and YouTube URLs carry the API key
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+# Schema changes are applied by `flask migrate-db`, not at worker boot
+schema_version = data_manager.schema_version()
+if schema_version < LATEST_VERSION:
+    logger.warning(f"Database schema is at version {schema_version}, latest is {LATEST_VERSION}. "
+                   f"Run `flask --app app migrate-db` to upgrade.")
 
 # Secret key for session and flash messages
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default_secret_key')
 
+@app.before_request
+def bind_db_connection():
+    """
+    Pins one pooled database connection to the current request, so that every
+    DataManager query made while handling it reuses the same connection.
+    """
+    data_manager.bind_connection()
+
+@app.teardown_request
+def release_db_connection(exc):
+    """
+    Returns the request's database connection to the pool.
+    """
+    data_manager.release_connection()
+
+def page_args():
+    """
+    Reads the `limit` and `after` keyset pagination parameters from the query string.
+
+    Returns:
+        tuple: (limit, after), with limit clamped to the configured maximum page size.
+    """
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after', None, type=int)
+    return limit, after
+
 @app.route('/')
 def index():
     """
-    Renders the homepage with a list of all users.
+    Renders the homepage with a page of users.
 
-    This function retrieves all users from the DataManager and passes them to the 'index.html' template for display.
+    This function retrieves one page of users from the DataManager and passes them to the 'index.html' template
+    for display, together with the cursor of the next page.
 
     Returns:
         A rendered HTML page displaying the list of users.
     """
+    limit, after = page_args()
     try:
-        users = data_manager.get_all_users()
-        return render_template('index.html', users=users)
+        users, next_cursor = data_manager.get_users_page(limit=limit, after=after)
+        summaries = data_manager.get_user_summaries(user.id for user in users)
+        return render_template('index.html', users=users, summaries=summaries, limit=limit, next_cursor=next_cursor)
     except Exception as e:
         logger.error(f"Error retrieving users: {e}")
         flash('An error occurred while loading users.', 'error')
-        return render_template('index.html', users=[])
+        return render_template('index.html', users=[], summaries={})
 
 @app.route('/user/<int:user_id>')
 def user_movies(user_id):
     """
     Displays the movies associated with a specific user.
 
-    This function retrieves the user by their ID, fetches all movies for that user, 
-    and renders the 'movie_details.html' template with the user's details and movie list.
+    This function retrieves the user by their ID, fetches one page of movies for that user
+    (see the `limit` and `after` query parameters), and renders the 'movie_details.html'
+    template with the user's details and movie list.
+
+    Trailers already resolved are embedded in the page; the others on the page are prefetched
+    in the background, so that the next view can embed them.
 
     Parameters:
         user_id (int): The ID of the user whose movies should be displayed.
@@ -52,15 +185,24 @@ def user_movies(user_id):
     Returns:
         A rendered HTML page displaying the user's details and their associated movies.
     """
-    user = next((u for u in data_manager.get_all_users() if u.id == user_id), None)
+    user = data_manager.get_user(user_id)
     if user is None:
         logger.warning(f"User with ID {user_id} not found.")
         flash(f"User with ID {user_id} not found.", 'error')
         return jsonify({'error': 'User not found', 'message': f'User with ID {user_id} not found.'}), 404
 
+    limit, after = page_args()
     try:
-        movies = data_manager.get_movies_by_user(user_id)
-        return render_template('movie_details.html', user=user, movies=movies)
+        movies, next_cursor = data_manager.get_movies_page(user_id, limit=limit, after=after)
+        stats = data_manager.get_user_stats(user_id)
+        trailers = {}
+        if trailer_prefetcher is not None:
+            keys = {movie.name: cache_key('trailer', movie.name) for movie in movies}
+            cached = ai_cache.get_many(keys.values())
+            trailers = {name: trailer_embed_url(cached.get(key)) for name, key in keys.items()}
+            trailer_prefetcher.prefetch([name for name, url in trailers.items() if url is None])
+        return render_template('movie_details.html', user=user, movies=movies, stats=stats,
+                               limit=limit, next_cursor=next_cursor, trailers=trailers)
     except Exception as e:
         logger.error(f"Error retrieving movies for user {user_id}: {e}")
         flash('An error occurred while loading movies.', 'error')
@@ -69,21 +211,87 @@ def user_movies(user_id):
 @app.route('/user/<int:user_id>/movies', methods=['GET'])
 def user_movies_json(user_id):
     """
-    Returns the list of movies for a specific user in JSON format.
+    Returns one page of movies for a specific user in JSON format.
+
+    The page size is set with `limit`; pass the returned `next_cursor` as `after`
+    to fetch the following page. `next_cursor` is null on the last page.
     """
-    user = next((u for u in data_manager.get_all_users() if u.id == user_id), None)
+    user = data_manager.get_user(user_id)
     if user is None:
         logger.warning(f"User with ID {user_id} not found.")
         return jsonify({'error': 'User not found', 'message': f'User with ID {user_id} not found.'}), 404
 
+    limit, after = page_args()
     try:
-        movies = data_manager.get_movies_by_user(user_id)
+        movies, next_cursor = data_manager.get_movies_page(user_id, limit=limit, after=after)
         movie_list = [{'name': movie.name, 'director': movie.director, 'year': movie.year, 'rating': movie.rating} for movie in movies]
-        return jsonify({'user_id': user_id, 'movies': movie_list})
+        return jsonify({'user_id': user_id, 'movies': movie_list, 'next_cursor': next_cursor})
     except Exception as e:
         logger.error(f"Error retrieving movies for user {user_id}: {e}")
         return jsonify({'error': 'An error occurred while loading movies.'}), 500
 
+@app.route('/user/<int:user_id>/stats', methods=['GET'])
+def user_stats(user_id):
+    """
+    Returns a user's library statistics in JSON format: movie count, average rating,
+    rating histogram and top directors.
+    """
+    user = data_manager.get_user(user_id)
+    if user is None:
+        logger.warning(f"User with ID {user_id} not found.")
+        return jsonify({'error': 'User not found', 'message': f'User with ID {user_id} not found.'}), 404
+
+    return jsonify({'user_id': user_id, **data_manager.get_user_stats(user_id)})
+
+EXPORT_FIELDS = ('id', 'name', 'director', 'year', 'rating')
+
+@app.route('/user/<int:user_id>/movies/export', methods=['GET'])
+def export_user_movies(user_id):
+    """
+    Streams a user's whole movie library as NDJSON (default) or CSV.
+
+    Rows are read in keyset batches and written out by a generator, so memory use stays
+    constant regardless of the library size, and a database connection is only held while
+    a batch is being read, not for the whole download.
+
+    Parameters:
+        user_id (int): The ID of the user whose movies should be exported.
+
+    Returns:
+        A streamed response with one movie per line, selected with `?format=ndjson|csv`.
+    """
+    user = data_manager.get_user(user_id)
+    if user is None:
+        logger.warning(f"User with ID {user_id} not found.")
+        return jsonify({'error': 'User not found', 'message': f'User with ID {user_id} not found.'}), 404
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Invalid input', 'message': 'Format must be ndjson or csv.'}), 400
+
+    def generate_ndjson():
+        for movies in data_manager.iter_movies_by_user(user_id):
+            yield ''.join(json.dumps({field: getattr(movie, field) for field in EXPORT_FIELDS}) + '\n'
+                          for movie in movies)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for movies in data_manager.iter_movies_by_user(user_id):
+            writer.writerows([getattr(movie, field) for field in EXPORT_FIELDS] for movie in movies)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    if fmt == 'csv':
+        response = Response(generate_csv(), mimetype='text/csv')
+    else:
+        response = Response(generate_ndjson(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename=user_{user_id}_movies.{fmt}'
+    return response
+
 @app.route('/add_movie/<int:user_id>', methods=['GET', 'POST'])
 def add_movie(user_id):
     """
@@ -100,7 +308,7 @@ def add_movie(user_id):
         - For GET requests: A rendered HTML page with a form for adding a movie.
         - For POST requests: A redirection to the 'user_movies' page for the user.
     """
-    user = next((u for u in data_manager.get_all_users() if u.id == user_id), None)
+    user = data_manager.get_user(user_id)
     if user is None:
         logger.warning(f"User with ID {user_id} not found.")
         return jsonify({'error': 'User not found', 'message': f'User with ID {user_id} not found.'}), 404
@@ -130,6 +338,26 @@ def add_movie(user_id):
 
     return render_template('add_movie.html', user_id=user_id)
 
+def fallback_recommendations(movies):
+    """
+    Recommendations to show while OpenAI is unavailable: an expired cached response if there is
+    one, otherwise titles from whichever local model has been built, otherwise None.
+    """
+    recommendations = ai_features.cached('recommendations', movies, allow_stale=True)
+    if recommendations is not None:
+        return recommendations
+    for recommender, command in local_recommenders.values():
+        recommendations = recommender.recommend(movies, k=app.config['RECOMMENDER_TOP_K'])
+        if recommendations is not None:
+            return [title for title, score in recommendations]
+    return None
+
+def enqueue_recommendations_job(user_id):
+    """
+    Queues the generation of a user's recommendations, or returns the id of the job already pending for them.
+    """
+    return job_queue.enqueue('recommendations', {'user_id': user_id}, dedupe_key=f'recommendations:user:{user_id}')
+
 @app.route('/recommendations/<int:user_id>')
 def recommendations(user_id):
     """
@@ -138,13 +366,22 @@ def recommendations(user_id):
     This function fetches all movies for the user and sends the list of movie names to the AI-powered recommendation
     system, which returns movie suggestions.
 
+    Unless the recommendations are cached, they are queued for the job worker and the page is
+    rendered right away, filling in the text from /recommendations/<user_id>/stream as the worker
+    generates it; web workers do not wait on OpenAI.
+
+    With ?backend=local (or RECOMMENDER_BACKEND = 'local'), titles are instead recommended from the
+    item-item index built by `flask build-recommender`, in memory and without calling OpenAI;
+    ?backend=als uses the latent factors trained by `flask train-recommender` the same way.
+    These, or an expired cached response, are also shown while OpenAI is unavailable.
+
     Parameters:
         user_id (int): The ID of the user for whom movie recommendations are generated.
 
     Returns:
         A rendered HTML page with the recommended movies based on the user's favorites.
     """
-    user = next((u for u in data_manager.get_all_users() if u.id == user_id), None)
+    user = data_manager.get_user(user_id)
     if user is None:
         logger.warning(f"User with ID {user_id} not found.")
         flash(f"User with ID {user_id} not found.", 'error')
@@ -152,20 +389,99 @@ def recommendations(user_id):
 
     try:
         movies = data_manager.get_movies_by_user(user_id)
-        movie_names = [movie.name for movie in movies]
-        recommendations = ai_features.get_movie_recommendations(movie_names)
+        backend = request.args.get('backend', app.config['RECOMMENDER_BACKEND'])
+        if backend in local_recommenders:
+            recommender, command = local_recommenders[backend]
+            recommendations = recommender.recommend(movies, k=app.config['RECOMMENDER_TOP_K'])
+            if recommendations is None:
+                flash(f'Local recommendations are not available until `flask {command}` has run.', 'error')
+                return redirect(url_for('user_movies', user_id=user_id))
+            recommendations = [title for title, score in recommendations]
+        else:
+            recommendations = ai_features.cached('recommendations', movies)
+            if recommendations is None and ai_features.breakers['openai'].is_open:
+                # Answer right away instead of queueing a call to a service that is failing
+                recommendations = fallback_recommendations(movies)
+                if recommendations is None:
+                    flash('Recommendations are temporarily unavailable. Please try again later.', 'error')
+                    return redirect(url_for('user_movies', user_id=user_id))
+            elif recommendations is None:
+                # Queued here too, so that the worker starts on it before the page opens its stream
+                enqueue_recommendations_job(user_id)
         return render_template('recommendations.html', user=user, recommendations=recommendations)
     except Exception as e:
         logger.error(f"Error generating recommendations for user {user_id}: {e}")
         flash('An error occurred while generating recommendations.', 'error')
         return redirect(url_for('user_movies', user_id=user_id))
 
+@app.route('/recommendations/<int:user_id>/stream')
+def stream_recommendations(user_id):
+    """
+    Streams movie recommendations for a user as Server-Sent Events while they are generated.
+
+    Cached recommendations are sent at once. Otherwise the recommendations job is queued (or the
+    one already pending is joined) and followed: each `message` event carries {"text": ...} with
+    the text the worker has generated so far, until a final `done` event, or an `error` event if
+    the job gives up. If OpenAI is unavailable, the fallback recommendations are sent instead.
+
+    The view only reads the job's progress, so the web worker does not wait on OpenAI. After
+    JOB_STREAM_TIMEOUT seconds the stream closes and the browser's EventSource reconnects,
+    picking the job up where it is.
+
+    Parameters:
+        user_id (int): The ID of the user for whom movie recommendations are generated.
+
+    Returns:
+        A text/event-stream response.
+    """
+    if data_manager.get_user(user_id) is None:
+        return jsonify({'error': 'User not found'}), 404
+    movies = data_manager.get_movies_by_user(user_id)
+    unavailable = 'Recommendations are temporarily unavailable. Please try again later.'
+
+    recommendations = ai_features.cached('recommendations', movies)
+    if recommendations is None and ai_features.breakers['openai'].is_open:
+        recommendations = fallback_recommendations(movies)
+        if recommendations is None:
+            return Response(f"event: error\ndata: {json.dumps({'message': unavailable})}\n\n",
+                            mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    if recommendations is not None:
+        text = recommendations if isinstance(recommendations, str) else '\n'.join(recommendations)
+        return Response(f"data: {json.dumps({'text': text})}\n\nevent: done\ndata: {{}}\n\n",
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    job_id = enqueue_recommendations_job(user_id)
+    timeout = app.config['JOB_STREAM_TIMEOUT']
+
+    def events():
+        sent = None
+        started = time.monotonic()
+        while True:
+            job = job_queue.get(job_id)
+            if job is None or job['status'] == DEAD:
+                yield f"event: error\ndata: {json.dumps({'message': unavailable})}\n\n"
+                return
+            text = job['result'] if job['status'] == DONE else job['progress']
+            if text is not None and text != sent:
+                yield f"data: {json.dumps({'text': text})}\n\n"
+                sent = text
+            if job['status'] == DONE:
+                yield "event: done\ndata: {}\n\n"
+                return
+            if time.monotonic() - started >= timeout:
+                return
+            time.sleep(0.25)
+
+    # X-Accel-Buffering stops nginx from holding back the events until the response ends
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/movie_trailer/<int:user_id>/<string:movie_name>')
 def movie_trailer(user_id, movie_name):
     """
     Fetches and displays a trailer for a specific movie using the YouTube Data API.
 
-    This function sends the movie name to the AI-powered YouTube API handler to retrieve a trailer link.
+    This function sends the movie name to the AI-powered YouTube API handler to retrieve a trailer link,
+    which is cached per title so that repeat views do not spend YouTube quota.
 
     Parameters:
         user_id (int): The ID of the user.
@@ -176,11 +492,205 @@ def movie_trailer(user_id, movie_name):
     """
     try:
         trailer_url = ai_features.get_movie_trailer(movie_name)
-        return render_template('movie_trailer.html', trailer_url=trailer_url, movie_name=movie_name)
+        return render_template('movie_trailer.html', user_id=user_id, movie_name=movie_name,
+                               trailer_url=trailer_url, embed_url=trailer_embed_url(trailer_url))
+    except UpstreamUnavailable as e:
+        logger.warning(f"YouTube unavailable for {movie_name}'s trailer: {e}")
+        flash('Trailers are temporarily unavailable. Please try again later.', 'error')
+        return redirect(url_for('user_movies', user_id=user_id))
     except Exception as e:
         logger.error(f"Error fetching trailer for {movie_name}: {e}")
         flash('An error occurred while fetching the movie trailer.', 'error')
         return redirect(url_for('user_movies', user_id=user_id))
 
+@app.route('/movie_info/<int:user_id>/<string:movie_name>')
+def movie_info(user_id, movie_name):
+    """
+    Returns a review, a piece of trivia and the trailer of a movie as JSON.
+
+    The three are fetched concurrently, so a cold request takes about as long as the slowest call.
+
+    Parameters:
+        user_id (int): The ID of the user.
+        movie_name (str): The name of the movie.
+
+    Returns:
+        A JSON object with review, trivia and trailer_url.
+    """
+    try:
+        review, trivia, trailer_url = async_ai.run(
+            async_ai.generate_movie_review(movie_name),
+            async_ai.get_movie_trivia(movie_name),
+            async_ai.get_movie_trailer(movie_name),
+        )
+    except UpstreamUnavailable as e:
+        logger.warning(f"Movie info for {movie_name} unavailable: {e}")
+        return jsonify({'error': 'Service unavailable', 'message': 'Movie info is temporarily unavailable.'}), 503
+    except Exception as e:
+        logger.error(f"Error fetching movie info for {movie_name}: {e}")
+        return jsonify({'error': 'An error occurred', 'message': 'An error occurred while fetching movie info.'}), 500
+    return jsonify({'movie_name': movie_name, 'review': review, 'trivia': trivia, 'trailer_url': trailer_url})
+
+@app.route('/search')
+def search():
+    """
+    Full-text searches movies (by name and director) and users (by name).
+
+    Movie results are ranked by relevance and paginated with `limit` and the opaque
+    `after` cursor; matching users are listed on the first page only. Add `format=json`
+    to get the results as JSON instead of HTML.
+
+    Returns:
+        A rendered HTML page, or JSON, with the matching users and movies.
+    """
+    query = request.args.get('query', '').strip()
+    limit, _ = page_args()
+    after = request.args.get('after') or None
+    try:
+        movies, next_cursor = data_manager.search_movies(query, limit=limit, after=after)
+        users = data_manager.search_users(query, limit=limit) if after is None else []
+    except Exception as e:
+        logger.error(f"Error searching for {query!r}: {e}")
+        movies, next_cursor, users = [], None, []
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'query': query,
+            'users': [{'id': user.id, 'name': user.name} for user in users],
+            'movies': [{'id': movie.id, 'name': movie.name, 'director': movie.director, 'year': movie.year,
+                        'rating': movie.rating, 'user_id': movie.user_id} for movie in movies],
+            'next_cursor': next_cursor,
+        })
+    return render_template('search_results.html', query=query, users=users, movies=movies,
+                           limit=limit, next_cursor=next_cursor)
+
+def job_accepted(job_id):
+    status_url = url_for('job_status', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+
+@app.route('/jobs/recommendations/<int:user_id>', methods=['POST'])
+def enqueue_recommendations(user_id):
+    """
+    Queues the generation of movie recommendations for a user and returns the job's id at once.
+
+    The job is run by `python -m deploy.worker`; poll the returned status_url for its result.
+
+    Parameters:
+        user_id (int): The ID of the user for whom movie recommendations are generated.
+
+    Returns:
+        202 with job_id and status_url, or 404 if the user does not exist.
+    """
+    if data_manager.get_user(user_id) is None:
+        return jsonify({'error': 'User not found'}), 404
+    return job_accepted(enqueue_recommendations_job(user_id))
+
+@app.route('/jobs/<any(review, trivia):kind>/<string:movie_name>', methods=['POST'])
+def enqueue_movie_job(kind, movie_name):
+    """
+    Queues the generation of a review or a piece of trivia for a movie and returns the job's id at once.
+
+    Parameters:
+        kind (str): 'review' or 'trivia'.
+        movie_name (str): The name of the movie.
+
+    Returns:
+        202 with job_id and status_url.
+    """
+    job_id = job_queue.enqueue(kind, {'movie_name': movie_name}, dedupe_key=cache_key(kind, movie_name))
+    return job_accepted(job_id)
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Returns a queued job's status: queued, running, done (with its result) or dead (with its last error).
+
+    Parameters:
+        job_id (int): The ID returned when the job was queued.
+
+    Returns:
+        A JSON object describing the job, or 404 if it does not exist.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/cache/stats')
+def cache_stats():
+    """
+    Returns the hit/miss counters of this worker's DataManager and AI response caches in JSON format,
+    along with the prompt tokens sent for recommendations and those saved by selecting favorites,
+    the near-duplicate recommendations cache's hit rates by similarity threshold, and how long
+    OpenAI calls waited for rate limit capacity, by priority.
+    """
+    return jsonify({'data_manager': data_manager.cache.stats(), 'ai': ai_cache.stats(),
+                    'ai_prompts': ai_features.prompt_stats.stats(), 'ai_similar': similar_cache.stats(),
+                    'ai_rate_limit': ai_limiter.stats() if ai_limiter is not None else None,
+                    'ai_breakers': {name: breaker.stats() for name, breaker in ai_features.breakers.items()},
+                    'youtube_quota': youtube_quota.stats(),
+                    'trailer_prefetch': trailer_prefetcher.stats() if trailer_prefetcher is not None else None})
+
+@app.cli.command('migrate-db')
+def migrate_db():
+    """
+    Applies pending schema migrations to the configured database.
+    """
+    applied = data_manager.migrate()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    print(f"Database schema is at version {data_manager.schema_version()}.")
+
+@app.cli.command('import-movies')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(bulk_import.FORMATS),
+              help='Input format. Defaults to the file extension.')
+@click.option('--user-id', type=int, help='Owner for rows without a user_id column.')
+@click.option('--chunk-size', default=10_000, show_default=True, help='Rows per transaction.')
+@click.option('--defer-indexes/--no-defer-indexes', default=None,
+              help='Drop movie indexes during the load and rebuild them after. '
+                   f'Defaults to deferring for {bulk_import.DEFER_INDEXES_MIN_ROWS:,} rows or more.')
+def import_movies(path, fmt, user_id, chunk_size, defer_indexes):
+    """
+    Bulk-imports movies from a CSV or JSON Lines file.
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as stream:
+        stats = bulk_import.import_movies(data_manager, stream, fmt=fmt, user_id=user_id,
+                                          chunk_size=chunk_size, defer_indexes=defer_indexes)
+    for error in stats.errors:
+        click.echo(error, err=True)
+    print(stats)
+    # A deferred import does not log its movies as changes, so the item index is rebuilt instead
+    if stats.deferred_indexes and stats.inserted and published_meta(app.config['RECOMMENDER_DIR'], 'items') is not None:
+        job_id = job_queue.enqueue('build-recommender', {}, dedupe_key='build-recommender', max_attempts=1)
+        print(f"Queued a rebuild of the item index as job {job_id}.")
+
+@app.cli.command('build-recommender')
+@click.option('--neighbors', default=50, show_default=True, help='Similar titles kept per title.')
+@click.option('--min-common', default=1, show_default=True, help='Users two titles must share to count as similar.')
+def build_recommender(neighbors, min_common):
+    """
+    Builds the item-item similarity index used by the local recommendations backend.
+    """
+    meta = build_item_index(data_manager, app.config['RECOMMENDER_DIR'], neighbors=neighbors,
+                            min_common=min_common)
+    print(f"Built item index {meta['version']}: {meta['items']} titles, {meta['users']} users, "
+          f"{meta['pairs']} similar pairs in {meta['seconds']}s.")
+
+@app.cli.command('train-recommender')
+@click.option('--factors', default=32, show_default=True, help='Size of the latent vectors.')
+@click.option('--iterations', default=10, show_default=True, help='Alternating least squares passes.')
+@click.option('--regularization', default=0.1, show_default=True, help='L2 penalty on the factors.')
+@click.option('--workers', type=int, help='Training processes. Defaults to the number of cores.')
+def train_recommender(factors, iterations, regularization, workers):
+    """
+    Trains the latent factors used by the als recommendations backend.
+    """
+    meta = train_als(data_manager, app.config['RECOMMENDER_DIR'], factors=factors, iterations=iterations,
+                     regularization=regularization, workers=workers)
+    print(f"Trained factors {meta['version']}: {meta['items']} titles, {meta['users']} users, "
+          f"{meta['factors']} factors in {meta['seconds']}s.")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
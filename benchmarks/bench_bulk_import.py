@@ -0,0 +1,70 @@
+"""
+Benchmark: bulk import throughput with the movie indexes and triggers kept or deferred.
+
+Imports CSV files of several sizes into a database that already holds movies, once with
+the search, user statistics and change log triggers firing on every row and once with them
+dropped for the load and rebuilt at the end. Deferring costs a rebuild over the whole
+table, so it only pays off for large imports; bulk_import.DEFER_INDEXES_MIN_ROWS is set
+from where the two lines cross.
+
+Usage:
+    python -m benchmarks.bench_bulk_import
+"""
+import io
+import os
+import random
+import sqlite3
+import tempfile
+
+import bulk_import
+from data_manager import DataManager
+
+EXISTING_MOVIES = 200_000
+IMPORT_SIZES = (5_000, 20_000, 50_000, 200_000)
+USERS = 1_000
+
+
+def populate(db_file):
+    with sqlite3.connect(db_file) as conn:
+        conn.executemany('INSERT INTO users (name) VALUES (?)', ((f'user{i}',) for i in range(USERS)))
+        conn.executemany('INSERT INTO movies (name, director, year, rating, user_id) VALUES (?, ?, ?, ?, ?)',
+                         (row for _, row in movies(EXISTING_MOVIES)))
+
+
+def movies(count):
+    for i in range(count):
+        yield i, (f'Movie {i}', f'Director {i % 5_000}', 1950 + i % 70, round(random.uniform(0, 10), 1),
+                  random.randint(1, USERS))
+
+
+def csv_file(count):
+    lines = ['name,director,year,rating,user_id']
+    lines.extend(','.join(map(str, row)) for _, row in movies(count))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    print(f"{EXISTING_MOVIES:,} movies already loaded")
+    print(f"{'rows':>8}  {'triggers':>12}  {'deferred':>12}")
+    for size in IMPORT_SIZES:
+        data = csv_file(size)
+        rates = []
+        for defer_indexes in (False, True):
+            fd, db_file = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            try:
+                data_manager = DataManager(db_file)
+                data_manager.migrate()
+                populate(db_file)
+                stats = bulk_import.import_movies(data_manager, io.StringIO(data), defer_indexes=defer_indexes)
+                rates.append(stats.rows_per_second)
+                data_manager.close()
+            finally:
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(db_file + suffix):
+                        os.remove(db_file + suffix)
+        print(f"{size:>8,}  {rates[0]:>8,.0f} r/s  {rates[1]:>8,.0f} r/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: memory and throughput of loading movie rows into Python records.
+
+Compares the previous representation (a plain class with a per-instance __dict__,
+built from fetched tuples in a list comprehension) with the tuple-backed Movie
+record that the DataManager now builds directly in its sqlite3 row factory.
+
+Usage:
+    python -m benchmarks.bench_row_records [rows]
+"""
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import migrations
+from data_manager import MOVIE_COLUMNS, movie_row
+
+DEFAULT_ROWS = 1_000_000
+
+
+class DictMovie:
+    def __init__(self, id, name, director, year, rating, user_id):
+        self.id = id
+        self.name = name
+        self.director = director
+        self.year = year
+        self.rating = rating
+        self.user_id = user_id
+
+
+def load_dict_objects(conn):
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {MOVIE_COLUMNS} FROM movies')
+    movies = cursor.fetchall()
+    return [DictMovie(id=movie[0], name=movie[1], director=movie[2], year=movie[3], rating=movie[4], user_id=movie[5]) for movie in movies]
+
+
+def load_records(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = movie_row
+    cursor.execute(f'SELECT {MOVIE_COLUMNS} FROM movies')
+    return cursor.fetchall()
+
+
+def populate(conn, rows):
+    migrations.upgrade(conn)
+    with conn:
+        conn.executemany(
+            'INSERT INTO movies (name, director, year, rating, user_id) VALUES (?, ?, ?, ?, ?)',
+            ((f'Movie {i}', f'Director {i % 5000}', 1950 + i % 70, (i % 100) / 10, 1 + i % 1000) for i in range(rows)),
+        )
+
+
+def measure(load, conn):
+    gc.collect()
+    start = time.perf_counter()
+    movies = load(conn)
+    seconds = time.perf_counter() - start
+    del movies
+    gc.collect()
+
+    tracemalloc.start()
+    movies = load(conn)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del movies
+    return seconds, retained
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    fd, db_file = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(db_file)
+        populate(conn, rows)
+        print(f"{rows:,} movies")
+        print(f"{'representation':<22} {'load time':>10} {'rows/s':>12} {'retained':>12}")
+        for label, load in (('__dict__ objects', load_dict_objects), ('tuple records', load_records)):
+            seconds, retained = measure(load, conn)
+            print(f"{label:<22} {seconds:>9.2f}s {rows / seconds:>12,.0f} {retained / 2**20:>10.1f}MiB")
+        conn.close()
+    finally:
+        os.remove(db_file)
+
+
+if __name__ == '__main__':
+    main()
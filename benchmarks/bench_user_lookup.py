@@ -0,0 +1,64 @@
+"""
+Benchmark: cost of resolving the user for a request as the user count grows.
+
+Compares `DataManager.get_user` (primary key lookup) with the linear scan the routes
+used to do over `get_all_users()`, and times `users_exist` checking a bulk import chunk's
+worth of IDs at once. The per-ID cost of both primary key lookups should stay flat.
+
+Usage:
+    python -m benchmarks.bench_user_lookup
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from data_manager import DataManager
+
+USER_COUNTS = (1_000, 10_000, 100_000)
+LOOKUPS = 200
+# User IDs checked per users_exist call, as for one chunk of a bulk import
+BATCH = 500
+
+
+def populate(db_file, count):
+    with sqlite3.connect(db_file) as conn:
+        conn.executemany('INSERT INTO users (name) VALUES (?)', ((f'user{i}',) for i in range(count)))
+    return count
+
+
+def time_per_call(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) / len(args)
+
+
+def main():
+    print(f"{'users':>8}  {'get_user':>12}  {'scan':>12}  {'users_exist':>12}")
+    for count in USER_COUNTS:
+        fd, db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            data_manager = DataManager(db_file)
+            data_manager.migrate()
+            populate(db_file, count)
+            data_manager.bind_connection()
+            ids = [random.randint(1, count) for _ in range(LOOKUPS)]
+
+            get_user = time_per_call(data_manager.get_user, ids)
+            scan = time_per_call(
+                lambda user_id: next((u for u in data_manager.get_all_users() if u.id == user_id), None),
+                ids[:20],
+            )
+            batches = [[random.randint(1, count) for _ in range(BATCH)] for _ in range(20)]
+            users_exist = time_per_call(data_manager.users_exist, batches) / BATCH
+            print(f"{count:>8}  {get_user * 1e6:>10.1f}us  {scan * 1e6:>10.1f}us  {users_exist * 1e6:>10.1f}us")
+            data_manager.close()
+        finally:
+            os.remove(db_file)
+
+
+if __name__ == '__main__':
+    main()
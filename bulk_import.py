@@ -0,0 +1,183 @@
+import csv
+import json
+import time
+from itertools import chain, islice
+
+FORMATS = ('csv', 'jsonl')
+
+# Valid rows from which an import defers the movie indexes and triggers unless told otherwise
+# (see benchmarks/bench_bulk_import.py): below it, rebuilding them over the whole table costs
+# more than maintaining them row by row
+DEFER_INDEXES_MIN_ROWS = 50_000
+
+
+class ImportStats:
+    """
+    Counters reported by `import_movies`.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+        self.seconds = 0.0
+        self.user_ids = set()
+        self.deferred_indexes = False
+
+    @property
+    def rows_per_second(self):
+        return self.inserted / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"Imported {self.inserted} movies ({self.rejected} rejected) in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+
+FIELDS = ('name', 'director', 'year', 'rating', 'user_id')
+
+
+def read_rows(stream, fmt):
+    """
+    Streams raw movie fields from a CSV (with a header row) or JSON Lines file.
+
+    Parameters:
+        stream: A text file object.
+        fmt (str): Either 'csv' or 'jsonl'.
+
+    Yields:
+        tuple: (line_number, fields) where fields holds the raw name, director, year, rating
+        and user_id values (None when missing), or is None for an unparseable line.
+    """
+    if fmt == 'csv':
+        reader = csv.reader(stream)
+        header = [field.strip().lower() for field in next(reader, [])]
+        positions = [header.index(field) if field in header else None for field in FIELDS]
+        width = max((p for p in positions if p is not None), default=-1) + 1
+        for line_number, values in enumerate(reader, start=2):
+            if not values:
+                continue
+            if len(values) < width:
+                yield line_number, None
+                continue
+            yield line_number, tuple(None if p is None else values[p] for p in positions)
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                yield line_number, tuple(record.get(field) for field in FIELDS)
+            else:
+                yield line_number, None
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def validate_row(fields, default_user_id=None):
+    """
+    Converts raw fields into a row for the movies table.
+
+    Parameters:
+        fields (tuple): Raw (name, director, year, rating, user_id) values, as yielded by `read_rows`.
+        default_user_id (int): The owner used when the record has no user_id.
+
+    Returns:
+        tuple: (name, director, year, rating, user_id).
+
+    Raises:
+        ValueError: If the record is malformed or a field is out of range.
+    """
+    if fields is None:
+        raise ValueError("not a valid record")
+    name, director, year, rating, user_id = fields
+    name = name.strip() if isinstance(name, str) else name
+    if not name or not isinstance(name, str):
+        raise ValueError("name is required")
+    director = director.strip() or None if isinstance(director, str) else director
+    try:
+        year = int(year) if year not in (None, '') else None
+        rating = float(rating) if rating not in (None, '') else None
+        user_id = int(user_id) if user_id not in (None, '') else default_user_id
+    except (TypeError, ValueError):
+        raise ValueError("year, rating and user_id must be numbers")
+    if user_id is None:
+        raise ValueError("user_id is required")
+    if rating is not None and not 0 <= rating <= 10:
+        raise ValueError("rating must be between 0 and 10")
+    return name, director, year, rating, user_id
+
+
+def import_movies(data_manager, stream, fmt='csv', user_id=None, chunk_size=10_000, defer_indexes=None,
+                  defer_min_rows=DEFER_INDEXES_MIN_ROWS):
+    """
+    Bulk-loads movies from a CSV or JSON Lines stream.
+
+    Records are validated as they stream in, grouped into chunks of `chunk_size`, and each
+    chunk is inserted with one `executemany` in its own transaction, so memory stays bounded
+    and a failure only loses the current chunk. Rows for unknown users are rejected.
+
+    Parameters:
+        data_manager (DataManager): The data manager to insert through.
+        stream: A text file object to read from.
+        fmt (str): Either 'csv' or 'jsonl'.
+        user_id (int): The owner for records without a user_id column.
+        chunk_size (int): The number of rows per transaction.
+        defer_indexes (bool): Drop the movie indexes and triggers during the load and rebuild
+            them at the end (see DataManager.deferred_movie_indexes). By default they are
+            deferred if the input has at least `defer_min_rows` valid rows; otherwise the
+            triggers update search, user statistics and the change log on every insert, which
+            is several times slower per row.
+        defer_min_rows (int): The threshold used when `defer_indexes` is None. Up to this many
+            rows are read ahead to decide.
+
+    Returns:
+        ImportStats: Counts, timing and throughput of the import.
+    """
+    stats = ImportStats()
+    start = time.perf_counter()
+
+    def reject(line_number, error):
+        stats.rejected += 1
+        if len(stats.errors) < 100:
+            stats.errors.append(f"line {line_number}: {error}")
+
+    def valid_rows():
+        for line_number, record in read_rows(stream, fmt):
+            try:
+                yield line_number, validate_row(record, user_id)
+            except ValueError as e:
+                reject(line_number, e)
+
+    def load(rows):
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            known_users = data_manager.users_exist({row[4] for _, row in chunk})
+            movies = []
+            for line_number, row in chunk:
+                if row[4] in known_users:
+                    movies.append(row)
+                else:
+                    reject(line_number, f"unknown user {row[4]}")
+            if movies:
+                stats.inserted += data_manager.add_movies(movies)
+                stats.user_ids.update(known_users)
+
+    rows = valid_rows()
+    if defer_indexes is None:
+        ahead = list(islice(rows, defer_min_rows))
+        defer_indexes = len(ahead) >= defer_min_rows
+        rows = chain(ahead, rows)
+    stats.deferred_indexes = defer_indexes
+    if defer_indexes:
+        with data_manager.deferred_movie_indexes():
+            load(rows)
+    else:
+        load(rows)
+
+    stats.seconds = time.perf_counter() - start
+    return stats
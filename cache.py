@@ -0,0 +1,150 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Containers larger than this are sized from a sample of their items
+SIZE_SAMPLE = 64
+
+
+def estimate_size(obj, _depth=0):
+    """
+    Roughly estimates the memory footprint of `obj` in bytes, including what it references.
+
+    Lists and tuples of records are extrapolated from a sample of their items, so sizing
+    a large movie list costs the same as sizing a small one.
+    """
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        items = list(obj) if isinstance(obj, (set, frozenset)) else obj
+        if not items:
+            return size
+        sample = items[:SIZE_SAMPLE]
+        sampled = sum(estimate_size(item, _depth + 1) for item in sample)
+        return size + sampled * len(items) // len(sample)
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in obj.items())
+    if hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), _depth + 1)
+    for slot in getattr(type(obj), '__slots__', ()):
+        size += estimate_size(getattr(obj, slot, None), _depth + 1)
+    return size
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache bounded by the estimated size of its values.
+
+    Entries can carry tags (for example the user they belong to), so that a write can
+    invalidate exactly the entries it affects. An optional TTL bounds how stale an entry
+    can get when it is changed by another process that cannot invalidate this cache.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=None):
+        """
+        Initializes an empty cache.
+
+        Parameters:
+            max_bytes (int): The total estimated size of cached values to stay under.
+            ttl (float): Seconds after which an entry expires, or None to keep entries until evicted.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for `key`, or `default` on a miss or an expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None or entry[2] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, tags=()):
+        """
+        Stores `value` under `key`, evicting least recently used entries to stay within `max_bytes`.
+
+        Parameters:
+            key: A hashable cache key.
+            value: The value to cache.
+            tags (iterable): Tags that `invalidate` can later use to drop this entry.
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires, tags)
+            self.size += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        """
+        Drops every entry carrying any of the given tags.
+        """
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        _, size, _, tags = self._entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        """
+        Returns the cache's counters.
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, invalidations, entries and bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+            }
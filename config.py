@@ -5,3 +5,51 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///data/moviweb.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    DATABASE_FILE = os.getenv('DATABASE_FILE', 'data/moviewebapp.db')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    CACHE_TTL = float(os.getenv('CACHE_TTL', '30'))
+    AI_CACHE_DB = os.getenv('AI_CACHE_DB', 'data/ai_cache.db')
+    AI_CACHE_TTL = float(os.getenv('AI_CACHE_TTL', str(24 * 3600)))
+    AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '50000'))
+    AI_HTTP_TIMEOUT = float(os.getenv('AI_HTTP_TIMEOUT', '30'))
+    AI_HTTP_RETRIES = int(os.getenv('AI_HTTP_RETRIES', '2'))
+    AI_HTTP_MAX_CONNECTIONS = int(os.getenv('AI_HTTP_MAX_CONNECTIONS', '20'))
+    AI_PROMPT_TOKEN_BUDGET = int(os.getenv('AI_PROMPT_TOKEN_BUDGET', '1500'))
+    AI_SIMILAR_THRESHOLD = float(os.getenv('AI_SIMILAR_THRESHOLD', '0.8'))
+    AI_RATE_LIMIT_DB = os.getenv('AI_RATE_LIMIT_DB', 'data/ai_rate_limit.db')
+    # Requests and tokens per minute allowed across all workers; 0 requests disables the limit
+    AI_RATE_LIMIT_RPM = float(os.getenv('AI_RATE_LIMIT_RPM', '3500'))
+    AI_RATE_LIMIT_TPM = float(os.getenv('AI_RATE_LIMIT_TPM', '90000'))
+    AI_COMPLETION_TOKENS = int(os.getenv('AI_COMPLETION_TOKENS', '500'))
+    # Seconds an AI or YouTube call may take, retries included, before falling back
+    AI_DEADLINE = float(os.getenv('AI_DEADLINE', '10'))
+    AI_BREAKER_FAILURES = int(os.getenv('AI_BREAKER_FAILURES', '5'))
+    AI_BREAKER_RESET = float(os.getenv('AI_BREAKER_RESET', '30'))
+    # How long expired AI responses are kept to serve while OpenAI or YouTube is down
+    AI_CACHE_STALE_TTL = float(os.getenv('AI_CACHE_STALE_TTL', str(7 * 24 * 3600)))
+    # Trailers found on YouTube are cached for long; misses are retried sooner
+    AI_TRAILER_TTL = float(os.getenv('AI_TRAILER_TTL', str(30 * 24 * 3600)))
+    AI_TRAILER_MISS_TTL = float(os.getenv('AI_TRAILER_MISS_TTL', str(6 * 3600)))
+    # YouTube quota units per day shared by all workers, and the fraction trailer prefetching may spend
+    YOUTUBE_QUOTA_PER_DAY = int(os.getenv('YOUTUBE_QUOTA_PER_DAY', '10000'))
+    YOUTUBE_PREFETCH_SHARE = float(os.getenv('YOUTUBE_PREFETCH_SHARE', '0.8'))
+    # Trailer searches in flight at once while prefetching a library; 0 disables prefetching
+    TRAILER_PREFETCH_CONCURRENCY = int(os.getenv('TRAILER_PREFETCH_CONCURRENCY', '4'))
+    # Queue fetching the review, trivia and trailer of each movie as it is added
+    ENRICH_NEW_MOVIES = os.getenv('ENRICH_NEW_MOVIES', '1') == '1'
+    # Enriched reviews and trivia do not go out of date, so they are kept longer than on-demand responses
+    AI_ENRICHMENT_TTL = float(os.getenv('AI_ENRICHMENT_TTL', str(30 * 24 * 3600)))
+    JOBS_DB = os.getenv('JOBS_DB', 'data/jobs.db')
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+    # Seconds a recommendations stream follows its job before closing, for the browser to reconnect
+    JOB_STREAM_TIMEOUT = float(os.getenv('JOB_STREAM_TIMEOUT', '30'))
+    RECOMMENDER_DIR = os.getenv('RECOMMENDER_DIR', 'data/recommender')
+    RECOMMENDER_BACKEND = os.getenv('RECOMMENDER_BACKEND', 'openai')
+    RECOMMENDER_TOP_K = int(os.getenv('RECOMMENDER_TOP_K', '10'))
+    RECOMMENDER_REBUILD_INTERVAL = float(os.getenv('RECOMMENDER_REBUILD_INTERVAL', str(6 * 3600)))
+    RECOMMENDER_MAX_CHANGES = int(os.getenv('RECOMMENDER_MAX_CHANGES', '10000'))
@@ -0,0 +1,143 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class PoolClosedError(sqlite3.Error):
+    """Raised when a connection is requested from a pool that has been closed."""
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of SQLite connections.
+
+    Connections are created lazily up to `max_size` and handed back to the pool when
+    released, so they keep their compiled statement cache between requests instead of
+    re-opening the database file and re-parsing the schema on every query.
+    """
+
+    def __init__(self, db_file, max_size=5, timeout=5.0, cached_statements=256):
+        """
+        Initializes the pool.
+
+        Parameters:
+            db_file (str): Path to the SQLite database file.
+            max_size (int): The maximum number of open connections.
+            timeout (float): Seconds to wait for a free connection (and for SQLite locks).
+            cached_statements (int): Size of each connection's prepared statement cache.
+        """
+        self.db_file = db_file
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+
+    def _connect(self):
+        return sqlite3.connect(
+            self.db_file,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._size -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """
+        Checks a connection out of the pool.
+
+        An idle connection is reused when available, a new one is opened while the pool
+        is below `max_size`, and otherwise the call waits up to `timeout` seconds.
+
+        Returns:
+            sqlite3.Connection: A healthy connection that must be given back with `release`.
+        """
+        while True:
+            if self._closed:
+                raise PoolClosedError("Connection pool is closed")
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        create = False
+                if create:
+                    try:
+                        return self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._size -= 1
+                        raise
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        f"Timed out waiting for a database connection ({self.max_size} in use)"
+                    )
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool, rolling back any transaction left open.
+
+        Parameters:
+            conn (sqlite3.Connection): A connection previously returned by `acquire`.
+        """
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that checks out a connection and always releases it.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """
+        Closes every idle connection and rejects further checkouts.
+
+        Connections still checked out are closed when they are released.
+        """
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
@@ -1,54 +1,153 @@
+import re
 import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 
+import migrations
+from connection_pool import ConnectionPool
 
-class User:
-    def __init__(self, id, name):
-        self.id = id
-        self.name = name
 
+USER_COLUMNS = 'id, name'
+MOVIE_COLUMNS = 'id, name, director, year, rating, user_id'
 
-class Movie:
-    def __init__(self, id, name, director, year, rating, user_id):
-        self.id = id
-        self.name = name
-        self.director = director
-        self.year = year
-        self.rating = rating
-        self.user_id = user_id
+
+class User(namedtuple('User', USER_COLUMNS)):
+    """A row of the users table, stored as a compact tuple without a per-instance __dict__."""
+    __slots__ = ()
+
+
+class Movie(namedtuple('Movie', MOVIE_COLUMNS)):
+    """A row of the movies table, stored as a compact tuple without a per-instance __dict__."""
+    __slots__ = ()
+
+
+def user_row(cursor, row):
+    """sqlite3 row factory building a User directly from a fetched row."""
+    return tuple.__new__(User, row)
+
+
+def movie_row(cursor, row):
+    """sqlite3 row factory building a Movie directly from a fetched row."""
+    return tuple.__new__(Movie, row)
+
+
+def fts_query(text):
+    """
+    Turns free text into a safe FTS5 query that prefix-matches every word.
+
+    Parameters:
+        text (str): The user's search input.
+
+    Returns:
+        str: An FTS5 MATCH expression, or an empty string if the input has no words.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
 
 
 class DataManager:
-    def __init__(self):
-        self.db_file = 'data/moviewebapp.db'
-        self.create_tables()
+    def __init__(self, db_file='data/moviewebapp.db', pool_size=5, cache=None):
+        """
+        Initializes the DataManager with a pool of connections to the SQLite database.
 
-    def create_tables(self):
-        try:
-            with sqlite3.connect(self.db_file) as conn:
-                cursor = conn.cursor()
+        Parameters:
+            db_file (str): Path to the SQLite database file.
+            pool_size (int): The maximum number of pooled connections.
+            cache (LRUCache): Optional read-through cache for users and movie lists.
+        """
+        self.db_file = db_file
+        self.pool = ConnectionPool(db_file, max_size=pool_size)
+        self.cache = cache
+        self._local = threading.local()
+        self._movie_listeners = []
 
-                # Create Users table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT NOT NULL
-                    )
-                ''')
+    def on_movie_added(self, listener):
+        """
+        Registers a function called with the new Movie after each successful `add_movie`.
 
-                # Create Movies table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS movies (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        director TEXT,
-                        year INTEGER,
-                        rating REAL,
-                        user_id INTEGER,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
-                ''')
-        except sqlite3.Error as e:
-            print(f"Error creating tables: {e}")
+        Listeners run in the caller's thread once the insert is committed, so they should only
+        hand work off, e.g. by queueing a job. Their errors are reported, not raised.
+        """
+        self._movie_listeners.append(listener)
+        return listener
+
+    def bind_connection(self):
+        """
+        Checks a connection out of the pool and pins it to the current thread.
+
+        Until `release_connection` is called, every DataManager method running on this
+        thread reuses the same connection, so a whole request is served by one connection.
+        """
+        if getattr(self._local, 'conn', None) is None:
+            self._local.conn = self.pool.acquire()
+
+    def release_connection(self):
+        """
+        Returns the connection pinned by `bind_connection` to the pool.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            self.pool.release(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields the thread's bound connection, or a pooled one for the duration of the block.
+
+        The block runs as a transaction: it is committed on success and rolled back on error.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with conn:
+                yield conn
+            return
+
+        with self.pool.connection() as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        """
+        Closes all pooled connections. Called on worker shutdown.
+        """
+        self.release_connection()
+        self.pool.close()
+
+    def _cache_get(self, key):
+        return self.cache.get(key) if self.cache is not None else None
+
+    def _cache_set(self, key, value, *tags):
+        if self.cache is not None:
+            self.cache.set(key, value, tags)
+
+    def _invalidate(self, *tags):
+        if self.cache is not None:
+            self.cache.invalidate(*tags)
+
+    def migrate(self):
+        """
+        Brings the database schema up to date by applying any pending migrations.
+
+        This is run once per deployment from the `flask migrate-db` command rather than
+        on every worker start.
+
+        Returns:
+            list: The migration versions that were applied.
+        """
+        with self.pool.connection() as conn:
+            return migrations.upgrade(conn)
+
+    def schema_version(self):
+        """
+        Returns the schema version the database is currently at.
+        """
+        try:
+            with self.connection() as conn:
+                return migrations.current_version(conn)
+        except sqlite3.Error as e:
+            print(f"Error reading schema version: {e}")
+            return 0
 
     def add_user(self, name):
         """
@@ -61,64 +160,535 @@ class DataManager:
             None
         """
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO users (name)
                     VALUES (?)
                 ''', (name,))
+            self._invalidate('users')
         except sqlite3.Error as e:
             print(f"Error adding user: {e}")
 
     def get_all_users(self):
+        cached = self._cache_get(('all_users',))
+        if cached is not None:
+            return list(cached)
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users')
+                cursor.row_factory = user_row
+                cursor.execute(f'SELECT {USER_COLUMNS} FROM users')
                 users = cursor.fetchall()
-            return [User(id=user[0], name=user[1]) for user in users]
         except sqlite3.Error as e:
             print(f"Error retrieving users: {e}")
             return []
+        self._cache_set(('all_users',), users, 'users')
+        return list(users)
+
+    def get_users_page(self, limit=50, after=None):
+        """
+        Returns one page of users ordered by ID, using keyset pagination.
+
+        Parameters:
+            limit (int): The maximum number of users to return.
+            after (int): The cursor returned with the previous page, or None for the first page.
+
+        Returns:
+            tuple: (users, next_cursor), where next_cursor is None on the last page.
+        """
+        key = ('users_page', limit, after)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached[0]), cached[1]
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = user_row
+                cursor.execute(f'SELECT {USER_COLUMNS} FROM users WHERE id > ? ORDER BY id LIMIT ?',
+                               (after or 0, limit + 1))
+                users = cursor.fetchall()
+            next_cursor = users[limit - 1].id if len(users) > limit else None
+            del users[limit:]
+        except sqlite3.Error as e:
+            print(f"Error retrieving users: {e}")
+            return [], None
+        self._cache_set(key, (users, next_cursor), 'users')
+        return list(users), next_cursor
+
+    def get_user(self, user_id):
+        """
+        Looks up a single user by primary key.
+
+        Parameters:
+            user_id (int): The ID of the user.
+
+        Returns:
+            User: The matching user, or None if no such user exists.
+        """
+        key = ('user', user_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = user_row
+                cursor.execute(f'SELECT {USER_COLUMNS} FROM users WHERE id = ?', (user_id,))
+                user = cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"Error retrieving user {user_id}: {e}")
+            return None
+        if user is None:
+            return None
+        self._cache_set(key, user, 'users')
+        return user
+
+    def users_exist(self, user_ids):
+        """
+        Checks which of the given user IDs exist, using primary key lookups only.
+
+        Meant for checking many IDs in one go, such as the owners of a bulk import chunk;
+        routes only ever resolve the one user in their URL, with `get_user`.
+
+        Parameters:
+            user_ids (iterable): The user IDs to check.
+
+        Returns:
+            set: The subset of `user_ids` that belong to existing users.
+        """
+        user_ids = list(set(user_ids))
+        found = set()
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(user_ids), 500):
+                    chunk = user_ids[start:start + 500]
+                    placeholders = ', '.join('?' * len(chunk))
+                    cursor.execute(f'SELECT id FROM users WHERE id IN ({placeholders})', chunk)
+                    found.update(row[0] for row in cursor.fetchall())
+            return found
+        except sqlite3.Error as e:
+            print(f"Error checking users: {e}")
+            return set()
 
     def get_movies_by_user(self, user_id):
+        key = ('movies', user_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached)
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = movie_row
+                cursor.execute(f'SELECT {MOVIE_COLUMNS} FROM movies WHERE user_id = ?', (user_id,))
+                movies = cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error retrieving movies for user {user_id}: {e}")
+            return []
+        self._cache_set(key, movies, ('movies', user_id))
+        return list(movies)
+
+    def get_movies_page(self, user_id, limit=50, after=None):
+        """
+        Returns one page of a user's movies ordered by ID, using keyset pagination.
+
+        The page is located with an index search on (user_id, id) rather than OFFSET,
+        so deep pages cost the same as the first one.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            limit (int): The maximum number of movies to return.
+            after (int): The cursor returned with the previous page, or None for the first page.
+
+        Returns:
+            tuple: (movies, next_cursor), where next_cursor is None on the last page.
+        """
+        key = ('movies_page', user_id, limit, after)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return list(cached[0]), cached[1]
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM movies WHERE user_id = ?', (user_id,))
+                cursor.row_factory = movie_row
+                cursor.execute(f'''
+                    SELECT {MOVIE_COLUMNS} FROM movies
+                    WHERE user_id = ? AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (user_id, after or 0, limit + 1))
                 movies = cursor.fetchall()
-            return [Movie(id=movie[0], name=movie[1], director=movie[2], year=movie[3], rating=movie[4], user_id=movie[5]) for movie in movies]
+            next_cursor = movies[limit - 1].id if len(movies) > limit else None
+            del movies[limit:]
         except sqlite3.Error as e:
             print(f"Error retrieving movies for user {user_id}: {e}")
+            return [], None
+        self._cache_set(key, (movies, next_cursor), ('movies', user_id))
+        return list(movies), next_cursor
+
+    def iter_movies_by_user(self, user_id, batch_size=1000):
+        """
+        Streams a user's movies in ID order without loading the whole library into memory.
+
+        Each batch is read with keyset pagination on a pooled connection (not the request's bound
+        one) that is returned before the batch is yielded, so a slow download does not hold a
+        connection and the generator can outlive the request that created it.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            batch_size (int): The number of rows fetched from SQLite at a time.
+
+        Yields:
+            list: Batches of Movie objects.
+        """
+        after = 0
+        while True:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = movie_row
+                cursor.execute(f'''
+                    SELECT {MOVIE_COLUMNS} FROM movies
+                    WHERE user_id = ? AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (user_id, after, batch_size))
+                movies = cursor.fetchall()
+            if movies:
+                yield movies
+            if len(movies) < batch_size:
+                return
+            after = movies[-1].id
+
+    def iter_library(self, batch_size=10_000):
+        """
+        Streams the (user_id, name, rating) of every movie, for building recommender models.
+
+        The generator holds its own pooled connection (not the request's bound one) until it is
+        exhausted or closed; it runs in the job worker, not while a download is being served.
+
+        Parameters:
+            batch_size (int): The number of rows fetched from SQLite at a time.
+
+        Yields:
+            list: Batches of (user_id, name, rating) tuples.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id, name, rating FROM movies')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    def latest_movie_change(self):
+        """
+        Returns the id of the latest entry in the library change log, or 0 if it is empty.
+        """
+        try:
+            with self.connection() as conn:
+                return conn.execute('SELECT COALESCE(MAX(id), 0) FROM movie_changes').fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error reading the movie change log: {e}")
+            return 0
+
+    def get_library_changes(self, after, limit=10_000):
+        """
+        Reads the library changes logged after `after`, with the current libraries of the users involved.
+
+        Both are read in one transaction, so the libraries reflect exactly the changes returned.
+
+        Parameters:
+            after (int): Id of the last change already seen.
+            limit (int): Maximum number of changes to read.
+
+        Returns:
+            tuple: (list of (id, user_id, name, delta) tuples, where delta is 1 when the title
+            entered the library and -1 when it left; dict of user_id -> list of movie names).
+            If more than `limit` changes are pending, (None, {}) is returned instead.
+        """
+        try:
+            with self.connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute('BEGIN')
+                changes = conn.execute('''
+                    SELECT id, user_id, name, delta FROM movie_changes WHERE id > ? ORDER BY id LIMIT ?
+                ''', (after, limit + 1)).fetchall()
+                if len(changes) > limit:
+                    return None, {}
+                libraries = {}
+                for user_id in {change[1] for change in changes}:
+                    rows = conn.execute('SELECT name FROM movies WHERE user_id = ?', (user_id,)).fetchall()
+                    libraries[user_id] = [row[0] for row in rows]
+                return changes, libraries
+        except sqlite3.Error as e:
+            print(f"Error reading library changes: {e}")
+            return [], {}
+
+    def prune_movie_changes(self, through):
+        """
+        Deletes the change log entries up to and including id `through`.
+        """
+        try:
+            with self.connection() as conn:
+                conn.execute('DELETE FROM movie_changes WHERE id <= ?', (through,))
+        except sqlite3.Error as e:
+            print(f"Error pruning the movie change log: {e}")
+
+    def get_user_stats(self, user_id, top_directors=5):
+        """
+        Returns a user's library statistics, kept up to date by triggers on the movies table.
+
+        Reading them costs a few primary key lookups, whatever the size of the library.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            top_directors (int): How many of the user's most frequent directors to include.
+
+        Returns:
+            dict: movie_count, average_rating, rating_histogram (bucket 0-10 -> count) and
+            top_directors (a list of {'director', 'movie_count'}).
+        """
+        stats = {
+            'movie_count': 0,
+            'average_rating': None,
+            'rating_histogram': {bucket: 0 for bucket in range(11)},
+            'top_directors': [],
+        }
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT movie_count, rated_count, rating_sum FROM user_stats WHERE user_id = ?',
+                               (user_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return stats
+                stats['movie_count'] = row[0]
+                stats['average_rating'] = round(row[2] / row[1], 2) if row[1] else None
+                cursor.execute('SELECT bucket, movie_count FROM user_rating_histogram WHERE user_id = ?',
+                               (user_id,))
+                stats['rating_histogram'].update(cursor.fetchall())
+                cursor.execute('''
+                    SELECT director, movie_count FROM user_director_counts
+                    WHERE user_id = ?
+                    ORDER BY movie_count DESC
+                    LIMIT ?
+                ''', (user_id, top_directors))
+                stats['top_directors'] = [{'director': director, 'movie_count': count}
+                                          for director, count in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Error retrieving stats for user {user_id}: {e}")
+        return stats
+
+    def get_user_summaries(self, user_ids):
+        """
+        Returns the movie count and average rating of several users in one query.
+
+        Parameters:
+            user_ids (iterable): The IDs of the users.
+
+        Returns:
+            dict: user_id -> {'movie_count', 'average_rating'}, for users with at least one movie.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ', '.join('?' * len(user_ids))
+                cursor.execute(f'''
+                    SELECT user_id, movie_count, rated_count, rating_sum FROM user_stats
+                    WHERE user_id IN ({placeholders})
+                ''', user_ids)
+                return {user_id: {'movie_count': count,
+                                  'average_rating': round(total / rated, 2) if rated else None}
+                        for user_id, count, rated, total in cursor.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Error retrieving user summaries: {e}")
+            return {}
+
+    def search_movies(self, query, limit=20, after=None):
+        """
+        Full-text searches movie names and directors, best matches first.
+
+        Results are paginated with a (rank, id) keyset cursor, so later pages are found
+        by seeking past the last result instead of skipping rows.
+
+        Parameters:
+            query (str): The free-text search input.
+            limit (int): The maximum number of movies to return.
+            after (str): The cursor returned with the previous page, or None for the first page.
+
+        Returns:
+            tuple: (movies, next_cursor), where next_cursor is None on the last page.
+        """
+        match = fts_query(query)
+        if not match:
+            return [], None
+        try:
+            rank, last_id = (float(after.split(':')[0]), int(after.split(':')[1])) if after else (None, None)
+        except (ValueError, IndexError):
+            rank, last_id = None, None
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT {', '.join('m.' + column for column in MOVIE_COLUMNS.split(', '))}, f.rank
+                    FROM movies_fts AS f
+                    JOIN movies AS m ON m.id = f.rowid
+                    WHERE movies_fts MATCH ?
+                      AND (? IS NULL OR f.rank > ? OR (f.rank = ? AND f.rowid > ?))
+                    ORDER BY f.rank, f.rowid
+                    LIMIT ?
+                ''', (match, rank, rank, rank, last_id, limit + 1))
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching movies for {query!r}: {e}")
+            return [], None
+        next_cursor = f'{rows[limit - 1][-1]!r}:{rows[limit - 1][0]}' if len(rows) > limit else None
+        return [tuple.__new__(Movie, row[:-1]) for row in rows[:limit]], next_cursor
+
+    def search_users(self, query, limit=20):
+        """
+        Full-text searches user names, best matches first.
+
+        Parameters:
+            query (str): The free-text search input.
+            limit (int): The maximum number of users to return.
+
+        Returns:
+            list: The matching User records.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = user_row
+                cursor.execute(f'''
+                    SELECT {', '.join('u.' + column for column in USER_COLUMNS.split(', '))}
+                    FROM users_fts AS f
+                    JOIN users AS u ON u.id = f.rowid
+                    WHERE users_fts MATCH ?
+                    ORDER BY f.rank
+                    LIMIT ?
+                ''', (match, limit))
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching users for {query!r}: {e}")
             return []
 
     def add_movie(self, name, director, year, rating, user_id):
+        """
+        Adds a movie to a user's library and notifies the `on_movie_added` listeners.
+
+        Returns:
+            Movie: The new movie, or None if it could not be added.
+        """
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO movies (name, director, year, rating, user_id)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (name, director, year, rating, user_id))
+                movie = Movie(cursor.lastrowid, name, director, year, rating, user_id)
+            self._invalidate(('movies', user_id))
         except sqlite3.Error as e:
             print(f"Error adding movie: {e}")
+            return None
+        for listener in self._movie_listeners:
+            try:
+                listener(movie)
+            except Exception as e:
+                print(f"Error notifying movie listener: {e}")
+        return movie
+
+    def add_movies(self, movies):
+        """
+        Inserts many movies with a single prepared statement in one transaction.
+
+        Parameters:
+            movies (list): Tuples of (name, director, year, rating, user_id).
+
+        Returns:
+            int: The number of movies inserted.
+        """
+        with self.connection() as conn:
+            conn.executemany('''
+                INSERT INTO movies (name, director, year, rating, user_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', movies)
+        self._invalidate(*{('movies', movie[4]) for movie in movies})
+        return len(movies)
+
+    @contextmanager
+    def deferred_movie_indexes(self):
+        """
+        Drops the secondary indexes on movies, and the triggers maintaining search, user
+        statistics and the change log, for the duration of the block; then rebuilds them.
+
+        Building an index once over the loaded rows is much cheaper than maintaining it on
+        every insert. Until the block exits, queries by user fall back to table scans, and
+        search and statistics miss the movies added meanwhile. Statistics are recomputed only
+        for the users those movies belong to, found as the movies with higher IDs than any
+        existing one. The movies are not logged as changes, so the caller should have the
+        item index rebuilt.
+        """
+        triggers = {**migrations.MOVIE_FTS_TRIGGERS, **migrations.MOVIE_STATS_TRIGGERS,
+                    **migrations.MOVIE_CHANGE_TRIGGERS}
+        with self.connection() as conn:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM movies').fetchone()[0]
+            for name in migrations.MOVIE_INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+            for name in triggers:
+                conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        try:
+            yield
+        finally:
+            with self.connection() as conn:
+                for statement in migrations.MOVIE_INDEXES.values():
+                    conn.execute(statement)
+                for statement in triggers.values():
+                    conn.execute(statement)
+                conn.execute(migrations.MOVIES_FTS_REBUILD)
+                imported = 'user_id IN (SELECT user_id FROM movies WHERE id > ?)'
+                for table in migrations.USER_STATS_TABLES:
+                    conn.execute(f'DELETE FROM {table} WHERE {imported}', (last_id,))
+                for statement in migrations.user_stats_rebuild(imported):
+                    conn.execute(statement, (last_id,))
+
+    def _movie_owner(self, cursor, movie_id):
+        if self.cache is None:
+            return None
+        cursor.execute('SELECT user_id FROM movies WHERE id = ?', (movie_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
 
     def delete_movie(self, movie_id):
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
+                owner = self._movie_owner(cursor, movie_id)
                 cursor.execute('DELETE FROM movies WHERE id = ?', (movie_id,))
+            self._invalidate(('movies', owner))
         except sqlite3.Error as e:
             print(f"Error deleting movie with ID {movie_id}: {e}")
 
     def update_movie(self, movie_id, name, director, year, rating):
         try:
-            with sqlite3.connect(self.db_file) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
+                owner = self._movie_owner(cursor, movie_id)
                 cursor.execute('''
                     UPDATE movies
                     SET name = ?, director = ?, year = ?, rating = ?
                     WHERE id = ?
                 ''', (name, director, year, rating, movie_id))
+            self._invalidate(('movies', owner))
         except sqlite3.Error as e:
             print(f"Error updating movie with ID {movie_id}: {e}")
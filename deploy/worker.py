@@ -0,0 +1,88 @@
+import signal
+import threading
+import time
+
+from app import app, ai_features, data_manager, job_queue
+from als import train_als
+from jobs import Worker, report_progress
+from rate_limit import BACKGROUND, priority
+from recommender import build_item_index, rebuild_due
+
+
+def background(handler):
+    """
+    Runs a job handler's OpenAI calls at background priority, behind those of web requests.
+    """
+    def run(payload):
+        with priority(BACKGROUND):
+            return handler(payload)
+    return run
+
+
+# Seconds between progress reports of a recommendations job, each of which is a write to the queue
+PROGRESS_INTERVAL = 0.25
+
+
+def recommendations(payload):
+    """
+    Generates a user's recommendations, reporting the text as it is generated so that the
+    recommendations page can stream it (see app.stream_recommendations).
+    """
+    movies = data_manager.get_movies_by_user(payload['user_id'])
+    chunks = []
+    reported = time.monotonic()
+    for chunk in ai_features.stream_movie_recommendations(movies):
+        chunks.append(chunk)
+        if time.monotonic() - reported >= PROGRESS_INTERVAL:
+            report_progress(''.join(chunks))
+            reported = time.monotonic()
+    return ''.join(chunks)
+
+
+HANDLERS = {
+    'recommendations': background(recommendations),
+    'review': background(lambda payload: ai_features.generate_movie_review(payload['movie_name'])),
+    'trivia': background(lambda payload: ai_features.get_movie_trivia(payload['movie_name'])),
+    'enrich': background(lambda payload: ai_features.enrich_movie(payload['movie_name'],
+                                                                  ttl=app.config['AI_ENRICHMENT_TTL'])),
+    'build-recommender': lambda payload: build_item_index(data_manager, app.config['RECOMMENDER_DIR']),
+    'train-recommender': lambda payload: train_als(data_manager, app.config['RECOMMENDER_DIR']),
+}
+
+# Published models rebuilt in full from time to time, by job kind
+REBUILT_MODELS = {'build-recommender': 'items', 'train-recommender': 'als'}
+
+
+def schedule_rebuilds(stop, check_interval=60.0):
+    """
+    Queues a full rebuild of each published recommender model when it is due, until `stop` is set.
+
+    The web workers apply library changes to the item index incrementally; rebuilds correct
+    the drift and fold in what incremental updates cannot. Every worker process runs this,
+    and the dedupe key keeps them to one pending rebuild per model.
+    """
+    while not stop.wait(check_interval):
+        for kind, name in REBUILT_MODELS.items():
+            if rebuild_due(data_manager, app.config['RECOMMENDER_DIR'], name,
+                           app.config['RECOMMENDER_REBUILD_INTERVAL'], app.config['RECOMMENDER_MAX_CHANGES']):
+                job_queue.enqueue(kind, {}, dedupe_key=kind, max_attempts=1)
+
+
+def main():
+    worker = Worker(job_queue, HANDLERS, max_workers=app.config['JOB_WORKERS'],
+                    poll_interval=app.config['JOB_POLL_INTERVAL'])
+    stop = threading.Event()
+
+    def shutdown(*_):
+        stop.set()
+        worker.stop()
+
+    # Finish the jobs in progress before exiting
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    threading.Thread(target=schedule_rebuilds, args=(stop,), name='rebuilds', daemon=True).start()
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import contextvars
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from connection_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Job states. A failed attempt goes back to 'queued' with a later run_at until the job runs
+# out of attempts, when it is moved to the 'dead' state for inspection instead of retried.
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+DEAD = 'dead'
+
+JOB_COLUMNS = 'id, kind, payload, status, attempts, max_attempts, result, progress, error, created_at, updated_at'
+
+# The job a worker thread is running, for `report_progress`
+_current_job = contextvars.ContextVar('current_job', default=None)
+
+
+def report_progress(progress):
+    """
+    Records the partial result of the job running in this thread, so that clients following the
+    job can show it before the job is done. Does nothing outside a job.
+
+    Parameters:
+        progress: The JSON-serializable result so far, e.g. the text generated up to now.
+    """
+    current = _current_job.get()
+    if current is not None:
+        queue, job, worker_id = current
+        try:
+            queue.report_progress(job, worker_id, progress)
+        except sqlite3.Error as e:
+            # Progress is only shown to clients; the job goes on without it
+            logger.warning(f"Error reporting progress of job {job.id}: {e}")
+
+
+class Job:
+    """
+    A job claimed by a worker.
+    """
+
+    __slots__ = ('id', 'kind', 'payload', 'attempts', 'max_attempts')
+
+    def __init__(self, id, kind, payload, attempts, max_attempts):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+
+
+class JobQueue:
+    """
+    A durable job queue stored in SQLite, shared by the web workers and the job workers.
+
+    Jobs are claimed with a lease: a worker that dies mid-job leaves it 'running' until the
+    lease expires, after which it is retried like any other failed attempt. The queue lives
+    in its own database file so that claims and status updates never wait on the movie
+    database's write lock.
+    """
+
+    def __init__(self, db_file='data/jobs.db', max_attempts=5, lease_seconds=300,
+                 backoff=2.0, max_backoff=300.0, pool_size=2):
+        """
+        Initializes the queue and creates its SQLite table if needed.
+
+        Parameters:
+            db_file (str): Path to the SQLite queue file.
+            max_attempts (int): Attempts before a job is moved to the dead-letter state.
+            lease_seconds (float): How long a claimed job may run before it is assumed lost.
+            backoff (float): Delay in seconds before the first retry; doubled on each attempt.
+            max_backoff (float): Upper bound of the retry delay.
+            pool_size (int): Number of pooled connections to the queue file.
+        """
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool = ConnectionPool(db_file, max_size=pool_size)
+        with self.pool.connection() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    dedupe_key TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    run_at REAL NOT NULL,
+                    locked_by TEXT,
+                    locked_until REAL,
+                    result TEXT,
+                    progress TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            # Queue files created before jobs could report progress
+            if 'progress' not in {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}:
+                conn.execute('ALTER TABLE jobs ADD COLUMN progress TEXT')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, run_at)")
+            # At most one pending job per dedupe key, so repeated clicks share one job
+            conn.execute(f'''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_pending_dedupe_key ON jobs (dedupe_key)
+                WHERE status IN ('{QUEUED}', '{RUNNING}')
+            ''')
+            conn.commit()
+
+    def enqueue(self, kind, payload, dedupe_key=None, max_attempts=None):
+        """
+        Adds a job to the queue.
+
+        Parameters:
+            kind (str): Selects the handler that runs the job.
+            payload (dict): JSON-serializable arguments of the handler.
+            dedupe_key (str): If a job with this key is already queued or running, its id is
+                returned instead of adding another one.
+            max_attempts (int): Overrides the queue's default number of attempts.
+
+        Returns:
+            int: The id of the job.
+        """
+        now = time.time()
+        with self.pool.connection() as conn:
+            with conn:
+                cursor = conn.execute(f'''
+                    INSERT INTO jobs (kind, payload, dedupe_key, status, max_attempts, run_at, created_at, updated_at)
+                    VALUES (?, ?, ?, '{QUEUED}', ?, ?, ?, ?)
+                    ON CONFLICT (dedupe_key) WHERE status IN ('{QUEUED}', '{RUNNING}') DO NOTHING
+                ''', (kind, json.dumps(payload), dedupe_key, max_attempts or self.max_attempts, now, now, now))
+                if cursor.rowcount == 1:
+                    return cursor.lastrowid
+                return conn.execute(f'''
+                    SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('{QUEUED}', '{RUNNING}')
+                ''', (dedupe_key,)).fetchone()[0]
+
+    def claim(self, worker_id):
+        """
+        Takes the next job that is due, or one whose previous worker's lease has expired.
+
+        Parameters:
+            worker_id (str): Identifies the claiming worker in the job's lease.
+
+        Returns:
+            Job: The claimed job, or None if no job is due.
+        """
+        now = time.time()
+        with self.pool.connection() as conn:
+            with conn:
+                self._expire_leases(conn, now)
+                row = conn.execute(f'''
+                    UPDATE jobs
+                    SET status = '{RUNNING}', attempts = attempts + 1, locked_by = ?, locked_until = ?, updated_at = ?
+                    WHERE id = (
+                        SELECT id FROM jobs WHERE status = '{QUEUED}' AND run_at <= ? ORDER BY run_at LIMIT 1
+                    )
+                    RETURNING id, kind, payload, attempts, max_attempts
+                ''', (worker_id, now + self.lease_seconds, now, now)).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+    def _expire_leases(self, conn, now):
+        # A job whose worker died is treated as a failed attempt
+        conn.execute(f'''
+            UPDATE jobs
+            SET status = CASE WHEN attempts < max_attempts THEN '{QUEUED}' ELSE '{DEAD}' END,
+                error = 'Lease expired before the job finished', locked_by = NULL, locked_until = NULL,
+                run_at = ?, updated_at = ?
+            WHERE status = '{RUNNING}' AND locked_until <= ?
+        ''', (now, now, now))
+
+    def complete(self, job, worker_id, result):
+        """
+        Marks a claimed job as done and stores its JSON-serializable result.
+
+        Returns:
+            bool: False if the job's lease had expired and it was taken over by another worker.
+        """
+        with self.pool.connection() as conn:
+            with conn:
+                cursor = conn.execute(f'''
+                    UPDATE jobs
+                    SET status = '{DONE}', result = ?, progress = NULL, error = NULL, locked_by = NULL,
+                        locked_until = NULL, updated_at = ?
+                    WHERE id = ? AND status = '{RUNNING}' AND locked_by = ?
+                ''', (json.dumps(result), time.time(), job.id, worker_id))
+                return cursor.rowcount == 1
+
+    def fail(self, job, worker_id, error, retry=True):
+        """
+        Records a failed attempt, scheduling a retry with exponential backoff or, once the job
+        is out of attempts (or `retry` is False), moving it to the dead-letter state.
+
+        Returns:
+            str: The job's new status.
+        """
+        now = time.time()
+        if retry and job.attempts < job.max_attempts:
+            status = QUEUED
+            delay = min(self.max_backoff, self.backoff * 2 ** (job.attempts - 1))
+            # Jitter keeps jobs that failed together (e.g. on a rate limit) from retrying together
+            run_at = now + delay * random.uniform(0.5, 1.0)
+        else:
+            status = DEAD
+            run_at = now
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute(f'''
+                    UPDATE jobs
+                    SET status = ?, progress = NULL, error = ?, run_at = ?, locked_by = NULL, locked_until = NULL,
+                        updated_at = ?
+                    WHERE id = ? AND status = '{RUNNING}' AND locked_by = ?
+                ''', (status, str(error), run_at, now, job.id, worker_id))
+        return status
+
+    def report_progress(self, job, worker_id, progress):
+        """
+        Stores a claimed job's partial result until it completes or fails (see `report_progress`).
+
+        Returns:
+            bool: False if the job's lease had expired and it was taken over by another worker.
+        """
+        with self.pool.connection() as conn:
+            with conn:
+                cursor = conn.execute(f'''
+                    UPDATE jobs SET progress = ?, updated_at = ?
+                    WHERE id = ? AND status = '{RUNNING}' AND locked_by = ?
+                ''', (json.dumps(progress), time.time(), job.id, worker_id))
+                return cursor.rowcount == 1
+
+    def get(self, job_id):
+        """
+        Returns a job's status and, once it is done, its result; while it runs, the progress it has
+        reported, if any.
+
+        Returns:
+            dict: id, kind, payload, status, attempts, max_attempts, result, progress, error,
+            created_at and updated_at, or None if there is no such job.
+        """
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error retrieving job {job_id}: {e}")
+            return None
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS.split(', '), row))
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job['progress'] = json.loads(job['progress']) if job['progress'] is not None else None
+        return job
+
+    def counts(self):
+        """
+        Returns the number of jobs in each state.
+        """
+        try:
+            with self.pool.connection() as conn:
+                return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        except sqlite3.Error as e:
+            print(f"Error counting jobs: {e}")
+            return {}
+
+    def prune(self, older_than):
+        """
+        Deletes finished and dead jobs last updated more than `older_than` seconds ago.
+        """
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute(f"DELETE FROM jobs WHERE status IN ('{DONE}', '{DEAD}') AND updated_at <= ?",
+                             (time.time() - older_than,))
+
+    def close(self):
+        self.pool.close()
+
+
+class Worker:
+    """
+    Runs queued jobs on a bounded thread pool.
+
+    Jobs are only claimed while a thread is free, so a busy worker leaves jobs in the queue
+    for other worker processes instead of hoarding them.
+    """
+
+    def __init__(self, queue, handlers, max_workers=4, poll_interval=1.0, retention=7 * 24 * 3600):
+        """
+        Initializes the worker.
+
+        Parameters:
+            queue (JobQueue): The queue to take jobs from.
+            handlers (dict): Job kind -> callable taking the payload and returning a JSON-serializable result.
+            max_workers (int): How many jobs run at once.
+            poll_interval (float): Seconds to wait before polling an empty queue again.
+            retention (float): Seconds finished and dead jobs are kept before being pruned.
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.worker_id = f'worker-{uuid.uuid4().hex[:12]}'
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._stop = threading.Event()
+
+    def run(self):
+        """
+        Processes jobs until `stop` is called, then waits for running jobs to finish.
+        """
+        logger.info(f"{self.worker_id} started with {self.max_workers} threads")
+        last_prune = 0.0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job') as executor:
+            while not self._stop.is_set():
+                if time.monotonic() - last_prune > 3600:
+                    self.queue.prune(self.retention)
+                    last_prune = time.monotonic()
+                if not self._slots.acquire(timeout=self.poll_interval):
+                    continue
+                try:
+                    job = self.queue.claim(self.worker_id)
+                except sqlite3.Error as e:
+                    logger.error(f"Error claiming job: {e}")
+                    job = None
+                if job is None:
+                    self._slots.release()
+                    self._stop.wait(self.poll_interval)
+                    continue
+                executor.submit(self._run_job, job)
+        logger.info(f"{self.worker_id} stopped")
+
+    def _run_job(self, job):
+        token = _current_job.set((self.queue, job, self.worker_id))
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                self.queue.fail(job, self.worker_id, f"No handler for job kind '{job.kind}'", retry=False)
+                return
+            try:
+                result = handler(job.payload)
+            except Exception as e:
+                status = self.queue.fail(job, self.worker_id, e)
+                logger.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {e}; now {status}")
+                return
+            if not self.queue.complete(job, self.worker_id, result):
+                logger.warning(f"Job {job.id} ({job.kind}) finished after its lease expired")
+        except sqlite3.Error as e:
+            logger.error(f"Error updating job {job.id}: {e}")
+        finally:
+            _current_job.reset(token)
+            self._slots.release()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,402 @@
+import time
+
+# Secondary indexes on movies, by name. Bulk imports may drop and rebuild these.
+MOVIE_INDEXES = {
+    'idx_movies_user_id': 'CREATE INDEX IF NOT EXISTS idx_movies_user_id ON movies (user_id)',
+    'idx_movies_user_rating': 'CREATE INDEX IF NOT EXISTS idx_movies_user_rating ON movies (user_id, rating)',
+    'idx_movies_user_year': 'CREATE INDEX IF NOT EXISTS idx_movies_user_year ON movies (user_id, year)',
+}
+
+# Triggers keeping movies_fts in step with movies, by name, as created by migration 3.
+# Bulk imports may drop these and rebuild the index once at the end.
+MOVIE_FTS_TRIGGERS = {
+    'movies_fts_insert': '''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, name, director) VALUES (new.id, new.name, new.director);
+        END
+    ''',
+    'movies_fts_delete': '''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, name, director)
+            VALUES ('delete', old.id, old.name, old.director);
+        END
+    ''',
+    'movies_fts_update': '''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF name, director ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, name, director)
+            VALUES ('delete', old.id, old.name, old.director);
+            INSERT INTO movies_fts (rowid, name, director) VALUES (new.id, new.name, new.director);
+        END
+    ''',
+}
+MOVIES_FTS_REBUILD = "INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')"
+
+# Tables of per-user statistics, keyed by user_id
+USER_STATS_TABLES = ('user_stats', 'user_rating_histogram', 'user_director_counts')
+
+
+def _rating_bucket(ref):
+    return f'MIN(MAX(CAST({ref}.rating AS INTEGER), 0), 10)'
+
+
+def _stats_add(ref):
+    """
+    Trigger statements adding the movie row `ref` ('new' or 'old') to its owner's statistics.
+    """
+    return f'''
+        INSERT INTO user_stats (user_id, movie_count, rated_count, rating_sum)
+        SELECT {ref}.user_id, 1, {ref}.rating IS NOT NULL, COALESCE({ref}.rating, 0)
+        WHERE {ref}.user_id IS NOT NULL
+        ON CONFLICT (user_id) DO UPDATE SET
+            movie_count = movie_count + 1,
+            rated_count = rated_count + excluded.rated_count,
+            rating_sum = rating_sum + excluded.rating_sum;
+        INSERT INTO user_rating_histogram (user_id, bucket, movie_count)
+        SELECT {ref}.user_id, {_rating_bucket(ref)}, 1
+        WHERE {ref}.user_id IS NOT NULL AND {ref}.rating IS NOT NULL
+        ON CONFLICT (user_id, bucket) DO UPDATE SET movie_count = movie_count + 1;
+        INSERT INTO user_director_counts (user_id, director, movie_count)
+        SELECT {ref}.user_id, {ref}.director, 1
+        WHERE {ref}.user_id IS NOT NULL AND {ref}.director <> ''
+        ON CONFLICT (user_id, director) DO UPDATE SET movie_count = movie_count + 1;
+    '''
+
+
+def _stats_remove(ref):
+    """
+    Trigger statements removing the movie row `ref` ('new' or 'old') from its owner's statistics.
+    """
+    return f'''
+        UPDATE user_stats SET
+            movie_count = movie_count - 1,
+            rated_count = rated_count - ({ref}.rating IS NOT NULL),
+            rating_sum = rating_sum - COALESCE({ref}.rating, 0)
+        WHERE user_id = {ref}.user_id;
+        UPDATE user_rating_histogram SET movie_count = movie_count - 1
+        WHERE user_id = {ref}.user_id AND bucket = {_rating_bucket(ref)} AND {ref}.rating IS NOT NULL;
+        DELETE FROM user_rating_histogram WHERE user_id = {ref}.user_id AND movie_count <= 0;
+        UPDATE user_director_counts SET movie_count = movie_count - 1
+        WHERE user_id = {ref}.user_id AND director = {ref}.director;
+        DELETE FROM user_director_counts
+        WHERE user_id = {ref}.user_id AND director = {ref}.director AND movie_count <= 0;
+    '''
+
+
+def user_stats_rebuild(condition='user_id IS NOT NULL'):
+    """
+    Statements computing from scratch the statistics of the users whose movies match `condition`.
+    """
+    return [
+        f'''
+        INSERT INTO user_stats (user_id, movie_count, rated_count, rating_sum)
+        SELECT user_id, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0)
+        FROM movies WHERE {condition}
+        GROUP BY user_id
+        ''',
+        f'''
+        INSERT INTO user_rating_histogram (user_id, bucket, movie_count)
+        SELECT user_id, {_rating_bucket('movies')}, COUNT(*)
+        FROM movies WHERE {condition} AND rating IS NOT NULL
+        GROUP BY 1, 2
+        ''',
+        f'''
+        INSERT INTO user_director_counts (user_id, director, movie_count)
+        SELECT user_id, director, COUNT(*)
+        FROM movies WHERE {condition} AND director <> ''
+        GROUP BY 1, 2
+        ''',
+    ]
+
+
+# Triggers keeping the per-user statistics in step with movies, by name, as created by
+# migration 4. Bulk imports may drop these and recompute the statistics of the users they
+# loaded movies for.
+MOVIE_STATS_TRIGGERS = {
+    'movies_stats_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_insert AFTER INSERT ON movies BEGIN
+            {_stats_add('new')}
+        END
+    ''',
+    'movies_stats_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_delete AFTER DELETE ON movies BEGIN
+            {_stats_remove('old')}
+        END
+    ''',
+    'movies_stats_update': f'''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_update AFTER UPDATE OF rating, director, user_id ON movies BEGIN
+            {_stats_remove('old')}
+            {_stats_add('new')}
+        END
+    ''',
+}
+
+
+def _change(ref, delta):
+    """
+    Trigger statement logging that the movie row `ref` ('new' or 'old') entered or left its owner's library.
+    """
+    return f'''
+        INSERT INTO movie_changes (user_id, name, delta)
+        SELECT {ref}.user_id, {ref}.name, {delta}
+        WHERE {ref}.user_id IS NOT NULL;
+    '''
+
+
+# Triggers logging library changes for the item index, by name, as created by migration 5.
+# Deferred bulk imports drop these and have the index rebuilt instead of logging every
+# imported movie.
+MOVIE_CHANGE_TRIGGERS = {
+    'movies_changes_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS movies_changes_insert AFTER INSERT ON movies BEGIN
+            {_change('new', 1)}
+        END
+    ''',
+    'movies_changes_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS movies_changes_delete AFTER DELETE ON movies BEGIN
+            {_change('old', -1)}
+        END
+    ''',
+    'movies_changes_update': f'''
+        CREATE TRIGGER IF NOT EXISTS movies_changes_update AFTER UPDATE OF name, user_id ON movies BEGIN
+            {_change('old', -1)}
+            {_change('new', 1)}
+        END
+    ''',
+}
+
+
+# Ordered list of (version, description, statements). Append new migrations at the end;
+# never edit one that has already shipped.
+MIGRATIONS = [
+    (1, 'Create users and movies tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            director TEXT,
+            year INTEGER,
+            rating REAL,
+            user_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, 'Index movies by user, rating and year', list(MOVIE_INDEXES.values())),
+    (3, 'Full-text search over movies and users', [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            name, director,
+            content='movies', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, name, director) VALUES (new.id, new.name, new.director);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, name, director)
+            VALUES ('delete', old.id, old.name, old.director);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF name, director ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, name, director)
+            VALUES ('delete', old.id, old.name, old.director);
+            INSERT INTO movies_fts (rowid, name, director) VALUES (new.id, new.name, new.director);
+        END
+        ''',
+        "INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')",
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            name,
+            content='users', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, name) VALUES (new.id, new.name);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO users_fts (rowid, name) VALUES (new.id, new.name);
+        END
+        ''',
+        "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+    ]),
+    (4, 'Per-user statistics maintained by triggers', [
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            movie_count INTEGER NOT NULL DEFAULT 0,
+            rated_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_rating_histogram (
+            user_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            movie_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_director_counts (
+            user_id INTEGER NOT NULL,
+            director TEXT NOT NULL,
+            movie_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, director)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_director_counts_top
+        ON user_director_counts (user_id, movie_count DESC)
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_insert AFTER INSERT ON movies BEGIN
+            {_stats_add('new')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_delete AFTER DELETE ON movies BEGIN
+            {_stats_remove('old')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_update AFTER UPDATE OF rating, director, user_id ON movies BEGIN
+            {_stats_remove('old')}
+            {_stats_add('new')}
+        END
+        ''',
+        '''
+        INSERT INTO user_stats (user_id, movie_count, rated_count, rating_sum)
+        SELECT user_id, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0)
+        FROM movies WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        ''',
+        f'''
+        INSERT INTO user_rating_histogram (user_id, bucket, movie_count)
+        SELECT user_id, {_rating_bucket('movies')}, COUNT(*)
+        FROM movies WHERE user_id IS NOT NULL AND rating IS NOT NULL
+        GROUP BY 1, 2
+        ''',
+        '''
+        INSERT INTO user_director_counts (user_id, director, movie_count)
+        SELECT user_id, director, COUNT(*)
+        FROM movies WHERE user_id IS NOT NULL AND director <> ''
+        GROUP BY 1, 2
+        ''',
+    ]),
+    (5, 'Log of library changes for incremental recommender updates', [
+        '''
+        CREATE TABLE IF NOT EXISTS movie_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            delta INTEGER NOT NULL
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movies_changes_insert AFTER INSERT ON movies BEGIN
+            {_change('new', 1)}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movies_changes_delete AFTER DELETE ON movies BEGIN
+            {_change('old', -1)}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS movies_changes_update AFTER UPDATE OF name, user_id ON movies BEGIN
+            {_change('old', -1)}
+            {_change('new', 1)}
+        END
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at REAL NOT NULL
+        )
+    ''')
+
+
+def current_version(conn):
+    """
+    Returns the schema version recorded in the database, or 0 for an unmigrated database.
+
+    Parameters:
+        conn (sqlite3.Connection): An open database connection.
+
+    Returns:
+        int: The highest applied migration version.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def upgrade(conn, target=None):
+    """
+    Applies every pending migration up to `target`, each in its own transaction.
+
+    The version check is repeated under a write lock, so concurrent runs (for example
+    two deploy hooks racing) apply each migration exactly once.
+
+    Parameters:
+        conn (sqlite3.Connection): An open database connection with no transaction in progress.
+        target (int): The version to stop at. Defaults to the latest migration.
+
+    Returns:
+        list: The versions that were applied by this call.
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ensure_version_table(conn)
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, time.time()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
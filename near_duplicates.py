@@ -0,0 +1,159 @@
+import functools
+import hashlib
+import threading
+
+import numpy as np
+
+from ai_cache import normalize_title
+
+# Hash permutations are (a * x + b) mod a Mersenne prime over 32-bit title hashes. As in
+# common MinHash implementations, the product is left to wrap around at 64 bits, which mixes
+# the hashes far better than a product small enough to be exact
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Similarities whose hit rates are reported, whatever threshold is served
+REPORTED_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+@functools.lru_cache(maxsize=8)
+def _permutations(count):
+    # Seeded, so that every worker computes the same signatures
+    rng = np.random.default_rng(0x6d696e68)
+    a = rng.integers(1, MERSENNE_PRIME, size=count, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, size=count, dtype=np.uint64)
+    return a, b
+
+
+def title_hash(title):
+    """
+    A 32-bit hash of a normalized title, stable across processes (unlike `hash`).
+    """
+    return int.from_bytes(hashlib.blake2b(title.encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+def minhash_signature(titles, permutations=64):
+    """
+    Computes the MinHash signature of a set of titles.
+
+    The fraction of positions at which two signatures agree estimates the Jaccard
+    similarity of their sets.
+
+    Parameters:
+        titles (iterable): Normalized titles.
+        permutations (int): Length of the signature.
+
+    Returns:
+        ndarray: uint64 array of `permutations` minimum hash values.
+    """
+    hashes = np.fromiter((title_hash(title) for title in titles), dtype=np.uint64)
+    a, b = _permutations(permutations)
+    if len(hashes) == 0:
+        return np.full(permutations, MERSENNE_PRIME, dtype=np.uint64)
+    return ((np.outer(hashes, a) + b) % np.uint64(MERSENNE_PRIME)).min(axis=0)
+
+
+def band_keys(signature, bands):
+    """
+    Splits a signature into `bands` bands and hashes each into an LSH bucket key.
+
+    Sets with Jaccard similarity s share at least one bucket with probability
+    1 - (1 - s ** rows) ** bands, where rows = len(signature) // bands.
+    """
+    rows = len(signature) // bands
+    return [f'{band}:' + hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(),
+                                         digest_size=8).hexdigest()
+            for band in range(bands)]
+
+
+def jaccard(a, b):
+    """
+    Returns the Jaccard similarity of two sets.
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateCache:
+    """
+    Finds cached recommendations generated from favorites similar to a user's.
+
+    Many users' favorites differ by a title or two, which an exact-key cache counts as a
+    miss. Each cached response's favorites are indexed in the AI cache under the LSH band keys
+    of their MinHash signature; a lookup fetches the entries sharing a band and reuses the
+    most similar one if its exact Jaccard similarity reaches `threshold`.
+    """
+
+    def __init__(self, cache, threshold=0.8, bands=16, rows=4, candidates=20):
+        """
+        Initializes the near-duplicate cache.
+
+        Parameters:
+            cache (AICache): The cache holding the responses and their LSH index.
+            threshold (float): Minimum Jaccard similarity of the favorites for a response to be reused.
+            bands (int): LSH bands; with `rows`, sets at least (1 / bands) ** (1 / rows) similar
+                (0.5 by default) are likely to be found.
+            rows (int): Signature values per band.
+            candidates (int): Maximum indexed entries compared per lookup.
+        """
+        self.cache = cache
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.candidates = candidates
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self._reported = dict.fromkeys(REPORTED_THRESHOLDS, 0)
+
+    def _bands(self, titles):
+        return _band_keys(titles, self.bands, self.rows)
+
+    def get(self, favorites):
+        """
+        Returns the cached response of the most similar indexed favorites, or None if none is similar enough.
+
+        Parameters:
+            favorites (list): The favorite titles a response is wanted for.
+        """
+        titles = frozenset(normalize_title(title) for title in favorites)
+        best, best_key = 0.0, None
+        for key, indexed in self.cache.favorites_candidates(self._bands(titles), self.candidates):
+            similarity = jaccard(titles, set(indexed))
+            if similarity > best:
+                best, best_key = similarity, key
+        value = self.cache.get(best_key) if best_key is not None and best >= self.threshold else None
+        with self._lock:
+            self.lookups += 1
+            self.hits += value is not None
+            for threshold in self._reported:
+                self._reported[threshold] += best_key is not None and best >= threshold
+        return value
+
+    def add(self, key, favorites, ttl=None):
+        """
+        Indexes the favorites a response cached under `key` was generated from.
+        """
+        titles = frozenset(normalize_title(title) for title in favorites)
+        self.cache.index_favorites(key, sorted(titles), self._bands(titles), ttl=ttl)
+
+    def stats(self):
+        """
+        Returns the lookups made after exact-key misses, the hits served at the configured
+        threshold, and the hit rate each reported threshold would have had.
+        """
+        with self._lock:
+            lookups = self.lookups
+            return {
+                'threshold': self.threshold,
+                'lookups': lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'hit_rate_by_threshold': {str(threshold): hits / lookups if lookups else 0.0
+                                          for threshold, hits in self._reported.items()},
+            }
+
+
+@functools.lru_cache(maxsize=256)
+def _band_keys(titles, bands, rows):
+    return band_keys(minhash_signature(titles, bands * rows), bands)
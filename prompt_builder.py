@@ -0,0 +1,127 @@
+import functools
+import re
+import threading
+from collections import Counter, namedtuple
+
+from ai_cache import normalize_title
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Each title after the first is preceded by ", "
+SEPARATOR_TOKENS = 1
+
+
+def estimate_tokens(text):
+    """
+    Quickly estimates how many tokens `text` takes in a GPT prompt, without a tokenizer.
+
+    BPE tokenizers spend about one token per short word or punctuation mark and split long
+    or unusual words, which the character count (about four per token) accounts for.
+    """
+    return max(len(_TOKEN_RE.findall(text)), (len(text) + 3) // 4)
+
+
+class FavoritesSelection(namedtuple('FavoritesSelection', 'titles tokens full_tokens total')):
+    """
+    The favorites chosen for a recommendations prompt.
+
+    titles are the chosen movie names, tokens their estimated prompt size, and full_tokens and
+    total the estimated size and number of titles of the whole library.
+    """
+    __slots__ = ()
+
+    @property
+    def saved_tokens(self):
+        return self.full_tokens - self.tokens
+
+
+def select_favorites(favorite_movies, budget):
+    """
+    Picks a representative subset of a library whose titles fit in a token budget.
+
+    Titles are deduplicated (keeping the best-rated copy) and taken highest-rated first, but
+    in rounds: every director's best movie comes before any director's second best, and within
+    a round the decades take turns, so a prolific director or era cannot crowd out the rest.
+
+    Parameters:
+        favorite_movies (list): Movie records, or plain titles which are kept in their order.
+        budget (int): The estimated number of prompt tokens the titles may take, or None for all of them.
+
+    Returns:
+        FavoritesSelection: The chosen titles and the tokens they take and save.
+    """
+    return _select_favorites(tuple(favorite_movies), budget)
+
+
+@functools.lru_cache(maxsize=64)
+def _select_favorites(favorite_movies, budget):
+    names = []
+    best = {}
+    for movie in favorite_movies:
+        if isinstance(movie, str):
+            name, director, year, rating = movie, None, None, None
+        else:
+            name, director, year, rating = movie.name, movie.director, movie.year, movie.rating
+        names.append(name)
+        key = normalize_title(name)
+        if not isinstance(rating, (int, float)):
+            rating = float('-inf')
+        current = best.get(key)
+        if current is None or rating > current[3]:
+            best[key] = (name, director.casefold() if director else None,
+                         year // 10 if isinstance(year, int) else None, rating)
+    # Estimating the joined list at once is much faster than title by title, and counts the separators
+    full_tokens = estimate_tokens(', '.join(map(str, names)))
+
+    # Sorts are stable, so movies without ratings keep their input order throughout
+    candidates = sorted(best.values(), key=lambda movie: -movie[3])
+    # Movies with an unknown director or decade are a group of their own rather than one large group
+    director_rank = Counter()
+    decade_rank = Counter()
+    order = []
+    rounds = []
+    for index, (name, director, decade, rating) in enumerate(candidates):
+        group = director if director is not None else ('movie', index)
+        rounds.append(director_rank[group])
+        director_rank[group] += 1
+    for index, (movie, round_) in enumerate(zip(candidates, rounds)):
+        group = (round_, movie[2] if movie[2] is not None else ('movie', index))
+        order.append((round_, decade_rank[group], index))
+        decade_rank[group] += 1
+    order.sort()
+
+    titles = []
+    used = 0
+    for _, _, index in order:
+        name = candidates[index][0]
+        tokens = estimate_tokens(str(name)) + SEPARATOR_TOKENS
+        if budget is not None and used + tokens > budget:
+            break
+        titles.append(name)
+        used += tokens
+    return FavoritesSelection(tuple(titles), used, max(full_tokens, used), len(favorite_movies))
+
+
+class PromptStats:
+    """
+    Thread-safe totals of the recommendation prompts sent and the tokens selection saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.tokens = 0
+        self.saved_tokens = 0
+
+    def record(self, selection):
+        with self._lock:
+            self.prompts += 1
+            self.tokens += selection.tokens
+            self.saved_tokens += selection.saved_tokens
+
+    def stats(self):
+        """
+        Returns the number of prompts sent and their estimated favorites tokens, sent and saved.
+        """
+        with self._lock:
+            return {'prompts': self.prompts, 'tokens': self.tokens, 'saved_tokens': self.saved_tokens}
@@ -0,0 +1,387 @@
+import asyncio
+import contextvars
+import sqlite3
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from connection_pool import ConnectionPool
+
+# Priorities of AI calls; lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# Upper bounds, in seconds, of the queue-wait histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_priority = contextvars.ContextVar('ai_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """
+    Runs the AI calls made in the block, in this thread or task, at the given priority.
+
+    Web requests default to INTERACTIVE; job handlers run at BACKGROUND, so that batch
+    work queues behind users waiting on a page.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call waits longer than its timeout for rate limit capacity."""
+
+
+class WaitHistogram:
+    """
+    Thread-safe histogram of the time calls spent waiting for capacity, by priority.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._sums = {}
+
+    def record(self, level, seconds):
+        name = PRIORITY_NAMES.get(level, str(level))
+        with self._lock:
+            counts = self._counts.setdefault(name, [0] * (len(WAIT_BUCKETS) + 1))
+            counts[bisect_left(WAIT_BUCKETS, seconds)] += 1
+            self._sums[name] = self._sums.get(name, 0.0) + seconds
+
+    def stats(self):
+        """
+        Returns, per priority, the number of calls, their total wait and how many waited up
+        to each bucket's bound (not cumulative; '+Inf' counts the rest).
+        """
+        labels = [str(bound) for bound in WAIT_BUCKETS] + ['+Inf']
+        with self._lock:
+            return {name: {'count': sum(counts), 'sum': round(self._sums[name], 3),
+                           'buckets': dict(zip(labels, counts))}
+                    for name, counts in self._counts.items()}
+
+
+class RateLimiter:
+    """
+    A token bucket for requests per minute and one for tokens per minute, shared by every
+    worker process through a SQLite file.
+
+    Callers queue in a table of waiters ordered by priority, then arrival, and only the head
+    of the queue may take capacity, so interactive calls go ahead of background jobs even
+    across processes. A waiter keeps its place by polling; one whose process died drops out
+    once it stops refreshing its entry.
+    """
+
+    def __init__(self, db_file='data/ai_rate_limit.db', requests_per_minute=3500, tokens_per_minute=90_000,
+                 poll_interval=0.05, waiter_ttl=5.0, pool_size=2):
+        """
+        Initializes the limiter and creates its SQLite tables if needed.
+
+        Parameters:
+            db_file (str): Path to the shared SQLite file.
+            requests_per_minute (float): Requests allowed per minute, and the request bucket's burst size.
+            tokens_per_minute (float): Tokens allowed per minute, and the token bucket's burst size.
+            poll_interval (float): Longest time a waiter sleeps between checks.
+            waiter_ttl (float): Seconds after which a waiter that stopped polling loses its place.
+            pool_size (int): Number of pooled connections to the file.
+        """
+        self.capacity = {'requests': float(requests_per_minute), 'tokens': float(tokens_per_minute)}
+        self.poll_interval = poll_interval
+        self.waiter_ttl = waiter_ttl
+        self.waits = WaitHistogram()
+        self.pool = ConnectionPool(db_file, max_size=pool_size)
+        with self.pool.connection() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_waiters (
+                    owner TEXT PRIMARY KEY,
+                    priority INTEGER NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_waiters_order ON rate_waiters (priority, enqueued_at)')
+            conn.commit()
+
+    def _levels(self, conn, now):
+        levels = {name: capacity for name, capacity in self.capacity.items()}
+        for name, level, updated_at in conn.execute('SELECT name, level, updated_at FROM rate_buckets'):
+            if name in levels:
+                refill = self.capacity[name] / 60.0 * max(now - updated_at, 0.0)
+                levels[name] = min(self.capacity[name], level + refill)
+        return levels
+
+    def _try_acquire(self, owner, level, tokens, enqueued_at):
+        """
+        Takes one request and `tokens` tokens if the caller heads the queue and they are available.
+
+        Returns:
+            float: 0 if the capacity was taken, otherwise how long to wait before trying again.
+        """
+        now = time.time()
+        try:
+            return self._take(owner, level, tokens, enqueued_at, now)
+        except sqlite3.Error as e:
+            # Better to risk a 429 than to stop every AI call
+            print(f"Error reading AI rate limit: {e}")
+            return 0.0
+
+    def _take(self, owner, level, tokens, enqueued_at, now):
+        with self.pool.connection() as conn:
+            with conn:
+                # Taken up front, so that the checks and the update below see no concurrent change
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('''
+                    INSERT INTO rate_waiters (owner, priority, enqueued_at, expires_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (owner) DO UPDATE SET expires_at = excluded.expires_at
+                ''', (owner, level, enqueued_at, now + self.waiter_ttl))
+                conn.execute('DELETE FROM rate_waiters WHERE expires_at <= ?', (now,))
+                head = conn.execute('SELECT owner FROM rate_waiters ORDER BY priority, enqueued_at LIMIT 1').fetchone()
+                if head[0] != owner:
+                    return self.poll_interval
+                levels = self._levels(conn, now)
+                # A call larger than the whole bucket waits for a full bucket and leaves it in debt
+                needed = {'requests': 1.0, 'tokens': min(float(tokens), self.capacity['tokens'])}
+                wait = max((needed[name] - levels[name]) / (self.capacity[name] / 60.0) for name in levels)
+                if wait > 0:
+                    return min(wait, self.poll_interval)
+                levels['requests'] -= 1
+                levels['tokens'] -= tokens
+                conn.executemany('INSERT OR REPLACE INTO rate_buckets (name, level, updated_at) VALUES (?, ?, ?)',
+                                 [(name, levels[name], now) for name in levels])
+                conn.execute('DELETE FROM rate_waiters WHERE owner = ?', (owner,))
+                return 0.0
+
+    def _leave(self, owner):
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute('DELETE FROM rate_waiters WHERE owner = ?', (owner,))
+        except sqlite3.Error as e:
+            print(f"Error leaving AI rate limit queue: {e}")
+
+    def acquire(self, tokens, timeout=None):
+        """
+        Blocks until a request of `tokens` estimated tokens may be sent.
+
+        The call waits at the priority set with `priority`, INTERACTIVE by default.
+
+        Parameters:
+            tokens (int): Tokens the request is expected to use, prompt and completion.
+            timeout (float): Seconds to wait before raising RateLimitTimeout, or None to wait indefinitely.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        level = current_priority()
+        owner = uuid.uuid4().hex
+        started = time.time()
+        try:
+            while True:
+                wait = self._try_acquire(owner, level, tokens, started)
+                waited = time.time() - started
+                if wait == 0:
+                    self.waits.record(level, waited)
+                    return waited
+                if timeout is not None and waited + wait > timeout:
+                    raise RateLimitTimeout(f"No AI rate limit capacity within {timeout}s")
+                time.sleep(wait)
+        except BaseException:
+            self._leave(owner)
+            raise
+
+    async def acquire_async(self, tokens, timeout=None):
+        """
+        Async counterpart of `acquire`, sleeping on the event loop while waiting.
+
+        Each attempt is a SQLite write transaction that may wait on other workers' locks, so it
+        runs in a thread rather than blocking the loop.
+        """
+        level = current_priority()
+        owner = uuid.uuid4().hex
+        started = time.time()
+        try:
+            while True:
+                wait = await asyncio.to_thread(self._try_acquire, owner, level, tokens, started)
+                waited = time.time() - started
+                if wait == 0:
+                    self.waits.record(level, waited)
+                    return waited
+                if timeout is not None and waited + wait > timeout:
+                    raise RateLimitTimeout(f"No AI rate limit capacity within {timeout}s")
+                await asyncio.sleep(wait)
+        except BaseException:
+            await asyncio.to_thread(self._leave, owner)
+            raise
+
+    def settle(self, reserved, used):
+        """
+        Corrects the token bucket once a call's actual usage is known.
+
+        Parameters:
+            reserved (int): The tokens taken by `acquire`.
+            used (int): The tokens the call actually used.
+        """
+        if used == reserved:
+            return
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute("UPDATE rate_buckets SET level = MIN(level + ?, ?) WHERE name = 'tokens'",
+                                 (reserved - used, self.capacity['tokens']))
+        except sqlite3.Error as e:
+            print(f"Error updating AI rate limit: {e}")
+
+    def stats(self):
+        """
+        Returns the limits, the current queue length by priority and this process's wait histogram.
+        """
+        stats = {'requests_per_minute': self.capacity['requests'], 'tokens_per_minute': self.capacity['tokens'],
+                 'waits': self.waits.stats()}
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute('SELECT priority, COUNT(*) FROM rate_waiters WHERE expires_at > ? GROUP BY priority',
+                                    (time.time(),)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading AI rate limit: {e}")
+            return stats
+        stats['waiting'] = {PRIORITY_NAMES.get(level, str(level)): count for level, count in rows}
+        return stats
+
+    def close(self):
+        self.pool.close()
+
+
+class DailyQuota:
+    """
+    A daily budget of API units, such as the YouTube Data API quota, shared by every worker
+    through a SQLite file.
+
+    Interactive calls may spend the whole budget; BACKGROUND calls (see `priority`) only
+    `background_share` of it, so that prefetching never leaves users clicking on a page
+    without quota. Days start at midnight Pacific time, when YouTube resets its quotas.
+    """
+
+    TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+    def __init__(self, db_file='data/ai_rate_limit.db', name='youtube', units_per_day=10_000,
+                 background_share=0.8, pool_size=2):
+        """
+        Initializes the quota and creates its SQLite table if needed.
+
+        Parameters:
+            db_file (str): Path to the shared SQLite file.
+            name (str): The API the quota belongs to.
+            units_per_day (int): Units that may be spent per day.
+            background_share (float): Fraction of the units BACKGROUND calls may spend.
+            pool_size (int): Number of pooled connections to the file.
+        """
+        self.name = name
+        self.units_per_day = units_per_day
+        self.background_share = background_share
+        self.refused = 0
+        self.pool = ConnectionPool(db_file, max_size=pool_size)
+        with self.pool.connection() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS api_quota (
+                    name TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    used INTEGER NOT NULL,
+                    PRIMARY KEY (name, day)
+                )
+            ''')
+            conn.commit()
+
+    def today(self):
+        return datetime.now(self.TIMEZONE).date().isoformat()
+
+    def limit(self):
+        """
+        Returns the units the caller may use today: all of them, or BACKGROUND calls' share.
+        """
+        if current_priority() == BACKGROUND:
+            return self.units_per_day * self.background_share
+        return self.units_per_day
+
+    def spend(self, units):
+        """
+        Takes `units` from today's budget if enough are left for the caller's priority.
+
+        Returns:
+            bool: True if the units were taken and the call may be made.
+        """
+        limit = self.limit()
+        day = self.today()
+        try:
+            with self.pool.connection() as conn:
+                with conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    row = conn.execute('SELECT used FROM api_quota WHERE name = ? AND day = ?',
+                                       (self.name, day)).fetchone()
+                    used = row[0] if row is not None else 0
+                    if used + units > limit:
+                        self.refused += 1
+                        return False
+                    conn.execute('''
+                        INSERT INTO api_quota (name, day, used) VALUES (?, ?, ?)
+                        ON CONFLICT (name, day) DO UPDATE SET used = used + excluded.used
+                    ''', (self.name, day, units))
+                    conn.execute('DELETE FROM api_quota WHERE name = ? AND day < ?', (self.name, day))
+                    return True
+        except sqlite3.Error as e:
+            # As with the rate limit, an unreadable budget should not stop every call
+            print(f"Error updating {self.name} quota: {e}")
+            return True
+
+    def available(self, units):
+        """
+        Returns whether `units` are left in today's budget for the caller's priority, without taking them.
+        """
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT used FROM api_quota WHERE name = ? AND day = ?',
+                                   (self.name, self.today())).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading {self.name} quota: {e}")
+            return True
+        return (row[0] if row is not None else 0) + units <= self.limit()
+
+    def stats(self):
+        """
+        Returns today's budget, the units used so far and how many calls this process was refused.
+        """
+        stats = {'day': self.today(), 'units_per_day': self.units_per_day,
+                 'background_share': self.background_share, 'refused': self.refused}
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT used FROM api_quota WHERE name = ? AND day = ?',
+                                   (self.name, stats['day'])).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading {self.name} quota: {e}")
+            return stats
+        stats['used'] = row[0] if row is not None else 0
+        return stats
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,624 @@
+import datetime
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import scipy.sparse as sp
+
+from ai_cache import normalize_title
+
+logger = logging.getLogger(__name__)
+
+# Model versions kept on disk: workers may still have the previous one mapped
+KEEP_VERSIONS = 2
+
+# Ratings are on a 0-10 scale; a movie without a rating counts as an average one
+UNRATED = 5.0
+
+# Blocks of the co-occurrence matrix denser than this are reduced to top-k as dense arrays
+DENSE_FRACTION = 0.05
+# Upper bound on the entries of one block of the co-occurrence matrix (64 MiB of float32)
+BLOCK_ENTRIES = 16 * 1024 * 1024
+
+
+def write_model(model_dir, name, arrays, meta):
+    """
+    Publishes a new version of a model as a directory of .npy files.
+
+    The files are written to model_dir/<name>-<version>/ and only then is <name>.current
+    switched to that version, atomically, so readers never see a half-written model.
+
+    Parameters:
+        model_dir (str): Directory holding all recommender models.
+        name (str): The model's name, e.g. 'items'.
+        arrays (dict): Array name -> NumPy array.
+        meta (dict): JSON-serializable metadata stored next to the arrays.
+
+    Returns:
+        str: The new version.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f') + f'-{os.getpid()}'
+    path = os.path.join(model_dir, f'{name}-{version}')
+    os.makedirs(path)
+    for array_name, array in arrays.items():
+        np.save(os.path.join(path, f'{array_name}.npy'), array)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    pointer = os.path.join(model_dir, f'{name}.current')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+    versions = sorted(entry for entry in os.listdir(model_dir)
+                      if entry.startswith(f'{name}-') and os.path.isdir(os.path.join(model_dir, entry)))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(model_dir, old), ignore_errors=True)
+    return version
+
+
+def current_version(model_dir, name):
+    """
+    Returns the published version of a model, or None if it has never been built.
+    """
+    try:
+        with open(os.path.join(model_dir, f'{name}.current')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def published_meta(model_dir, name):
+    """
+    Returns the metadata of a model's published version, or None if it has never been built.
+    """
+    version = current_version(model_dir, name)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(model_dir, f'{name}-{version}', 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def rebuild_due(data_manager, model_dir, name, interval, max_changes):
+    """
+    Tells whether a published model should be rebuilt from scratch.
+
+    Incremental updates only approximate a rebuild, so models are rebuilt every `interval`
+    seconds, and sooner once more library changes are pending than are applied incrementally.
+
+    Returns:
+        bool: True if the model is due; False if it is recent or has never been built.
+    """
+    meta = published_meta(model_dir, name)
+    if meta is None:
+        return False
+    if time.time() - meta.get('built_at', 0) >= interval:
+        return True
+    through = meta.get('changes_through')
+    return through is not None and data_manager.latest_movie_change() - through > max_changes
+
+
+def open_model(model_dir, name, version):
+    """
+    Maps a published model version read-only.
+
+    The arrays are memory-mapped, so every worker process shares the operating system's
+    page cache instead of loading its own copy.
+
+    Returns:
+        tuple: (arrays dict, meta dict).
+    """
+    path = os.path.join(model_dir, f'{name}-{version}')
+    arrays = {entry[:-4]: np.load(os.path.join(path, entry), mmap_mode='r')
+              for entry in os.listdir(path) if entry.endswith('.npy')}
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    return arrays, meta
+
+
+def library_matrix(data_manager):
+    """
+    Reads every user's library into a sparse user x title matrix.
+
+    Titles are identified by their normalized form, so 'Alien' and 'alien ' are one item.
+
+    Returns:
+        tuple: (csr_matrix of ratings, with UNRATED for unrated movies; list of display titles).
+    """
+    index = {}
+    by_name = {}
+    titles = []
+    users = []
+    items = []
+    ratings = []
+    for batch in data_manager.iter_library():
+        for user_id, name, rating in batch:
+            # Most rows repeat a spelling seen before, which skips normalizing it again
+            item = by_name.get(name)
+            if item is None:
+                key = normalize_title(name)
+                item = index.get(key)
+                if item is None:
+                    item = index[key] = len(titles)
+                    titles.append(name)
+                by_name[name] = item
+            users.append(user_id)
+            items.append(item)
+            ratings.append(rating if isinstance(rating, (int, float)) and rating > 0 else UNRATED)
+
+    user_ids, rows = np.unique(np.asarray(users, dtype=np.int64), return_inverse=True)
+    items = np.asarray(items, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.float32)
+    # A user listing the same title twice counts once, with their best rating
+    order = np.lexsort((ratings, items, rows))
+    rows, items, ratings = rows[order], items[order], ratings[order]
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = (rows[1:] != rows[:-1]) | (items[1:] != items[:-1])
+    matrix = sp.csr_matrix((ratings[last], (rows[last], items[last])), shape=(len(user_ids), len(titles)))
+    return matrix, titles
+
+
+def top_k_per_row(matrix, k):
+    """
+    Keeps the `k` largest positive entries of every row of a CSR matrix, without a Python loop over rows.
+    """
+    counts = np.diff(matrix.indptr)
+    if len(counts) == 0 or counts.max() <= k:
+        return matrix
+    rows, columns = matrix.shape
+    if matrix.nnz > DENSE_FRACTION * rows * columns:
+        # Co-occurrences of popular titles are nearly dense, where a linear-time partition
+        # of each row beats sorting every entry
+        dense = matrix.toarray()
+        k = min(k, columns)
+        top = np.argpartition(dense, columns - k, axis=1)[:, columns - k:]
+        values = np.take_along_axis(dense, top, axis=1)
+        keep = values > 0
+        return sp.csr_matrix((values[keep], (np.nonzero(keep)[0], top[keep])), shape=matrix.shape)
+    # Sort each row's entries in descending order; rows stay in place, so an entry's rank
+    # within its row is its offset from the row's indptr entry
+    row_ids = np.repeat(np.arange(rows), counts)
+    order = np.argsort(row_ids - matrix.data / (2 * matrix.data.max()), kind='stable')
+    rank = np.arange(len(order)) - np.repeat(matrix.indptr[:-1], counts)
+    keep = np.sort(order[rank < k])
+    return sp.csr_matrix((matrix.data[keep], matrix.indices[keep], np.concatenate(
+        ([0], np.cumsum(np.minimum(counts, k))))), shape=matrix.shape)
+
+
+def build_item_index(data_manager, model_dir, neighbors=50, min_common=1, block_size=2048):
+    """
+    Computes the item-item similarity index and publishes it as the 'items' model.
+
+    Two titles are similar when the same users have both. Similarity is the cosine of their
+    user vectors, computed with sparse matrix products in blocks of titles to bound memory,
+    and only each title's `neighbors` most similar titles are kept.
+
+    Parameters:
+        data_manager (DataManager): Source of the movie libraries.
+        model_dir (str): Directory holding the recommender models.
+        neighbors (int): Similar titles kept per title.
+        min_common (int): Users two titles must share to count as similar.
+        block_size (int): Maximum titles processed per sparse product; lowered for large
+            catalogues so that a block stays within BLOCK_ENTRIES.
+
+    Returns:
+        dict: The model's metadata: version, users, items, pairs, seconds and the id of the
+        last library change it includes.
+    """
+    started = time.perf_counter()
+    previous = published_meta(model_dir, 'items')
+    # Changes logged from here on are applied incrementally by the workers serving this index
+    changes_through = data_manager.latest_movie_change()
+    matrix, titles = library_matrix(data_manager)
+    owned = matrix.astype(bool).astype(np.float32)
+    norms = np.sqrt(np.asarray(owned.sum(axis=0)).ravel())
+    by_item = owned.T.tocsr()
+
+    blocks = []
+    block_size = max(16, min(block_size, BLOCK_ENTRIES // max(len(titles), 1)))
+    for start in range(0, len(titles), block_size):
+        stop = min(start + block_size, len(titles))
+        common = (by_item[start:stop] @ owned).tocsr()
+        common.setdiag(0, k=start)
+        common.data[common.data < max(min_common, 1)] = 0
+        common.eliminate_zeros()
+        rows = np.repeat(np.arange(start, stop), np.diff(common.indptr))
+        common.data = common.data / (norms[rows] * norms[common.indices])
+        blocks.append(top_k_per_row(common, neighbors))
+    similarity = sp.vstack(blocks, format='csr') if blocks else sp.csr_matrix((0, 0), dtype=np.float32)
+
+    meta = {
+        'users': matrix.shape[0],
+        'items': len(titles),
+        'pairs': int(similarity.nnz),
+        'seconds': round(time.perf_counter() - started, 2),
+        'built_at': time.time(),
+        'changes_through': changes_through,
+    }
+    meta['version'] = write_model(model_dir, 'items', {
+        'indptr': similarity.indptr.astype(np.int64),
+        'indices': similarity.indices.astype(np.int32),
+        'data': similarity.data.astype(np.float32),
+        'counts': (norms ** 2).astype(np.float32),
+    }, {**meta, 'titles': titles, 'min_common': min_common})
+    # Workers still serving the previous version replay the changes made since it was built
+    if previous is not None and previous.get('changes_through') is not None:
+        data_manager.prune_movie_changes(previous['changes_through'])
+    return meta
+
+
+class TitleLookup:
+    """
+    Maps movie names to the item numbers of a model's titles.
+    """
+
+    def __init__(self, titles, lookup=None):
+        self.titles = titles
+        if lookup is not None:
+            self.lookup = lookup
+            return
+        # Lookups try the stored spelling first and only normalize on a miss
+        self.lookup = {}
+        for item, title in enumerate(titles):
+            self.lookup.setdefault(normalize_title(title), item)
+            self.lookup.setdefault(title, item)
+
+    def copy(self):
+        """
+        Returns a lookup that titles can be added to without changing this one.
+        """
+        return TitleLookup(list(self.titles), dict(self.lookup))
+
+    def item(self, name):
+        """
+        Returns the item of a movie name, or None if the model does not know the title.
+        """
+        item = self.lookup.get(name)
+        return item if item is not None else self.lookup.get(normalize_title(name))
+
+    def add(self, name):
+        """
+        Returns the item of a movie name, adding the title if the model does not know it yet.
+        """
+        item = self.item(name)
+        if item is None:
+            item = len(self.titles)
+            self.titles.append(name)
+            self.lookup.setdefault(normalize_title(name), item)
+            self.lookup.setdefault(name, item)
+        return item
+
+    def items(self, movies):
+        """
+        Returns the items of a user's movies that the model knows, with the user's best rating of each.
+
+        Parameters:
+            movies (list): Movie records, or movie names (which count as unrated).
+
+        Returns:
+            tuple: (int64 array of items, float32 array of ratings).
+        """
+        found = {}
+        for movie in movies:
+            name, rating = (movie, None) if isinstance(movie, str) else (movie.name, movie.rating)
+            item = self.item(name)
+            if item is None:
+                continue
+            rating = rating if isinstance(rating, (int, float)) and rating > 0 else UNRATED
+            if rating > found.get(item, 0):
+                found[item] = rating
+        return (np.fromiter(found.keys(), dtype=np.int64, count=len(found)),
+                np.fromiter(found.values(), dtype=np.float32, count=len(found)))
+
+
+def top_k(scores, k, exclude=()):
+    """
+    Returns the items with the `k` highest positive scores, best first, using argpartition.
+
+    Parameters:
+        scores (ndarray): One score per item; modified in place.
+        k (int): How many items to return.
+        exclude (ndarray): Items never returned, such as titles the user already has.
+
+    Returns:
+        list: (item, score) pairs.
+    """
+    scores[exclude] = 0
+    k = min(k, int(np.count_nonzero(scores > 0)))
+    if k == 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(int(item), float(scores[item])) for item in top]
+
+
+class PublishedModel:
+    """
+    The current version of a published model, loaded on first use and reloaded when a new
+    version is published, checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, model_dir, name, load, check_interval=5.0):
+        """
+        Parameters:
+            model_dir (str): Directory holding the recommender models.
+            name (str): The model's name.
+            load (callable): Builds the in-memory model from (arrays, meta).
+            check_interval (float): Seconds between checks for a newly published version.
+        """
+        self.model_dir = model_dir
+        self.name = name
+        self.load = load
+        self.check_interval = check_interval
+        self.version = None
+        self._model = None
+        self._checked = float('-inf')
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns the loaded model, or None if it has never been built.
+        """
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._model
+        with self._lock:
+            if now - self._checked >= self.check_interval:
+                version = current_version(self.model_dir, self.name)
+                if version is not None and version != self.version:
+                    self._model = self.load(*open_model(self.model_dir, self.name, version))
+                    self.version = version
+                self._checked = now
+        return self._model
+
+
+class ItemIndex:
+    """
+    A loaded version of the item-item similarity index, with the library changes made since
+    it was built applied in memory.
+    """
+
+    def __init__(self, arrays, meta):
+        self.indptr = arrays['indptr']
+        self.indices = arrays['indices']
+        self.data = arrays['data']
+        self.titles = TitleLookup(meta['titles'])
+        self.base_items = len(meta['titles'])
+        self.base_counts = arrays.get('counts')
+        self.min_common = max(meta.get('min_common', 1), 1)
+        # Indexes built before the change log existed are served as built
+        self.changes_through = meta.get('changes_through') if self.base_counts is not None else None
+        self.changes_checked = float('-inf')
+        # Guards swapping in new titles and patch together; see `snapshot`
+        self.lock = threading.Lock()
+        self.counts = None
+        # (item, other) with item < other -> [common owners, stored similarity of item to other
+        # and of other to item], for every pair touched by a change
+        self.pairs = {}
+        # Differences from the stored similarities, added to the stored rows when scoring
+        self.patch = None
+
+    def _stored_similarity(self, item, other):
+        if item >= self.base_items:
+            return 0.0
+        start, end = self.indptr[item], self.indptr[item + 1]
+        hits = np.flatnonzero(self.indices[start:end] == other)
+        return float(self.data[start + hits[0]]) if len(hits) else 0.0
+
+    def _pair(self, item, other):
+        key = (item, other) if item < other else (other, item)
+        pair = self.pairs.get(key)
+        if pair is None:
+            forward = self._stored_similarity(*key)
+            backward = self._stored_similarity(key[1], key[0])
+            owners = (float(self.base_counts[key[0]]) * float(self.base_counts[key[1]])
+                      if key[1] < self.base_items else 0.0)
+            pair = self.pairs[key] = [round(max(forward, backward) * owners ** 0.5), forward, backward]
+        return pair
+
+    def apply_changes(self, changes, libraries):
+        """
+        Updates the similarity rows of the titles touched by library changes.
+
+        Each changed user's library before the changes is derived from the current one, and
+        the common owners of the pairs of titles that entered or left it are recounted. The
+        cosines of those pairs, and of every stored neighbor of a title whose number of owners
+        changed, are then recomputed. A pair outside both titles' stored neighbors starts from
+        no common owners, so the result drifts from an exact rebuild until the next one.
+
+        Must not run concurrently with itself. Readers keep scoring the previous titles and patch
+        until both are swapped in at the end, since new titles are added to a copy.
+
+        Parameters:
+            changes (list): (id, user_id, name, delta) tuples, from `DataManager.get_library_changes`.
+            libraries (dict): user_id -> the movie names in the user's library after the changes.
+        """
+        if not changes:
+            return
+        names = [name for _, _, name, _ in changes]
+        names.extend(itertools.chain.from_iterable(libraries.values()))
+        titles = self.titles
+        if any(titles.item(name) is None for name in names):
+            titles = titles.copy()
+        deltas = defaultdict(Counter)
+        for _, user_id, name, delta in changes:
+            deltas[user_id][titles.add(name)] += delta
+        current = {user_id: Counter(titles.add(name) for name in libraries.get(user_id, ()))
+                   for user_id in deltas}
+        counts = np.zeros(len(titles.titles))
+        previous = self.base_counts if self.counts is None else self.counts
+        counts[:len(previous)] = previous
+
+        for user_id, delta in deltas.items():
+            now = current[user_id]
+            after = set(now)
+            before = {item for item in after | set(delta) if now[item] - delta[item] > 0}
+            kept = after & before
+            for changed, sign in ((after - before, 1), (before - after, -1)):
+                for item in changed:
+                    counts[item] += sign
+                    if item < self.base_items:
+                        start, end = self.indptr[item], self.indptr[item + 1]
+                        for neighbor in self.indices[start:end].tolist():
+                            self._pair(item, neighbor)
+                    for other in kept:
+                        self._pair(item, other)[0] += sign
+                for item, other in itertools.combinations(changed, 2):
+                    self._pair(item, other)[0] += sign
+
+        self.counts = counts
+        self.changes_through = changes[-1][0]
+        patch = self._build_patch()
+        with self.lock:
+            self.titles, self.patch = titles, patch
+
+    def snapshot(self):
+        """
+        Returns the titles and the patch of the same set of applied changes, for `scores`.
+        """
+        with self.lock:
+            return self.titles, self.patch
+
+    def _build_patch(self):
+        if not self.pairs:
+            return None
+        keys = np.array(list(self.pairs), dtype=np.int64)
+        values = np.array(list(self.pairs.values()), dtype=np.float64)
+        items, others = keys[:, 0], keys[:, 1]
+        owners = np.sqrt(self.counts[items] * self.counts[others])
+        similarity = np.zeros(len(keys))
+        valid = (values[:, 0] >= self.min_common) & (owners > 0)
+        similarity[valid] = values[valid, 0] / owners[valid]
+        size = len(self.counts)
+        return sp.csr_matrix((np.concatenate((similarity - values[:, 1], similarity - values[:, 2])),
+                              (np.concatenate((items, others)), np.concatenate((others, items)))),
+                             shape=(size, size))
+
+    def scores(self, items, titles, patch):
+        """
+        Sums the similarity rows of `items` into one score per title of `titles`.
+
+        Parameters:
+            items (ndarray): Items of `titles`.
+            titles (TitleLookup), patch: A `snapshot` of the index.
+        """
+        scores = np.zeros(len(titles.titles))
+        stored = items[items < self.base_items]
+        starts = self.indptr[stored]
+        lengths = self.indptr[stored + 1] - starts
+        total = int(lengths.sum())
+        if total:
+            # Positions of every neighbor of every item, gathered without a Python loop
+            offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+            positions = offsets + np.arange(total)
+            scores[:self.base_items] = np.bincount(self.indices[positions], weights=self.data[positions],
+                                                   minlength=self.base_items)
+        if patch is not None:
+            scores += np.asarray(patch[items].sum(axis=0)).ravel()
+        return scores
+
+
+class ItemRecommender:
+    """
+    Serves recommendations from the item-item index, locally and without network access.
+
+    The index is built offline by `flask build-recommender` and memory-mapped by each worker.
+    A rebuilt index is picked up within `check_interval` seconds, without restarting workers.
+    Given a DataManager, the library changes made since the index was built are applied to it
+    incrementally, within `changes_interval` seconds: a recommendation that finds changes due
+    starts a background thread to apply them and is answered from the index as it is.
+    """
+
+    def __init__(self, model_dir='data/recommender', check_interval=5.0, data_manager=None,
+                 changes_interval=0.5, max_changes=10_000):
+        """
+        Initializes the recommender. The index is loaded on first use.
+
+        Parameters:
+            model_dir (str): Directory holding the recommender models.
+            check_interval (float): Seconds between checks for a newly published index.
+            data_manager (DataManager): Source of library changes, or None to serve the index as built.
+            changes_interval (float): Seconds between checks for library changes.
+            max_changes (int): Pending changes beyond which the index is served as it is until
+                the next rebuild, which is then due.
+        """
+        self.model = PublishedModel(model_dir, 'items', ItemIndex, check_interval)
+        self.data_manager = data_manager
+        self.changes_interval = changes_interval
+        self.max_changes = max_changes
+        # Held while changes are applied, by one thread at a time
+        self._refreshing = threading.Lock()
+
+    def refresh(self):
+        """
+        Applies the library changes made since the index was last caught up, waiting for a
+        background refresh in progress to finish first.
+        """
+        index = self.model.get()
+        if index is None or self.data_manager is None:
+            return
+        with self._refreshing:
+            self._catch_up(index)
+
+    def _refresh_if_due(self, index):
+        now = time.monotonic()
+        if index.changes_through is None or now - index.changes_checked < self.changes_interval:
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return
+        index.changes_checked = now
+        threading.Thread(target=self._refresh_in_background, args=(index,), name='item-index-refresh',
+                         daemon=True).start()
+
+    def _refresh_in_background(self, index):
+        try:
+            self._catch_up(index)
+        except Exception as e:
+            logger.error(f"Error applying library changes to the item index: {e}")
+        finally:
+            self._refreshing.release()
+
+    def _catch_up(self, index):
+        if index.changes_through is None:
+            return
+        changes, libraries = self.data_manager.get_library_changes(index.changes_through, self.max_changes)
+        if changes is None:
+            logger.warning(f"More than {self.max_changes} library changes since the item index was built; "
+                           f"serving it without them until it is rebuilt")
+            index.changes_through = None
+        else:
+            index.apply_changes(changes, libraries)
+        index.changes_checked = time.monotonic()
+
+    def recommend(self, movies, k=10):
+        """
+        Recommends titles similar to a user's library.
+
+        Parameters:
+            movies (list): The user's Movie records, or movie names.
+            k (int): How many titles to recommend.
+
+        Returns:
+            list: Up to `k` (title, score) pairs, best first, excluding titles the user already
+            has; or None if no index has been built.
+        """
+        index = self.model.get()
+        if index is None:
+            return None
+        if self.data_manager is not None:
+            self._refresh_if_due(index)
+        titles, patch = index.snapshot()
+        items, _ = titles.items(movies)
+        if len(items) == 0:
+            return []
+        scores = index.scores(items, titles, patch)
+        return [(titles.titles[item], round(score, 4)) for item, score in top_k(scores, k, items)]
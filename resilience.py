@@ -0,0 +1,178 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream service failed, ran out of time or is cut off by its circuit breaker."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while, so that requests fail fast instead of
+    each waiting out its own timeout.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are rejected
+    for `reset_timeout` seconds. Then a single trial call is let through: its success closes
+    the circuit, its failure opens it again. The state is per process.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        """
+        Parameters:
+            name (str): The service, for error messages and stats.
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial call.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a call may go ahead; the caller must then report its outcome.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    @property
+    def is_open(self):
+        """
+        True while calls are being rejected without trying the service.
+        """
+        with self._lock:
+            return self.state == self.HALF_OPEN or (
+                self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+
+    def abandon(self):
+        """
+        Reports a call given up before its outcome was known, letting the next call be the trial.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'trips': self.trips, 'rejected': self.rejected}
+
+
+def backoff_delay(attempt, base=0.25, cap=4.0):
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2 ** attempt, at most `cap`.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _next_delay(breaker, attempt, retries, deadline, e):
+    breaker.record_failure()
+    delay = backoff_delay(attempt)
+    if attempt >= retries or time.monotonic() + delay >= deadline:
+        raise UpstreamUnavailable(f"{breaker.name} failed: {e}") from e
+    return delay
+
+
+def _remaining(breaker, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise UpstreamUnavailable(f"{breaker.name} did not answer in time")
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} is unavailable")
+    return remaining
+
+
+def call(fn, breaker, deadline, retries=2, retry_on=(Exception,)):
+    """
+    Calls `fn(timeout)` through a circuit breaker, retrying failures with jittered backoff
+    while there is time left before `deadline`.
+
+    Parameters:
+        fn (callable): Makes the call; receives the seconds left before the deadline.
+        breaker (CircuitBreaker): The service's breaker.
+        deadline (float): time.monotonic() value by which the call must be over.
+        retries (int): Retries after the first attempt.
+        retry_on (tuple): Exceptions meaning the service failed. Other exceptions are
+            raised as they are, and count as the service having answered.
+
+    Returns:
+        The result of `fn`.
+
+    Raises:
+        UpstreamUnavailable: If the circuit is open, the deadline passed or the retries ran out.
+    """
+    attempt = 0
+    while True:
+        remaining = _remaining(breaker, deadline)
+        try:
+            result = fn(remaining)
+        except retry_on as e:
+            time.sleep(_next_delay(breaker, attempt, retries, deadline, e))
+            attempt += 1
+            continue
+        except Exception:
+            breaker.record_success()
+            raise
+        except BaseException:
+            breaker.abandon()
+            raise
+        breaker.record_success()
+        return result
+
+
+async def call_async(fn, breaker, deadline, retries=2, retry_on=(Exception,)):
+    """
+    Async counterpart of `call`; `fn(timeout)` returns an awaitable, which is also cancelled
+    if it outlasts the deadline.
+    """
+    attempt = 0
+    while True:
+        remaining = _remaining(breaker, deadline)
+        try:
+            result = await asyncio.wait_for(fn(remaining), remaining)
+        except (asyncio.TimeoutError, *retry_on) as e:
+            await asyncio.sleep(_next_delay(breaker, attempt, retries, deadline, e))
+            attempt += 1
+            continue
+        except Exception:
+            breaker.record_success()
+            raise
+        except BaseException:
+            breaker.abandon()
+            raise
+        breaker.record_success()
+        return result
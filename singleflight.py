@@ -0,0 +1,253 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from resilience import UpstreamUnavailable
+
+
+def result_ttl(ttl, result):
+    """
+    Returns the cache lifetime of a result, for a TTL given as a number or as a function of the result.
+    """
+    return ttl(result) if callable(ttl) else ttl
+
+
+def check_deadline(deadline, key):
+    """
+    Raises UpstreamUnavailable once `deadline` (a time.monotonic() value, or None for none) has passed.
+    """
+    if deadline is not None and time.monotonic() >= deadline:
+        raise UpstreamUnavailable(f"Timed out waiting for {key}")
+
+
+def remaining(deadline):
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls so that only one of them does the work.
+
+    Within a worker, threads or coroutines asking for a key that is already being computed
+    wait for that computation and share its result. Across workers, a lease in the shared AI cache elects
+    one process to compute the key; the others poll the cache until its result appears.
+    """
+
+    def __init__(self, cache=None, lease_seconds=60, poll_interval=0.05):
+        """
+        Initializes the coalescer.
+
+        Parameters:
+            cache (AICache): Shared cache used for cross-worker leases and results. Without it,
+                calls are only coalesced within this process.
+            lease_seconds (float): How long another worker waits before assuming the leader died.
+            poll_interval (float): Seconds between cache checks while waiting on another worker.
+        """
+        self.cache = cache
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._token = uuid.uuid4().hex
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def owner(self):
+        # Includes the PID so that workers forked from one preloaded app hold distinct leases
+        return f'{self._token}-{os.getpid()}'
+
+    def do(self, key, fn, ttl=None, deadline=None):
+        """
+        Returns the result of `fn()` for `key`, calling it at most once across concurrent callers.
+
+        Parameters:
+            key (str): The cache key identifying the call.
+            fn (callable): Computes the value; its result is stored in the cache under `key`.
+            ttl (float): Cache lifetime of the result, defaulting to the cache's TTL; or a
+                function of the result returning it.
+            deadline (float): time.monotonic() value after which a caller stops waiting on another
+                one's call, or does not start its own, and raises UpstreamUnavailable; None for no limit.
+
+        Returns:
+            The value computed by `fn`, or by whichever caller computed it first.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            return self._wait(call, key, deadline)
+
+        try:
+            call.result = self._do_across_workers(key, fn, ttl, deadline)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, fn, ttl=None, deadline=None):
+        """
+        Streaming counterpart of `do`, for text produced in chunks.
+
+        The caller doing the work receives the chunks as they arrive. Callers coalesced onto a
+        call already in flight, here or in another worker, receive the whole text as one chunk.
+
+        Parameters:
+            key (str): The cache key identifying the call.
+            fn (callable): Returns an iterator of text chunks; their concatenation is cached.
+            ttl (float): Cache lifetime of the text, defaulting to the cache's TTL; or a
+                function of the text returning it.
+            deadline (float): As for `do`.
+
+        Yields:
+            str: Chunks of the text.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            yield self._wait(call, key, deadline)
+            return
+
+        try:
+            if self.cache is not None and not self.cache.acquire_lease(key, self.owner, self.lease_seconds):
+                # Another worker is generating this text: wait for it rather than stream a second copy
+                call.result = self._do_across_workers(key, lambda: ''.join(fn()), ttl, deadline)
+                yield call.result
+                return
+            try:
+                cached = self.cache.get(key) if self.cache is not None else None
+                if cached is not None:
+                    call.result = cached
+                    yield cached
+                    return
+                check_deadline(deadline, key)
+                chunks = []
+                for chunk in fn():
+                    chunks.append(chunk)
+                    yield chunk
+                call.result = ''.join(chunks)
+                if self.cache is not None:
+                    self.cache.set(key, call.result, ttl=result_ttl(ttl, call.result))
+            finally:
+                if self.cache is not None:
+                    self.cache.release_lease(key, self.owner)
+        except BaseException as e:
+            # Includes GeneratorExit, when the client disconnects before the text is complete
+            call.error = e if isinstance(e, Exception) else RuntimeError('Stream was interrupted')
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _wait(self, call, key, deadline):
+        if not call.done.wait(remaining(deadline)):
+            raise UpstreamUnavailable(f"Timed out waiting for {key}")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key, fn, ttl=None, deadline=None):
+        """
+        Async counterpart of `do`, for coroutines running on a single event loop.
+
+        Parameters:
+            key (str): The cache key identifying the call.
+            fn (callable): A coroutine function computing the value.
+            ttl (float): Cache lifetime of the result, defaulting to the cache's TTL; or a
+                function of the result returning it.
+            deadline (float): time.monotonic() value after which a caller stops waiting on another
+                one's call, or does not start its own, and raises UpstreamUnavailable; None for no limit.
+
+        Returns:
+            The value computed by `fn`, or by whichever caller computed it first.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(self._do_across_workers_async(key, fn, ttl, deadline))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # Waited on rather than awaited, so that one caller giving up or being cancelled does
+        # not cancel the call for the others
+        done, _ = await asyncio.wait([task], timeout=remaining(deadline))
+        if not done:
+            raise UpstreamUnavailable(f"Timed out waiting for {key}")
+        return task.result()
+
+    def _do_across_workers(self, key, fn, ttl, deadline):
+        if self.cache is None:
+            return fn()
+
+        while True:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            if self.cache.acquire_lease(key, self.owner, self.lease_seconds):
+                break
+            # Another worker is computing this key: wait for its result or for its lease to lapse
+            while self.cache.lease_active(key):
+                check_deadline(deadline, key)
+                time.sleep(self.poll_interval)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+        try:
+            # The previous leader may have finished between our cache check and taking the lease
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            check_deadline(deadline, key)
+            result = fn()
+            self.cache.set(key, result, ttl=result_ttl(ttl, result))
+            return result
+        finally:
+            self.cache.release_lease(key, self.owner)
+
+    async def _do_across_workers_async(self, key, fn, ttl, deadline):
+        if self.cache is None:
+            return await fn()
+
+        # The cache and its leases live in SQLite, so they are read and written in a thread
+        # rather than blocking every other coroutine on the loop
+        while True:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+            if await asyncio.to_thread(self.cache.acquire_lease, key, self.owner, self.lease_seconds):
+                break
+            while await asyncio.to_thread(self.cache.lease_active, key):
+                check_deadline(deadline, key)
+                await asyncio.sleep(self.poll_interval)
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    return cached
+
+        try:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+            check_deadline(deadline, key)
+            result = await fn()
+            await asyncio.to_thread(self.cache.set, key, result, result_ttl(ttl, result))
+            return result
+        finally:
+            await asyncio.to_thread(self.cache.release_lease, key, self.owner)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from ai_cache import AICache, favorites_key
+
+
+class AICacheTestCase(unittest.TestCase):
+    """
+    Unit tests for the two-tier (in-process + shared SQLite) AI response cache.
+    """
+
+    def setUp(self):
+        """
+        Creates a cache backed by a throwaway SQLite file.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.cache = AICache(self.db_file)
+
+    def tearDown(self):
+        self.cache.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_favorites_key_is_canonical(self):
+        """
+        Order, case, extra whitespace and duplicates of the favorites do not change the key.
+        """
+        self.assertEqual(favorites_key(['Heat', 'The  Matrix'], 'm'),
+                         favorites_key(['the matrix', 'HEAT', 'Heat'], 'm'))
+        self.assertNotEqual(favorites_key(['Heat'], 'm'), favorites_key(['Heat', 'Alien'], 'm'))
+        self.assertNotEqual(favorites_key(['Heat'], 'm'), favorites_key(['Heat'], 'other-model'))
+
+    def test_entries_are_shared_through_sqlite(self):
+        """
+        A value written by one cache instance (worker) is read by another through the SQLite tier.
+        """
+        self.cache.set('k', 'Watch Alien.')
+        other = AICache(self.db_file)
+        try:
+            self.assertEqual(other.get('k'), 'Watch Alien.')
+            self.assertIsNone(other.get('missing'))
+        finally:
+            other.close()
+
+    def test_get_many_reads_both_tiers(self):
+        """
+        Several keys are looked up at once, from memory or from SQLite, leaving out missing and expired ones.
+        """
+        self.cache.set('a', 'Alien')
+        other = AICache(self.db_file)
+        other.set('b', 'Heat')
+        other.set('c', 'Thief', ttl=-1)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'd', 'b']), {'a': 'Alien', 'b': 'Heat'})
+        self.assertEqual(self.cache.memory.get('b')[0], 'Heat')
+        other.close()
+
+    def test_expired_entries_are_misses(self):
+        """
+        Entries past their TTL are not returned from either tier.
+        """
+        self.cache.set('k', 'stale', ttl=-1)
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_prune_keeps_newest_entries(self):
+        """
+        Pruning trims the SQLite tier to `max_entries`, dropping the oldest entries.
+        """
+        self.cache.max_entries = 3
+        self.cache.PRUNE_EVERY = 5
+        for i in range(5):
+            self.cache.set(f'k{i}', i)
+        self.assertEqual(self.cache.stats()['entries'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
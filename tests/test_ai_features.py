@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+import unittest
+
+import httpx
+
+from ai_cache import AICache
+from ai_features import TRAILER_NOT_FOUND, AIFeatures, cache_key, trailer_embed_url
+from resilience import UpstreamUnavailable
+
+
+class TrailerLookupTestCase(unittest.TestCase):
+    """
+    Unit tests for caching YouTube trailer searches and enriching new movies.
+    """
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.cache = AICache(self.db_file)
+        self.ai = AIFeatures(cache=self.cache, trailer_ttl=1000, trailer_miss_ttl=10)
+        self.searches = []
+        self.responses = {}
+
+        def handler(request):
+            query = request.url.params['q']
+            self.searches.append(query)
+            status, body = self.responses[query]
+            return httpx.Response(status, json=body)
+
+        self.ai.http = httpx.Client(transport=httpx.MockTransport(handler))
+
+    def tearDown(self):
+        self.ai.close()
+        self.cache.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def expires_in(self, movie_name):
+        return self.cache.memory.get(cache_key('trailer', movie_name))[1] - time.time()
+
+    def test_found_and_missing_trailers_are_cached_per_title(self):
+        """
+        A found trailer is cached for the long TTL and a miss for the short one, under the normalized title.
+        """
+        self.responses['Alien trailer'] = (200, {'items': [{'id': {'videoId': 'abc123'}}]})
+        self.responses['Obscure trailer'] = (200, {'items': []})
+
+        url = self.ai.get_movie_trailer('Alien')
+        self.assertEqual(url, 'https://www.youtube.com/watch?v=abc123')
+        self.assertEqual(self.ai.get_movie_trailer('  ALIEN '), url)
+        self.assertEqual(trailer_embed_url(url), 'https://www.youtube.com/embed/abc123')
+        self.assertGreater(self.expires_in('Alien'), 900)
+
+        self.assertEqual(self.ai.get_movie_trailer('Obscure'), TRAILER_NOT_FOUND)
+        self.assertIsNone(trailer_embed_url(TRAILER_NOT_FOUND))
+        self.assertLess(self.expires_in('Obscure'), 11)
+        self.assertEqual(self.searches, ['Alien trailer', 'Obscure trailer'])
+
+    def test_youtube_errors_are_not_cached(self):
+        """
+        A quota error is raised rather than cached as "Trailer not found.", so the next view searches again.
+        """
+        self.responses['Alien trailer'] = (403, {'error': {'errors': [{'reason': 'quotaExceeded'}]}})
+        with self.assertRaises(UpstreamUnavailable):
+            self.ai.get_movie_trailer('Alien')
+        self.assertIsNone(self.ai.cached('trailer', 'Alien', allow_stale=True))
+
+        self.responses['Alien trailer'] = (200, {'items': [{'id': {'videoId': 'abc123'}}]})
+        self.assertEqual(self.ai.get_movie_trailer('Alien'), 'https://www.youtube.com/watch?v=abc123')
+        self.assertEqual(len(self.searches), 2)
+
+    def test_enrichment_fetches_only_what_is_missing(self):
+        """
+        Enriching a movie fills in its uncached review, trivia and trailer, and a second run fetches nothing.
+        """
+        self.responses['Alien trailer'] = (200, {'items': [{'id': {'videoId': 'abc123'}}]})
+        self.cache.set(cache_key('review', 'Alien'), 'A classic.')
+        self.ai._chat = lambda kind, subject, deadline: f'{kind} of {subject}'
+
+        self.assertEqual(self.ai.enrich_movie('Alien', ttl=1000), ['trivia', 'trailer'])
+        self.assertEqual(self.ai.cached('trivia', 'alien'), 'trivia of Alien')
+        self.assertGreater(self.expires_in('Alien'), 900)
+        self.assertEqual(self.ai.enrich_movie('Alien'), [])
+        self.assertEqual(self.searches, ['Alien trailer'])
+
+
+if __name__ == '__main__':
+    unittest.main()
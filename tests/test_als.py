@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from als import ALSRecommender, train_als
+from data_manager import DataManager
+
+
+class ALSRecommenderTestCase(unittest.TestCase):
+    """
+    Unit tests for the matrix-factorization recommender, trained on a throwaway database.
+    """
+
+    def setUp(self):
+        """
+        Creates two groups of users with different tastes.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.model_dir = tempfile.mkdtemp()
+        self.data_manager = DataManager(self.db_file)
+        self.data_manager.migrate()
+        sci_fi = ['Alien', 'Aliens', 'Blade Runner', 'The Thing']
+        crime = ['Heat', 'Thief', 'Collateral', 'Ronin']
+        movies = []
+        for user_id in range(1, 9):
+            self.data_manager.add_user(f'User {user_id}')
+            titles = sci_fi if user_id <= 4 else crime
+            # Each user misses one title of their group
+            movies += [(title, 'Director', 1980, 8, user_id) for title in titles if title != titles[user_id % 4]]
+        self.data_manager.add_movies(movies)
+
+    def tearDown(self):
+        self.data_manager.close()
+        os.remove(self.db_file)
+        shutil.rmtree(self.model_dir)
+
+    def test_recommends_titles_liked_by_similar_users(self):
+        """
+        Factors trained in a process pool recommend the title a user is missing from their group.
+        """
+        recommender = ALSRecommender(self.model_dir, check_interval=0)
+        self.assertIsNone(recommender.recommend(['Alien']))
+
+        meta = train_als(self.data_manager, self.model_dir, factors=4, iterations=10, workers=2)
+        self.assertEqual((meta['users'], meta['items']), (8, 8))
+        recommendations = recommender.recommend(['Alien', 'Aliens', 'Blade Runner'], k=1)
+        self.assertEqual(recommendations[0][0], 'The Thing')
+        recommendations = recommender.recommend(self.data_manager.get_movies_by_user(5), k=1)
+        self.assertEqual(recommendations[0][0], 'Thief')
+
+
+if __name__ == '__main__':
+    unittest.main()
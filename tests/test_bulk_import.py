@@ -0,0 +1,113 @@
+import io
+import os
+import tempfile
+import unittest
+
+import bulk_import
+import migrations
+from data_manager import DataManager
+
+
+class BulkImportTestCase(unittest.TestCase):
+    """
+    Unit tests for the chunked CSV / JSON Lines movie import.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with two users to import movies for.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.data_manager = DataManager(self.db_file)
+        self.data_manager.migrate()
+        self.data_manager.add_user('Alice')
+        self.data_manager.add_user('Bob')
+
+    def tearDown(self):
+        self.data_manager.close()
+        os.remove(self.db_file)
+
+    def test_csv_import_rejects_invalid_rows(self):
+        """
+        Valid rows are inserted across several chunks and invalid ones are reported.
+        """
+        stream = io.StringIO(
+            'name,director,year,rating,user_id\n'
+            'Inception,Christopher Nolan,2010,9.0,1\n'
+            'Heat,Michael Mann,1995,8.5,2\n'
+            ',Nobody,2000,5,1\n'
+            'Alien,Ridley Scott,1979,eleven,1\n'
+            'Ghost,Someone,1990,6,99\n'
+            'Up,Pete Docter,2009,8.3,\n'
+        )
+        stats = bulk_import.import_movies(self.data_manager, stream, 'csv', user_id=2, chunk_size=2)
+        self.assertEqual((stats.inserted, stats.rejected), (3, 3))
+        self.assertEqual(stats.user_ids, {1, 2})
+        self.assertEqual([m.name for m in self.data_manager.get_movies_by_user(2)], ['Heat', 'Up'])
+
+    def test_jsonl_import_with_deferred_indexes(self):
+        """
+        JSON Lines input loads correctly, and the movie indexes and search triggers are rebuilt afterwards.
+        """
+        stream = io.StringIO(
+            '{"name": "Inception", "director": "Christopher Nolan", "year": 2010, "rating": 9.0}\n'
+            'not json\n'
+            '{"name": "Heat", "year": 1995, "rating": 8.5, "user_id": 2}\n'
+        )
+        stats = bulk_import.import_movies(self.data_manager, stream, 'jsonl', user_id=1, defer_indexes=True)
+        self.assertEqual((stats.inserted, stats.rejected), (2, 1))
+        with self.data_manager.connection() as conn:
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        self.assertTrue(set(migrations.MOVIE_INDEXES) <= indexes)
+        self.assertTrue(set(migrations.MOVIE_FTS_TRIGGERS) <= triggers)
+        # The search index was rebuilt over the rows loaded without triggers
+        self.assertEqual([m.name for m in self.data_manager.search_movies('nolan')[0]], ['Inception'])
+        # Imported movies are not logged as changes, but later ones are
+        self.assertEqual(self.data_manager.latest_movie_change(), 0)
+        self.data_manager.add_movie('Heat', 'Michael Mann', 1995, 8.5, 1)
+        self.assertEqual(len(self.data_manager.search_movies('heat')[0]), 2)
+        self.assertEqual(self.data_manager.latest_movie_change(), 1)
+
+    def test_deferred_import_recomputes_user_stats(self):
+        """
+        Statistics of users who received movies are recomputed after a deferred import, counting
+        their existing movies too, and the triggers maintain them again afterwards.
+        """
+        self.data_manager.add_movie('Alien', 'Ridley Scott', 1979, 8.5, 1)
+        stream = io.StringIO(
+            'name,director,year,rating,user_id\n'
+            'Blade Runner,Ridley Scott,1982,8.1,1\n'
+            'Heat,Michael Mann,1995,8.5,1\n'
+        )
+        bulk_import.import_movies(self.data_manager, stream, 'csv', defer_indexes=True)
+        self.data_manager.add_movie('Thief', 'Michael Mann', 1981, 7.4, 1)
+        stats = self.data_manager.get_user_stats(1)
+        self.assertEqual(stats['movie_count'], 4)
+        self.assertEqual(stats['rating_histogram'][8], 3)
+        self.assertCountEqual(stats['top_directors'], [{'director': 'Michael Mann', 'movie_count': 2},
+                                                       {'director': 'Ridley Scott', 'movie_count': 2}])
+        self.assertEqual(self.data_manager.get_user_stats(2)['movie_count'], 0)
+
+
+    def test_indexes_are_deferred_for_large_imports_by_default(self):
+        """
+        Without `defer_indexes`, only imports of at least `defer_min_rows` valid rows defer the
+        indexes and triggers; smaller ones log their movies as changes through the triggers.
+        """
+        rows = 'name,director,year,rating,user_id\nHeat,Michael Mann,1995,8.5,1\nUp,Pete Docter,2009,8.3,1\n'
+        stats = bulk_import.import_movies(self.data_manager, io.StringIO(rows), 'csv', defer_min_rows=3)
+        self.assertEqual((stats.inserted, stats.deferred_indexes), (2, False))
+        self.assertEqual(self.data_manager.latest_movie_change(), 2)
+
+        stats = bulk_import.import_movies(self.data_manager, io.StringIO(rows + 'Alien,Ridley Scott,1979,8.5,2\n'),
+                                          'csv', chunk_size=2, defer_min_rows=3)
+        self.assertEqual((stats.inserted, stats.deferred_indexes), (3, True))
+        self.assertEqual(self.data_manager.latest_movie_change(), 2)
+        self.assertEqual(self.data_manager.get_user_stats(1)['movie_count'], 4)
+        self.assertEqual([m.name for m in self.data_manager.search_movies('scott')[0]], ['Alien'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from cache import LRUCache, estimate_size
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    """
+    Unit tests for the size-bounded, tag-invalidated LRU cache.
+    """
+
+    def test_hits_and_misses_are_counted(self):
+        """
+        Lookups are counted as hits or misses.
+        """
+        cache = LRUCache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_evicts_least_recently_used_within_byte_budget(self):
+        """
+        When the byte budget is exceeded the least recently used entry is evicted.
+        """
+        value = 'x' * 1000
+        cache = LRUCache(max_bytes=estimate_size(value) * 2)
+        cache.set('a', value)
+        cache.set('b', value)
+        cache.get('a')
+        cache.set('c', value)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), value)
+        self.assertLessEqual(cache.stats()['bytes'], cache.max_bytes)
+
+    def test_invalidate_by_tag(self):
+        """
+        Invalidating a tag drops exactly the entries carrying it.
+        """
+        cache = LRUCache()
+        cache.set(('movies', 1), [1], tags=[('movies', 1)])
+        cache.set(('movies', 2), [2], tags=[('movies', 2)])
+        cache.invalidate(('movies', 1))
+        self.assertIsNone(cache.get(('movies', 1)))
+        self.assertEqual(cache.get(('movies', 2)), [2])
+
+    def test_entries_expire_after_ttl(self):
+        """
+        Entries older than the TTL are treated as misses.
+        """
+        cache = LRUCache(ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from connection_pool import ConnectionPool, PoolClosedError
+from data_manager import DataManager
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    """
+    Unit tests for the pooled SQLite connections used by the DataManager.
+    """
+
+    def setUp(self):
+        """
+        Creates a pool over a throwaway database file.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.pool = ConnectionPool(self.db_file, max_size=2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close()
+        os.remove(self.db_file)
+
+    def test_released_connection_is_reused(self):
+        """
+        A released connection is handed out again instead of opening a new one.
+        """
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire(), conn)
+
+    def test_pool_is_bounded(self):
+        """
+        Once `max_size` connections are checked out, further checkouts time out.
+        """
+        self.pool.acquire()
+        self.pool.acquire()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool.acquire()
+
+    def test_waiter_gets_released_connection(self):
+        """
+        A thread waiting on an exhausted pool receives the next released connection.
+        """
+        self.pool.timeout = 2
+        first = self.pool.acquire()
+        self.pool.acquire()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.pool.acquire()))
+        waiter.start()
+        self.pool.release(first)
+        waiter.join()
+        self.assertEqual(result, [first])
+
+    def test_broken_connection_is_replaced(self):
+        """
+        A connection that fails its health check is discarded rather than reused.
+        """
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        conn.close()
+        replacement = self.pool.acquire()
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(replacement.execute('SELECT 1').fetchone(), (1,))
+
+    def test_closed_pool_rejects_checkouts(self):
+        """
+        Closing the pool closes idle connections and refuses new checkouts.
+        """
+        self.pool.release(self.pool.acquire())
+        self.pool.close()
+        with self.assertRaises(PoolClosedError):
+            self.pool.acquire()
+
+    def test_bound_connection_is_shared_by_data_manager_calls(self):
+        """
+        While a connection is bound, every DataManager call on the thread uses it.
+        """
+        data_manager = DataManager(self.db_file, pool_size=1)
+        data_manager.migrate()
+        data_manager.bind_connection()
+        try:
+            data_manager.add_user('Alice')
+            self.assertEqual([u.name for u in data_manager.get_all_users()], ['Alice'])
+        finally:
+            data_manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
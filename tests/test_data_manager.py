@@ -0,0 +1,180 @@
+import os
+import tempfile
+import unittest
+
+from cache import LRUCache
+from data_manager import DataManager
+
+
+class DataManagerTestCase(unittest.TestCase):
+    """
+    Unit tests for the DataManager queries, run against a throwaway database file.
+    """
+
+    def setUp(self):
+        """
+        Creates an empty database with the application's schema.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.data_manager = DataManager(self.db_file)
+        self.data_manager.migrate()
+
+    def tearDown(self):
+        self.data_manager.close()
+        os.remove(self.db_file)
+
+    def test_get_user(self):
+        """
+        Users are found by primary key, and unknown IDs return None.
+        """
+        self.data_manager.add_user('Alice')
+        self.data_manager.add_user('Bob')
+        self.assertEqual(self.data_manager.get_user(2).name, 'Bob')
+        self.assertIsNone(self.data_manager.get_user(3))
+
+    def test_users_exist(self):
+        """
+        Only the IDs of existing users are returned.
+        """
+        for name in ('Alice', 'Bob', 'Carol'):
+            self.data_manager.add_user(name)
+        self.assertEqual(self.data_manager.users_exist([1, 3, 4, 3]), {1, 3})
+        self.assertEqual(self.data_manager.users_exist(range(1, 2000)), {1, 2, 3})
+
+    def test_movies_pages_cover_library_once(self):
+        """
+        Following next_cursor walks every movie of the user exactly once, in ID order.
+        """
+        self.data_manager.add_user('Alice')
+        self.data_manager.add_user('Bob')
+        for i in range(7):
+            self.data_manager.add_movie(f'Movie {i}', 'Director', 2000 + i, 7.0, 1)
+            self.data_manager.add_movie(f'Other {i}', 'Director', 2000 + i, 7.0, 2)
+
+        seen, after = [], None
+        while True:
+            movies, after = self.data_manager.get_movies_page(1, limit=3, after=after)
+            seen.extend(movie.name for movie in movies)
+            if after is None:
+                break
+        self.assertEqual(seen, [f'Movie {i}' for i in range(7)])
+
+    def test_iter_movies_by_user_batches(self):
+        """
+        Streaming a library yields every movie in bounded batches, returning the connection between them.
+        """
+        self.data_manager.add_user('Alice')
+        for i in range(5):
+            self.data_manager.add_movie(f'Movie {i}', 'Director', 2000 + i, 7.0, 1)
+        batches = []
+        for batch in self.data_manager.iter_movies_by_user(1, batch_size=2):
+            # No connection is held while the consumer handles a batch
+            self.assertEqual(self.data_manager.pool._idle.qsize(), self.data_manager.pool._size)
+            batches.append(batch)
+        self.assertEqual([[movie.name for movie in batch] for batch in batches],
+                         [['Movie 0', 'Movie 1'], ['Movie 2', 'Movie 3'], ['Movie 4']])
+
+    def test_users_page(self):
+        """
+        The last page of users has no next cursor.
+        """
+        for name in ('Alice', 'Bob', 'Carol'):
+            self.data_manager.add_user(name)
+        users, next_cursor = self.data_manager.get_users_page(limit=2)
+        self.assertEqual([u.name for u in users], ['Alice', 'Bob'])
+        users, next_cursor = self.data_manager.get_users_page(limit=2, after=next_cursor)
+        self.assertEqual([u.name for u in users], ['Carol'])
+        self.assertIsNone(next_cursor)
+
+    def test_search_follows_writes(self):
+        """
+        Full-text search sees inserts, updates and deletes and pages through ranked results.
+        """
+        self.data_manager.add_user('Christopher')
+        for i in range(3):
+            self.data_manager.add_movie(f'Star Wars {i}', 'George Lucas', 1977 + i, 8.0, 1)
+        self.data_manager.add_movie('Inception', 'Christopher Nolan', 2010, 9.0, 1)
+
+        movies, after = self.data_manager.search_movies('star wa', limit=2)
+        more, last = self.data_manager.search_movies('star wa', limit=2, after=after)
+        self.assertEqual(len(movies) + len(more), 3)
+        self.assertIsNone(last)
+        self.assertEqual([u.name for u in self.data_manager.search_users('chris')], ['Christopher'])
+
+        inception = self.data_manager.search_movies('nolan')[0][0]
+        self.data_manager.update_movie(inception.id, 'Tenet', 'Christopher Nolan', 2020, 7.5)
+        self.assertEqual(self.data_manager.search_movies('inception'), ([], None))
+        self.data_manager.delete_movie(inception.id)
+        self.assertEqual(self.data_manager.search_movies('tenet'), ([], None))
+
+    def test_user_stats_follow_writes(self):
+        """
+        The trigger-maintained statistics match the library after inserts, updates and deletes.
+        """
+        self.data_manager.add_user('Alice')
+        self.data_manager.add_movie('Heat', 'Michael Mann', 1995, 8.4, 1)
+        self.data_manager.add_movie('Inception', 'Christopher Nolan', 2010, 9.0, 1)
+        self.data_manager.add_movie('Tenet', 'Christopher Nolan', 2020, 7.2, 1)
+        self.data_manager.add_movie('Unrated', 'Christopher Nolan', 2021, None, 1)
+
+        stats = self.data_manager.get_user_stats(1)
+        self.assertEqual(stats['movie_count'], 4)
+        self.assertEqual(stats['average_rating'], 8.2)
+        self.assertEqual(stats['top_directors'][0], {'director': 'Christopher Nolan', 'movie_count': 3})
+        self.assertEqual({b: c for b, c in stats['rating_histogram'].items() if c}, {7: 1, 8: 1, 9: 1})
+
+        heat, inception = self.data_manager.get_movies_by_user(1)[:2]
+        self.data_manager.update_movie(inception.id, 'Inception', 'Michael Mann', 2010, 6.0)
+        self.data_manager.delete_movie(heat.id)
+        stats = self.data_manager.get_user_stats(1)
+        self.assertEqual(stats['movie_count'], 3)
+        self.assertEqual(stats['average_rating'], 6.6)
+        self.assertEqual(stats['top_directors'], [{'director': 'Christopher Nolan', 'movie_count': 2},
+                                                  {'director': 'Michael Mann', 'movie_count': 1}])
+        self.assertEqual({b: c for b, c in stats['rating_histogram'].items() if c}, {6: 1, 7: 1})
+        self.assertEqual(self.data_manager.get_user_summaries([1, 2]),
+                         {1: {'movie_count': 3, 'average_rating': 6.6}})
+
+    def test_cache_is_invalidated_per_user(self):
+        """
+        Writes invalidate the cached movie lists of the affected user only.
+        """
+        self.data_manager.cache = LRUCache()
+        self.data_manager.add_user('Alice')
+        self.data_manager.add_user('Bob')
+        self.data_manager.add_movie('Heat', 'Michael Mann', 1995, 8.0, 2)
+        self.assertEqual(self.data_manager.get_movies_by_user(1), [])
+        self.assertEqual(len(self.data_manager.get_movies_by_user(2)), 1)
+
+        self.data_manager.add_movie('Inception', 'Christopher Nolan', 2010, 9.0, 1)
+        self.assertEqual([m.name for m in self.data_manager.get_movies_by_user(1)], ['Inception'])
+        self.assertEqual(len(self.data_manager.get_movies_by_user(2)), 1)
+        hits = self.data_manager.cache.hits
+        self.assertEqual(hits, 1)
+
+        movie_id = self.data_manager.get_movies_by_user(1)[0].id
+        self.data_manager.update_movie(movie_id, 'Tenet', 'Christopher Nolan', 2020, 7.5)
+        self.assertEqual([m.name for m in self.data_manager.get_movies_by_user(1)], ['Tenet'])
+        self.data_manager.delete_movie(movie_id)
+        self.assertEqual(self.data_manager.get_movies_by_user(1), [])
+
+        self.data_manager.get_all_users()
+        self.data_manager.add_user('Carol')
+        self.assertEqual(len(self.data_manager.get_all_users()), 3)
+
+    def test_movie_listeners_see_added_movies(self):
+        """
+        Listeners get each new movie with its ID, and a failing listener does not fail the insert.
+        """
+        self.data_manager.add_user('Alice')
+        added = []
+        self.data_manager.on_movie_added(lambda movie: 1 / 0)
+        self.data_manager.on_movie_added(added.append)
+        movie = self.data_manager.add_movie('Alien', 'Ridley Scott', 1979, 8.5, 1)
+        self.assertEqual(added, [movie])
+        self.assertEqual(self.data_manager.get_movies_by_user(1), [movie])
+
+
+if __name__ == '__main__':
+    unittest.main()
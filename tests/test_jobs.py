@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from jobs import DEAD, DONE, QUEUED, RUNNING, JobQueue, Worker, report_progress
+
+
+class JobQueueTestCase(unittest.TestCase):
+    """
+    Unit tests for the SQLite-backed background job queue.
+    """
+
+    def setUp(self):
+        """
+        Creates a queue backed by a throwaway SQLite file, with retries that are due at once.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.queue = JobQueue(self.db_file, max_attempts=2, backoff=0)
+
+    def tearDown(self):
+        self.queue.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_claim_and_complete(self):
+        """
+        A queued job is claimed once, and its result is visible through `get` once completed.
+        """
+        job_id = self.queue.enqueue('review', {'movie_name': 'Alien'})
+        job = self.queue.claim('w1')
+        self.assertEqual((job.id, job.kind, job.payload, job.attempts), (job_id, 'review', {'movie_name': 'Alien'}, 1))
+        self.assertIsNone(self.queue.claim('w2'))
+        self.assertEqual(self.queue.get(job_id)['status'], RUNNING)
+
+        self.assertTrue(self.queue.complete(job, 'w1', 'A classic.'))
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['result']), (DONE, 'A classic.'))
+
+    def test_pending_jobs_are_deduplicated(self):
+        """
+        Enqueueing a job whose dedupe key is already pending returns the pending job's id.
+        """
+        first = self.queue.enqueue('trivia', {'movie_name': 'Alien'}, dedupe_key='trivia:alien')
+        self.assertEqual(self.queue.enqueue('trivia', {'movie_name': 'Alien'}, dedupe_key='trivia:alien'), first)
+        self.queue.complete(self.queue.claim('w1'), 'w1', 'Fact.')
+        self.assertNotEqual(self.queue.enqueue('trivia', {'movie_name': 'Alien'}, dedupe_key='trivia:alien'), first)
+
+    def test_failed_jobs_are_retried_then_dead_lettered(self):
+        """
+        A failing job is retried until it runs out of attempts, then kept in the dead state.
+        """
+        job_id = self.queue.enqueue('review', {'movie_name': 'Alien'})
+        self.assertEqual(self.queue.fail(self.queue.claim('w1'), 'w1', 'rate limited'), QUEUED)
+        job = self.queue.claim('w1')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.queue.fail(job, 'w1', 'rate limited'), DEAD)
+        self.assertIsNone(self.queue.claim('w1'))
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['error'], job['attempts']), (DEAD, 'rate limited', 2))
+
+    def test_expired_lease_is_taken_over(self):
+        """
+        A job whose worker stopped responding is claimed again once its lease expires.
+        """
+        self.queue.lease_seconds = 0
+        job_id = self.queue.enqueue('review', {'movie_name': 'Alien'})
+        lost = self.queue.claim('w1')
+        job = self.queue.claim('w2')
+        self.assertEqual((job.id, job.attempts), (job_id, 2))
+        self.assertFalse(self.queue.complete(lost, 'w1', 'late'))
+
+    def test_progress_is_reported_while_the_job_runs(self):
+        """
+        A handler's progress reports are visible through `get` until the job completes, and are
+        ignored outside a job.
+        """
+        report_progress('Nothing to report')
+        job_id = self.queue.enqueue('review', {'movie_name': 'Alien'})
+        seen = []
+
+        def review(payload):
+            report_progress('A cla')
+            seen.append(self.queue.get(job_id)['progress'])
+            return 'A classic.'
+
+        worker = Worker(self.queue, {'review': review}, poll_interval=0.01)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        deadline = time.time() + 5
+        while time.time() < deadline and self.queue.get(job_id)['status'] != DONE:
+            time.sleep(0.01)
+        worker.stop()
+        thread.join()
+
+        self.assertEqual(seen, ['A cla'])
+        job = self.queue.get(job_id)
+        self.assertEqual((job['result'], job['progress']), ('A classic.', None))
+
+    def test_worker_runs_jobs(self):
+        """
+        The worker runs queued jobs with their handler and records failures.
+        """
+        ok = self.queue.enqueue('review', {'movie_name': 'Alien'})
+        unknown = self.queue.enqueue('poster', {'movie_name': 'Alien'})
+        worker = Worker(self.queue, {'review': lambda payload: f"Review of {payload['movie_name']}"},
+                        max_workers=2, poll_interval=0.01)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        deadline = time.time() + 5
+        while time.time() < deadline and self.queue.counts().get(QUEUED, 0) + self.queue.counts().get(RUNNING, 0):
+            time.sleep(0.01)
+        worker.stop()
+        thread.join()
+
+        self.assertEqual(self.queue.get(ok)['result'], 'Review of Alien')
+        self.assertEqual(self.queue.get(unknown)['status'], DEAD)
+
+
+if __name__ == '__main__':
+    unittest.main()
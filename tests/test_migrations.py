@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import migrations
+
+
+class MigrationsTestCase(unittest.TestCase):
+    """
+    Unit tests for the versioned schema migrations and the indexes they create.
+    """
+
+    def setUp(self):
+        """
+        Opens a connection to an empty throwaway database.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.conn = sqlite3.connect(self.db_file)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_file)
+
+    def query_plan(self, sql, params=()):
+        """
+        Returns the EXPLAIN QUERY PLAN details of `sql` as a single string.
+        """
+        rows = self.conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        return ' | '.join(row[-1] for row in rows)
+
+    def test_upgrade_applies_each_migration_once(self):
+        """
+        A fresh database is brought to the latest version, and re-running is a no-op.
+        """
+        applied = migrations.upgrade(self.conn)
+        self.assertEqual(applied, [version for version, _, _ in migrations.MIGRATIONS])
+        self.assertEqual(migrations.current_version(self.conn), migrations.LATEST_VERSION)
+        self.assertEqual(migrations.upgrade(self.conn), [])
+
+    def test_suspended_triggers_are_recreated_as_migrated(self):
+        """
+        The trigger and index definitions bulk imports drop and recreate match those the migrations created.
+        """
+        migrations.upgrade(self.conn)
+        definitions = {**migrations.MOVIE_INDEXES, **migrations.MOVIE_FTS_TRIGGERS,
+                       **migrations.MOVIE_STATS_TRIGGERS, **migrations.MOVIE_CHANGE_TRIGGERS}
+        placeholders = ', '.join('?' * len(definitions))
+
+        def schema():
+            return self.conn.execute(f'SELECT name, sql FROM sqlite_master WHERE name IN ({placeholders})',
+                                     list(definitions)).fetchall()
+
+        migrated = sorted(schema())
+        self.assertEqual([name for name, _ in migrated], sorted(definitions))
+        for name in migrations.MOVIE_INDEXES:
+            self.conn.execute(f'DROP INDEX {name}')
+        for name in definitions.keys() - migrations.MOVIE_INDEXES.keys():
+            self.conn.execute(f'DROP TRIGGER {name}')
+        for statement in definitions.values():
+            self.conn.execute(statement)
+        self.assertEqual(sorted(schema()), migrated)
+
+    def test_upgrade_adopts_existing_database(self):
+        """
+        A database created before migrations existed keeps its data when upgraded.
+        """
+        self.conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL)')
+        self.conn.execute('INSERT INTO users (name) VALUES (?)', ('Alice',))
+        self.conn.commit()
+        self.assertEqual(migrations.current_version(self.conn), 0)
+        migrations.upgrade(self.conn)
+        self.assertEqual(self.conn.execute('SELECT name FROM users').fetchall(), [('Alice',)])
+
+    def test_upgrade_to_target(self):
+        """
+        Migrations stop at the requested target version.
+        """
+        self.assertEqual(migrations.upgrade(self.conn, target=1), [1])
+        self.assertEqual(migrations.current_version(self.conn), 1)
+
+    def test_movies_by_user_uses_index(self):
+        """
+        Loading a user's movies is an index search rather than a full table scan.
+        """
+        migrations.upgrade(self.conn)
+        plan = self.query_plan('SELECT * FROM movies WHERE user_id = ?', (1,))
+        self.assertIn('USING INDEX idx_movies_user', plan)
+        self.assertNotIn('SCAN movies', plan)
+
+    def test_movies_page_uses_index(self):
+        """
+        A keyset page of a user's movies seeks into the user index instead of sorting or skipping rows.
+        """
+        migrations.upgrade(self.conn)
+        plan = self.query_plan(
+            'SELECT * FROM movies WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?', (1, 100, 50)
+        )
+        self.assertIn('USING INDEX idx_movies_user_id (user_id=? AND rowid>?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_movies_by_rating_uses_index(self):
+        """
+        A user's movies ordered by rating come straight from the (user_id, rating) index.
+        """
+        migrations.upgrade(self.conn)
+        plan = self.query_plan('SELECT * FROM movies WHERE user_id = ? ORDER BY rating DESC', (1,))
+        self.assertIn('USING INDEX idx_movies_user_rating', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_movies_by_year_uses_index(self):
+        """
+        A user's movies ordered by year come straight from the (user_id, year) index.
+        """
+        migrations.upgrade(self.conn)
+        plan = self.query_plan('SELECT * FROM movies WHERE user_id = ? ORDER BY year', (1,))
+        self.assertIn('USING INDEX idx_movies_user_year', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
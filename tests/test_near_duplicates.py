@@ -0,0 +1,79 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from ai_cache import AICache
+from ai_features import AIFeatures, AsyncAIFeatures
+from near_duplicates import NearDuplicateCache, jaccard, minhash_signature
+
+
+class NearDuplicateCacheTestCase(unittest.TestCase):
+    """
+    Unit tests for reusing recommendations cached for similar favorites.
+    """
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.cache = AICache(self.db_file)
+        self.favorites = [f'Movie {i}' for i in range(20)]
+
+    def tearDown(self):
+        self.cache.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_signatures_estimate_jaccard_similarity(self):
+        """
+        Signatures of the same titles agree, and agree on about as many positions as the sets overlap.
+        """
+        a = {f'movie {i}' for i in range(100)}
+        b = {f'movie {i}' for i in range(20, 120)}
+        np.testing.assert_array_equal(minhash_signature(a), minhash_signature(sorted(a)))
+        estimate = float(np.mean(minhash_signature(a, 256) == minhash_signature(b, 256)))
+        self.assertAlmostEqual(estimate, jaccard(a, b), delta=0.1)
+
+    def test_similar_favorites_reuse_a_cached_response(self):
+        """
+        Favorites differing by one title of twenty (0.905 similar) hit at 0.8 but not at 0.95.
+        """
+        self.cache.set('recommendations:a', 'Watch Alien.')
+        NearDuplicateCache(self.cache).add('recommendations:a', self.favorites)
+        similar = [*self.favorites[:-1], 'Another movie']
+
+        near = NearDuplicateCache(self.cache, threshold=0.8)
+        self.assertEqual(near.get([title.upper() for title in similar]), 'Watch Alien.')
+        self.assertIsNone(near.get(['Unrelated']))
+        self.assertIsNone(NearDuplicateCache(self.cache, threshold=0.95).get(similar))
+
+        stats = near.stats()
+        self.assertEqual((stats['lookups'], stats['hits']), (2, 1))
+        self.assertEqual(stats['hit_rate_by_threshold']['0.8'], 0.5)
+        self.assertEqual(stats['hit_rate_by_threshold']['1.0'], 0.0)
+
+    def test_async_lookup_runs_off_the_event_loop(self):
+        """
+        The async client answers from the near-duplicate cache like the sync one, reading SQLite in a thread.
+        """
+        self.cache.set('recommendations:a', 'Watch Alien.')
+        near = NearDuplicateCache(self.cache, threshold=0.8)
+        near.add('recommendations:a', self.favorites)
+        lookups = []
+        get = near.get
+        near.get = lambda titles: lookups.append(threading.current_thread()) or get(titles)
+        similar = [*self.favorites[:-1], 'Another movie']
+
+        async_ai = AsyncAIFeatures(cache=self.cache, similar=near, prompt_token_budget=None)
+        self.assertEqual(async_ai.run(async_ai.get_movie_recommendations(similar)), ['Watch Alien.'])
+        self.assertNotEqual(lookups[0].name, 'ai-event-loop')
+        async_ai.close()
+        self.assertEqual(AIFeatures(cache=self.cache, similar=near, prompt_token_budget=None)
+                         .get_movie_recommendations(similar), 'Watch Alien.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from data_manager import Movie
+from prompt_builder import estimate_tokens, select_favorites
+
+
+def movie(name, director, year, rating):
+    return Movie(None, name, director, year, rating, 1)
+
+
+class PromptBuilderTestCase(unittest.TestCase):
+    """
+    Unit tests for selecting the favorites sent in a recommendations prompt.
+    """
+
+    def test_selection_fits_the_budget_and_reports_savings(self):
+        """
+        The selected titles stay within the budget, and the rest of the library counts as saved.
+        """
+        movies = [movie(f'Movie number {i}', f'Director {i % 50}', 1950 + i % 70, i % 10) for i in range(2000)]
+        selection = select_favorites(movies, 200)
+        self.assertLessEqual(selection.tokens, 200)
+        self.assertGreater(len(selection.titles), 20)
+        self.assertEqual(selection.total, 2000)
+        self.assertEqual(selection.saved_tokens, selection.full_tokens - selection.tokens)
+        self.assertEqual(selection.full_tokens, estimate_tokens(', '.join(m.name for m in movies)))
+
+    def test_duplicates_keep_the_best_rated_copy(self):
+        """
+        Titles differing only in case or spacing are sent once.
+        """
+        movies = [movie('Alien', 'Ridley Scott', 1979, 6), movie('alien ', 'Ridley Scott', 1979, 9),
+                  movie('Heat', 'Michael Mann', 1995, 7)]
+        self.assertEqual(select_favorites(movies, None).titles, ('alien ', 'Heat'))
+
+    def test_directors_and_decades_take_turns(self):
+        """
+        A prolific director does not crowd out the best movies of other directors and decades.
+        """
+        movies = [movie(f'Kubrick {i}', 'Stanley Kubrick', 1960 + i, 10) for i in range(5)]
+        movies += [movie('Alien', 'Ridley Scott', 1979, 8), movie('Heat', 'Michael Mann', 1995, 7)]
+        titles = select_favorites(movies, estimate_tokens('Kubrick 0') * 3 + 3).titles
+        self.assertEqual(titles, ('Kubrick 0', 'Alien', 'Heat'))
+
+    def test_plain_titles_keep_their_order(self):
+        """
+        Movie names without ratings are taken in the order given.
+        """
+        self.assertEqual(select_favorites(['Ran', 'Heat', 'Alien'], None).titles, ('Ran', 'Heat', 'Alien'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from rate_limit import BACKGROUND, RateLimiter, RateLimitTimeout, priority
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    """
+    Unit tests for the cross-process AI rate limiter.
+    """
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.limiters = []
+
+    def tearDown(self):
+        for limiter in self.limiters:
+            limiter.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def limiter(self, **kwargs):
+        limiter = RateLimiter(self.db_file, **kwargs)
+        self.limiters.append(limiter)
+        return limiter
+
+    def test_requests_and_tokens_are_limited_across_limiters(self):
+        """
+        Two limiters over one file, standing in for two workers, share both buckets.
+        """
+        first = self.limiter(requests_per_minute=2, tokens_per_minute=100)
+        second = self.limiter(requests_per_minute=2, tokens_per_minute=100)
+        first.acquire(80)
+        with self.assertRaises(RateLimitTimeout):
+            second.acquire(50, timeout=0.1)
+        # The call used fewer tokens than it reserved, which are given back
+        first.settle(80, 20)
+        second.acquire(50, timeout=0.1)
+        with self.assertRaises(RateLimitTimeout):
+            first.acquire(1, timeout=0.1)
+
+    def test_async_waiters_poll_off_the_event_loop(self):
+        """
+        An async caller waits its turn like a sync one, but its SQLite transactions run in threads.
+        """
+        limiter = self.limiter(requests_per_minute=120, tokens_per_minute=100_000)
+        for _ in range(120):
+            limiter.acquire(1)
+        threads = set()
+        try_acquire = limiter._try_acquire
+        limiter._try_acquire = lambda *args: (threads.add(threading.current_thread()), try_acquire(*args))[1]
+
+        async def main():
+            waited = await limiter.acquire_async(1, timeout=5)
+            return waited, threading.current_thread()
+
+        waited, loop_thread = asyncio.run(main())
+        self.assertGreater(waited, 0.3)
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_interactive_calls_go_ahead_of_background_ones(self):
+        """
+        Once capacity frees up, an interactive caller that arrived later is served first.
+        """
+        limiter = self.limiter(requests_per_minute=120, tokens_per_minute=100_000)
+        for _ in range(120):
+            limiter.acquire(1)
+        served = []
+
+        def background():
+            with priority(BACKGROUND):
+                limiter.acquire(1)
+            served.append('background')
+
+        def interactive():
+            limiter.acquire(1)
+            served.append('interactive')
+
+        threads = [threading.Thread(target=background), threading.Thread(target=interactive)]
+        threads[0].start()
+        time.sleep(0.1)
+        threads[1].start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(served, ['interactive', 'background'])
+
+        waits = limiter.stats()['waits']
+        self.assertEqual(waits['interactive']['count'], 121)
+        self.assertEqual(waits['background']['count'], 1)
+        self.assertGreater(waits['background']['sum'], waits['interactive']['sum'])
+
+
+if __name__ == '__main__':
+    unittest.main()
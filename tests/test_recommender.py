@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from data_manager import DataManager
+from recommender import ItemRecommender, build_item_index, current_version
+
+
+class ItemRecommenderTestCase(unittest.TestCase):
+    """
+    Unit tests for the local item-item recommender, built from a throwaway database.
+    """
+
+    def setUp(self):
+        """
+        Creates three users whose libraries overlap, and an empty model directory.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.model_dir = tempfile.mkdtemp()
+        self.data_manager = DataManager(self.db_file)
+        self.data_manager.migrate()
+        for name in ('Alice', 'Bob', 'Carol'):
+            self.data_manager.add_user(name)
+        self.data_manager.add_movies([
+            ('Alien', 'Ridley Scott', 1979, 8, 1),
+            ('Aliens', 'James Cameron', 1986, 9, 1),
+            ('alien ', 'Ridley Scott', 1979, 7, 2),
+            ('Aliens', 'James Cameron', 1986, 9, 2),
+            ('Heat', 'Michael Mann', 1995, 7, 2),
+            ('Heat', 'Michael Mann', 1995, 8, 3),
+            ('Ran', 'Akira Kurosawa', 1985, 9, 3),
+        ])
+        self.recommender = ItemRecommender(self.model_dir, check_interval=0)
+
+    def tearDown(self):
+        self.data_manager.close()
+        os.remove(self.db_file)
+        shutil.rmtree(self.model_dir)
+
+    def test_recommends_titles_shared_by_similar_users(self):
+        """
+        Titles are ranked by how often their owners also own the user's titles.
+        """
+        meta = build_item_index(self.data_manager, self.model_dir)
+        self.assertEqual((meta['users'], meta['items']), (3, 4))
+
+        titles = [title for title, score in self.recommender.recommend(self.data_manager.get_movies_by_user(1))]
+        self.assertEqual(titles, ['Heat'])
+        titles = [title for title, score in self.recommender.recommend(['ALIEN'])]
+        self.assertEqual(titles, ['Aliens', 'Heat'])
+        self.assertEqual(self.recommender.recommend(['Unknown title']), [])
+
+    def test_rebuilt_index_is_picked_up(self):
+        """
+        Without an index there are no local recommendations; a rebuild is served without a restart.
+        """
+        self.assertIsNone(self.recommender.recommend(['Alien']))
+        build_item_index(self.data_manager, self.model_dir)
+        first = current_version(self.model_dir, 'items')
+        self.data_manager.add_movie('Ran', 'Akira Kurosawa', 1985, 9, 1)
+        build_item_index(self.data_manager, self.model_dir)
+        self.assertNotEqual(current_version(self.model_dir, 'items'), first)
+        self.assertIn('Ran', [title for title, score in self.recommender.recommend(['Aliens'])])
+
+    def test_library_changes_are_applied_incrementally(self):
+        """
+        Added, renamed and deleted movies are reflected without a rebuild, as a rebuild would score them.
+        """
+        build_item_index(self.data_manager, self.model_dir)
+        recommender = ItemRecommender(self.model_dir, check_interval=0, data_manager=self.data_manager,
+                                      changes_interval=3600)
+        self.assertEqual(recommender.recommend(['Ran']), [('Heat', 0.7071)])
+
+        self.data_manager.add_movie('Ran', 'Akira Kurosawa', 1985, 9, 1)
+        self.data_manager.add_movie('Brazil', 'Terry Gilliam', 1985, 8, 3)
+        movie_id = self.data_manager.get_movies_by_user(2)[-1].id
+        self.data_manager.update_movie(movie_id, 'Thief', 'Michael Mann', 1981, 7)
+        recommender.refresh()
+        incremental = dict(recommender.recommend(['Ran', 'Aliens']))
+        self.assertIn('Brazil', incremental)
+        self.assertIn('Thief', incremental)
+
+        build_item_index(self.data_manager, self.model_dir)
+        self.assertEqual(incremental, dict(self.recommender.recommend(['Ran', 'Aliens'])))
+
+        self.data_manager.delete_movie(movie_id)
+        recommender.refresh()
+        self.assertNotIn('Thief', dict(recommender.recommend(['Aliens'])))
+
+    def test_snapshots_are_not_changed_by_later_changes(self):
+        """
+        Titles added by apply_changes go into a new lookup, swapped in with the patch, so a
+        snapshot taken before still scores consistently.
+        """
+        build_item_index(self.data_manager, self.model_dir)
+        recommender = ItemRecommender(self.model_dir, check_interval=0, data_manager=self.data_manager,
+                                      changes_interval=3600)
+        recommender.refresh()
+        index = recommender.model.get()
+        titles, patch = index.snapshot()
+        count = len(titles.titles)
+        self.data_manager.add_movie('Brazil', 'Terry Gilliam', 1985, 8, 3)
+        recommender.refresh()
+
+        self.assertEqual(len(titles.titles), count)
+        self.assertIsNone(titles.item('Brazil'))
+        items, _ = titles.items(['Heat'])
+        self.assertEqual(len(index.scores(items, titles, patch)), count)
+        new_titles, new_patch = index.snapshot()
+        self.assertEqual((len(new_titles.titles), new_patch.shape[0]), (count + 1, count + 1))
+
+    def test_changes_are_applied_off_the_request_path(self):
+        """
+        A recommendation that finds changes due is answered from the index as it is, while a
+        background thread fetches and applies them.
+        """
+        build_item_index(self.data_manager, self.model_dir)
+        recommender = ItemRecommender(self.model_dir, check_interval=0, data_manager=self.data_manager,
+                                      changes_interval=0)
+        self.data_manager.add_movie('Ran', 'Akira Kurosawa', 1985, 9, 1)
+        fetching = threading.Event()
+        release = threading.Event()
+        get_library_changes = self.data_manager.get_library_changes
+
+        def slow_changes(*args):
+            fetching.set()
+            release.wait(5)
+            return get_library_changes(*args)
+
+        with mock.patch.object(self.data_manager, 'get_library_changes', side_effect=slow_changes):
+            self.assertEqual(recommender.recommend(['Ran']), [('Heat', 0.7071)])
+            self.assertTrue(fetching.wait(5))
+            self.assertEqual(recommender.recommend(['Ran']), [('Heat', 0.7071)])
+            release.set()
+            recommender.refresh()
+        self.assertIn('Aliens', dict(recommender.recommend(['Ran'])))
+
+if __name__ == '__main__':
+    unittest.main()
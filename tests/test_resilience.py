@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+import unittest
+
+from ai_cache import AICache
+from ai_features import AIFeatures, cache_key
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamUnavailable, call
+
+
+class ResilienceTestCase(unittest.TestCase):
+    """
+    Unit tests for circuit breaking, deadlines and stale fallbacks of upstream calls.
+    """
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.cache = AICache(self.db_file)
+
+    def tearDown(self):
+        self.cache.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_breaker_opens_after_failures_and_rejects_fast(self):
+        """
+        Once failures reach the threshold, calls are rejected without running until a trial call succeeds.
+        """
+        breaker = CircuitBreaker('openai', failure_threshold=2, reset_timeout=1.0)
+        calls = []
+
+        def failing(timeout):
+            calls.append(timeout)
+            raise ConnectionError('down')
+
+        with self.assertRaises(UpstreamUnavailable):
+            call(failing, breaker, time.monotonic() + 5, retries=3)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            call(failing, breaker, time.monotonic() + 5)
+        self.assertEqual(len(calls), 2)
+
+        time.sleep(1.0)
+        self.assertEqual(call(lambda timeout: 'ok', breaker, time.monotonic() + 5), 'ok')
+        self.assertEqual(breaker.stats()['state'], CircuitBreaker.CLOSED)
+
+    def test_stale_response_is_served_while_the_breaker_is_open(self):
+        """
+        An expired review is served instead of an error once OpenAI's circuit is open.
+        """
+        ai = AIFeatures(cache=self.cache)
+        self.cache.set(cache_key('review', 'Alien'), 'A classic.', ttl=-1)
+        self.assertIsNone(ai.cached('review', 'Alien'))
+        for _ in range(ai.breakers['openai'].failure_threshold):
+            ai.breakers['openai'].record_failure()
+
+        started = time.monotonic()
+        self.assertEqual(ai.generate_movie_review('Alien'), 'A classic.')
+        self.assertLess(time.monotonic() - started, 1)
+        with self.assertRaises(UpstreamUnavailable):
+            ai.get_movie_trivia('Alien')
+        ai.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import app as app_module
+from ai_cache import AICache
+from ai_features import AIFeatures, cache_key
+from data_manager import DataManager
+from jobs import QUEUED, JobQueue
+
+
+class RoutesTestCase(unittest.TestCase):
+    """
+    Tests of the Flask views, run against throwaway database files swapped in for the app's own.
+    """
+
+    def setUp(self):
+        """
+        Creates a user with two movies, an empty job queue and an AI client that must not call OpenAI.
+        """
+        self.files = []
+        self.data_manager = DataManager(self.temp_file())
+        self.data_manager.migrate()
+        self.data_manager.add_user('Alice')
+        for name, year in (('Alien', 1979), ('Heat', 1995)):
+            self.data_manager.add_movie(name, 'Someone', year, 8.0, 1)
+        self.job_queue = JobQueue(self.temp_file())
+        self.ai_cache = AICache(self.temp_file())
+        self.ai_features = AIFeatures(cache=self.ai_cache)
+        self.ai_features._chat = mock.Mock(side_effect=AssertionError('OpenAI called from a view'))
+
+        self.patches = [mock.patch.object(app_module, name, value) for name, value in (
+            ('data_manager', self.data_manager), ('job_queue', self.job_queue),
+            ('ai_cache', self.ai_cache), ('ai_features', self.ai_features), ('trailer_prefetcher', None))]
+        for patch in self.patches:
+            patch.start()
+        app_module.app.config['TESTING'] = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.ai_features.close()
+        self.ai_cache.close()
+        self.job_queue.close()
+        self.data_manager.close()
+        for db_file in self.files:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
+
+    def temp_file(self):
+        fd, db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.files.append(db_file)
+        return db_file
+
+    def test_uncached_recommendations_are_queued_for_the_worker(self):
+        """
+        A cache miss queues one recommendations job, whose stream the page follows, instead of
+        calling OpenAI; once the worker has cached the text, the page shows it directly.
+        """
+        response = self.client.get('/recommendations/1?backend=openai')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/recommendations/1/stream', response.data)
+        job = self.job_queue.get(1)
+        self.assertEqual((job['kind'], job['payload'], job['status']), ('recommendations', {'user_id': 1}, QUEUED))
+
+        self.client.get('/recommendations/1?backend=openai')
+        self.assertEqual(self.job_queue.counts(), {QUEUED: 1})
+
+        self.ai_cache.set(cache_key('recommendations', ['Alien', 'Heat']), 'Watch Thief.')
+        response = self.client.get('/recommendations/1?backend=openai')
+        self.assertIn(b'Watch Thief.', response.data)
+        self.assertNotIn(b'/stream', response.data)
+        self.ai_features._chat.assert_not_called()
+
+    def test_recommendations_stream_follows_the_job(self):
+        """
+        The stream sends the text the worker has reported so far, then its result and `done`,
+        without calling OpenAI from the view.
+        """
+        app_module.app.config['JOB_STREAM_TIMEOUT'] = 0
+        self.addCleanup(app_module.app.config.__setitem__, 'JOB_STREAM_TIMEOUT', 30)
+
+        response = self.client.get('/recommendations/1/stream')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.data, b'')
+        job = self.job_queue.claim('w1')
+        self.job_queue.report_progress(job, 'w1', 'Watch')
+        self.assertEqual(self.client.get('/recommendations/1/stream').data,
+                         b'data: {"text": "Watch"}\n\n')
+
+        app_module.app.config['JOB_STREAM_TIMEOUT'] = 5
+        finish = threading.Timer(0.3, self.job_queue.complete, (job, 'w1', 'Watch Thief.'))
+        finish.start()
+        self.addCleanup(finish.join)
+        self.assertEqual(self.client.get('/recommendations/1/stream').data,
+                         b'data: {"text": "Watch"}\n\ndata: {"text": "Watch Thief."}\n\nevent: done\ndata: {}\n\n')
+        self.assertEqual(self.job_queue.counts(), {'done': 1})
+        self.ai_features._chat.assert_not_called()
+
+        self.ai_cache.set(cache_key('recommendations', ['Alien', 'Heat']), 'Watch Thief.')
+        self.assertEqual(self.client.get('/recommendations/1/stream').data,
+                         b'data: {"text": "Watch Thief."}\n\nevent: done\ndata: {}\n\n')
+
+    def test_user_page_prefetches_only_its_own_trailers(self):
+        """
+        The trailers of the movies on the page, and no others, are embedded if cached or else prefetched.
+        """
+        self.ai_cache.set(cache_key('trailer', 'Alien'), 'https://www.youtube.com/watch?v=abc123')
+        self.data_manager.add_movie('Thief', 'Someone', 1981, 7.5, 1)
+        prefetcher = mock.Mock()
+        with mock.patch.object(app_module, 'trailer_prefetcher', prefetcher):
+            response = self.client.get('/user/1?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'https://www.youtube.com/embed/abc123', response.data)
+        prefetcher.prefetch.assert_called_once_with(['Heat'])
+
+    def test_library_export_as_ndjson_and_csv(self):
+        """
+        The export streams one movie per line in either format, and rejects unknown users and formats.
+        """
+        response = self.client.get('/user/1/movies/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertIn('user_1_movies.ndjson', response.headers['Content-Disposition'])
+        self.assertEqual([json.loads(line) for line in response.data.decode().splitlines()], [
+            {'id': 1, 'name': 'Alien', 'director': 'Someone', 'year': 1979, 'rating': 8.0},
+            {'id': 2, 'name': 'Heat', 'director': 'Someone', 'year': 1995, 'rating': 8.0},
+        ])
+
+        response = self.client.get('/user/1/movies/export?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(list(csv.reader(io.StringIO(response.data.decode()))), [
+            ['id', 'name', 'director', 'year', 'rating'],
+            ['1', 'Alien', 'Someone', '1979', '8.0'],
+            ['2', 'Heat', 'Someone', '1995', '8.0'],
+        ])
+
+        self.assertEqual(self.client.get('/user/2/movies/export').status_code, 404)
+        self.assertEqual(self.client.get('/user/1/movies/export?format=xml').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
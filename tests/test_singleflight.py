@@ -0,0 +1,207 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from ai_cache import AICache
+from resilience import UpstreamUnavailable
+from singleflight import SingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    """
+    Unit tests for coalescing concurrent identical AI calls.
+    """
+
+    def setUp(self):
+        """
+        Creates two caches over one SQLite file, standing in for two gunicorn workers.
+        """
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.caches = [AICache(self.db_file), AICache(self.db_file)]
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def run_concurrently(self, calls):
+        results = [None] * len(calls)
+
+        def run(i):
+            results[i] = calls[i]()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_in_one_worker_share_one_upstream_call(self):
+        """
+        Threads asking for the same key at once trigger a single call and share its result.
+        """
+        flight = SingleFlight(self.caches[0])
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'Watch Alien.'
+
+        results = self.run_concurrently([lambda: flight.do('k', upstream)] * 8)
+        self.assertEqual(results, ['Watch Alien.'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrent_calls_across_workers_share_one_upstream_call(self):
+        """
+        A second worker waits on the first worker's lease and reads its result from the cache.
+        """
+        flights = [SingleFlight(cache, poll_interval=0.01) for cache in self.caches]
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'Watch Alien.'
+
+        results = self.run_concurrently([lambda: flights[0].do('k', upstream),
+                                         lambda: (time.sleep(0.05), flights[1].do('k', upstream))[1]])
+        self.assertEqual(results, ['Watch Alien.'] * 2)
+        self.assertEqual(len(calls), 1)
+
+    def test_streamed_text_is_shared_and_cached(self):
+        """
+        The streaming caller gets chunks as they arrive; a concurrent caller gets the whole text.
+        """
+        flight = SingleFlight(self.caches[0])
+        started = threading.Event()
+
+        def upstream():
+            started.set()
+            for chunk in ['Watch ', 'Alien', '.']:
+                time.sleep(0.05)
+                yield chunk
+
+        def stream():
+            return list(flight.stream('k', upstream))
+
+        def wait():
+            started.wait()
+            return flight.do('k', lambda: 'called twice')
+
+        self.assertEqual(self.run_concurrently([stream, wait]), [['Watch ', 'Alien', '.'], 'Watch Alien.'])
+        self.assertEqual(self.caches[1].get('k'), 'Watch Alien.')
+        self.assertEqual(list(flight.stream('k', upstream)), ['Watch Alien.'])
+
+    def test_errors_reach_every_waiter(self):
+        """
+        If the upstream call fails, every coalesced caller sees the error and nothing is cached.
+        """
+        flight = SingleFlight(self.caches[0])
+
+        def upstream():
+            time.sleep(0.05)
+            raise RuntimeError('upstream failed')
+
+        def call():
+            try:
+                return flight.do('k', upstream)
+            except RuntimeError as e:
+                return str(e)
+
+        self.assertEqual(self.run_concurrently([call] * 3), ['upstream failed'] * 3)
+        self.assertIsNone(self.caches[0].get('k'))
+        self.assertFalse(self.caches[0].lease_active('k'))
+
+    def test_waiters_give_up_at_their_deadline(self):
+        """
+        Callers waiting on a slow call in this worker or in another one raise UpstreamUnavailable
+        at their deadline, while the call itself runs on and caches its result.
+        """
+        flights = [SingleFlight(cache, poll_interval=0.01) for cache in self.caches]
+        started = threading.Event()
+
+        def upstream():
+            started.set()
+            time.sleep(0.5)
+            return 'Watch Alien.'
+
+        def wait(flight):
+            started.wait()
+            began = time.monotonic()
+            try:
+                return flight.do('k', upstream, deadline=time.monotonic() + 0.1)
+            except UpstreamUnavailable:
+                return time.monotonic() - began
+
+        leader, same_worker, other_worker = self.run_concurrently(
+            [lambda: flights[0].do('k', upstream), lambda: wait(flights[0]), lambda: wait(flights[1])])
+        self.assertEqual(leader, 'Watch Alien.')
+        self.assertLess(same_worker, 0.3)
+        self.assertLess(other_worker, 0.3)
+        self.assertEqual(self.caches[1].get('k'), 'Watch Alien.')
+
+    def test_stream_is_not_started_past_its_deadline(self):
+        """
+        A streaming caller whose deadline has passed raises UpstreamUnavailable instead of calling upstream.
+        """
+        flight = SingleFlight(self.caches[0])
+        upstream = mock.Mock(return_value=iter(['Watch Alien.']))
+        with self.assertRaises(UpstreamUnavailable):
+            list(flight.stream('k', upstream, deadline=time.monotonic() - 1))
+        upstream.assert_not_called()
+        self.assertFalse(self.caches[0].lease_active('k'))
+
+    def test_coroutines_use_the_cache_off_the_event_loop(self):
+        """
+        The async path reads and writes the SQLite cache and its leases in threads, not on the loop.
+        """
+        flight = SingleFlight(self.caches[0])
+        cache_threads = set()
+        for name in ('get', 'set', 'acquire_lease', 'lease_active', 'release_lease'):
+            method = getattr(self.caches[0], name)
+            setattr(self.caches[0], name, lambda *args, method=method, **kwargs: (
+                cache_threads.add(threading.current_thread()), method(*args, **kwargs))[1])
+
+        async def upstream():
+            return 'Watch Alien.'
+
+        async def main():
+            return await flight.do_async('k', upstream), threading.current_thread()
+
+        result, loop_thread = asyncio.run(main())
+        self.assertEqual(result, 'Watch Alien.')
+        self.assertTrue(cache_threads)
+        self.assertNotIn(loop_thread, cache_threads)
+        self.assertEqual(self.caches[1].get('k'), 'Watch Alien.')
+
+    def test_concurrent_coroutines_share_one_upstream_call(self):
+        """
+        Coroutines awaiting the same key at once trigger a single call and share its result.
+        """
+        flight = SingleFlight(self.caches[0])
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'Watch Alien.'
+
+        async def main():
+            return await asyncio.gather(*[flight.do_async('k', upstream) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(main()), ['Watch Alien.'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.caches[1].get('k'), 'Watch Alien.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import httpx
+
+from ai_cache import AICache
+from ai_features import AsyncAIFeatures, cache_key
+from rate_limit import DailyQuota
+from trailer_prefetch import TrailerPrefetcher
+
+
+class TrailerPrefetcherTestCase(unittest.TestCase):
+    """
+    Unit tests for resolving a library's trailers in the background within the YouTube quota.
+    """
+
+    def setUp(self):
+        fd, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.cache = AICache(self.db_file)
+        # 500 units are five searches, of which background calls may spend three
+        self.quota = DailyQuota(self.db_file, units_per_day=500, background_share=0.6)
+        self.ai = AsyncAIFeatures(cache=self.cache, youtube_quota=self.quota)
+        self.searches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def handler(request):
+            self.searches.append(request.url.params['q'])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            return httpx.Response(200, json={'items': [{'id': {'videoId': f'v{len(self.searches)}'}}]})
+
+        self.ai.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def tearDown(self):
+        self.ai.close()
+        self.quota.close()
+        self.cache.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_prefetch_is_bounded_by_concurrency_and_quota(self):
+        """
+        Only uncached titles are searched, two at a time, until the background share of the quota
+        is spent; the rest of the quota still serves interactive lookups.
+        """
+        self.cache.set(cache_key('trailer', 'Alien'), 'https://www.youtube.com/watch?v=cached')
+        prefetcher = TrailerPrefetcher(self.ai, max_concurrency=2)
+        titles = ['Alien', 'Heat', 'Thief', 'Ran', 'Jaws', 'Brazil']
+
+        self.assertEqual(prefetcher.prefetch(titles).result(5), 3)
+        self.assertEqual(len(self.searches), 3)
+        self.assertNotIn('Alien trailer', self.searches)
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertEqual(prefetcher.stats()['stopped'], 1)
+        self.assertEqual(self.quota.stats()['used'], 300)
+
+        # With the background share spent, the cache is not even looked at
+        with mock.patch.object(self.cache, 'get_many') as get_many:
+            self.assertEqual(prefetcher.prefetch(titles).result(5), 0)
+        get_many.assert_not_called()
+        self.assertEqual(len(self.searches), 3)
+        unresolved = [title for title in titles if self.cache.get(cache_key('trailer', title)) is None]
+        self.assertEqual(len(unresolved), 2)
+        trailer, = self.ai.run(self.ai.get_movie_trailer(unresolved[0]))
+        self.assertTrue(trailer.startswith('https://www.youtube.com/watch?v='))
+
+    def test_prefetch_looks_at_a_bounded_number_of_titles(self):
+        """
+        Only the first `max_titles` titles given are resolved.
+        """
+        prefetcher = TrailerPrefetcher(self.ai, max_concurrency=2, max_titles=2)
+        self.assertEqual(prefetcher.prefetch(['Heat', 'Thief', 'Ran', 'Jaws']).result(5), 2)
+        self.assertEqual(sorted(self.searches), ['Heat trailer', 'Thief trailer'])
+
+    def test_searches_touch_sqlite_off_the_event_loop(self):
+        """
+        Cache lookups and quota spending for each search run in threads, not on the shared loop.
+        """
+        threads = []
+        for obj, name in ((self.cache, 'get'), (self.cache, 'get_many'), (self.quota, 'spend')):
+            method = getattr(obj, name)
+            setattr(obj, name, lambda *args, method=method, **kwargs: (
+                threads.append(threading.current_thread().name), method(*args, **kwargs))[1])
+
+        prefetcher = TrailerPrefetcher(self.ai, max_concurrency=2)
+        self.assertEqual(prefetcher.prefetch(['Heat', 'Thief']).result(5), 2)
+        self.assertTrue(threads)
+        self.assertNotIn('ai-event-loop', threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import threading
+
+from ai_features import YOUTUBE_SEARCH_COST, cache_key
+from rate_limit import BACKGROUND, priority
+from resilience import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class TrailerPrefetcher:
+    """
+    Resolves the trailers of a user's movies in the background, so that pages can embed them
+    instead of each link searching YouTube when it is clicked.
+
+    Searches run on the async AI client's event loop, at most `max_concurrency` at a time across
+    every prefetch in the process. They run at BACKGROUND priority, so they only spend the share
+    of the YouTube quota left to background calls (see rate_limit.DailyQuota); a prefetch stops
+    at the first search refused for quota or by the YouTube circuit breaker, and is skipped
+    altogether once that share is spent. Its cache and quota lookups, and those of each search
+    (see AsyncAIFeatures), run in threads, so that the loop stays free for other requests.
+    """
+
+    def __init__(self, async_ai, max_concurrency=4, max_titles=50):
+        """
+        Parameters:
+            async_ai (AsyncAIFeatures): The client doing the searches; it must have a cache.
+            max_concurrency (int): Most searches in flight at once.
+            max_titles (int): Most titles looked at per prefetch; the rest are ignored.
+        """
+        self.async_ai = async_ai
+        self.max_concurrency = max_concurrency
+        self.max_titles = max_titles
+        self.resolved = 0
+        self.stopped = 0
+        # Loop-bound state, only touched on the loop's thread and recreated for a new loop after a fork
+        self._loop = None
+        self._semaphore = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def prefetch(self, movie_names):
+        """
+        Starts resolving the trailers of those movies whose trailer is not cached, and returns at once.
+
+        Parameters:
+            movie_names (list): Titles in the order they should be resolved, e.g. the visible page;
+                only the first `max_titles` are looked at.
+
+        Returns:
+            concurrent.futures.Future: Completes with the number of trailers resolved.
+        """
+        return self.async_ai.loop.submit(self._prefetch(list(movie_names)[:self.max_titles]))
+
+    async def _prefetch(self, movie_names):
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._pending = set()
+        # Titles already cached or being resolved by an earlier prefetch are skipped
+        uncached = await asyncio.to_thread(self._uncached, movie_names)
+        missing = {key: name for key, name in uncached.items() if key not in self._pending}
+        if not missing:
+            return 0
+        self._pending.update(missing)
+        stop = asyncio.Event()
+        with priority(BACKGROUND):
+            # Tasks copy the current context, so every search runs at BACKGROUND priority
+            tasks = [asyncio.ensure_future(self._resolve(key, name, stop)) for key, name in missing.items()]
+        resolved = sum(await asyncio.gather(*tasks))
+        with self._lock:
+            self.resolved += resolved
+        return resolved
+
+    def _uncached(self, movie_names):
+        """
+        Returns the titles, by cache key, whose trailer is not cached; none if background calls
+        have spent their share of the YouTube quota.
+        """
+        quota = self.async_ai.youtube_quota
+        with priority(BACKGROUND):
+            if quota is not None and not quota.available(YOUTUBE_SEARCH_COST):
+                return {}
+        keys = {}
+        for name in movie_names:
+            keys.setdefault(cache_key('trailer', name), name)
+        cached = self.async_ai.cache.get_many(keys)
+        return {key: name for key, name in keys.items() if key not in cached}
+
+    async def _resolve(self, key, name, stop):
+        try:
+            async with self._semaphore:
+                if stop.is_set():
+                    return 0
+                await self.async_ai.get_movie_trailer(name)
+                return 1
+        except UpstreamUnavailable as e:
+            if not stop.is_set():
+                stop.set()
+                with self._lock:
+                    self.stopped += 1
+                logger.info(f"Stopped prefetching trailers: {e}")
+            return 0
+        except Exception as e:
+            logger.warning(f"Error prefetching the trailer of {name}: {e}")
+            return 0
+        finally:
+            self._pending.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {'max_concurrency': self.max_concurrency, 'resolved': self.resolved, 'stopped': self.stopped}